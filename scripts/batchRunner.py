@@ -0,0 +1,266 @@
+# COMP6841 - Steganography Project Batch Runner File
+#
+# Fans encode or decode jobs out over a process pool. Jobs come from a JSON
+# Lines manifest or from a directory of images, and one JSON result line is
+# appended to the log as each job completes.
+#
+# Usage:
+#   python -m scripts.batchRunner encode --covers DIR --payload FILE --key K --output DIR
+#   python -m scripts.batchRunner decode --stegos DIR --key K --output DIR
+#   python -m scripts.batchRunner encode --manifest jobs.jsonl --log results.jsonl
+#   python -m scripts.batchRunner decode --stegos DIR --key K --output DIR --trace trace.jsonl
+#
+# Encode manifest lines hold "cover", "key", "output" and either "payload"
+# (a file path) or "text", plus an optional "lsbCount" and "pngProfile".
+# Decode lines hold "stego", "key" and "output" (a directory for the
+# recovered payload). Either may set "inPlace" to embed into or read from
+# uncompressed BMP/TIFF files through a memory map. With --trace, every
+# worker records per-stage timings and appends one JSON trace per job to the
+# trace file.
+
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from .formats import copyMetadata, supportedExtensions
+from .instrumentation import enableInstrumentation
+from .mappedImages import decodeInPlace, encodeInPlace
+from .pngStreams import DEFAULTPROFILE, PNGPROFILES
+from .stegoEngine import TEXTPAYLOAD, decode, encode
+
+ENCODEMODE = "encode"
+DECODEMODE = "decode"
+
+IMAGEEXTS = supportedExtensions()
+TEXTOUTPUTEXT = ".txt"
+
+DEFAULTLOG = "batch_results.jsonl"
+
+
+def runEncodeJob(job):
+    # Given an encode job, embeds its payload into the cover and writes the
+    # stego image, preserving the cover's file metadata
+
+    if "text" in job:
+        payload, name = job["text"], None
+    else:
+        with open(job["payload"], "rb") as f:
+            payload = f.read()
+        name = os.path.basename(job["payload"])
+
+    if job.get("inPlace"):
+        report = encodeInPlace(
+            job["cover"],
+            payload,
+            job["key"],
+            job["output"],
+            name,
+            lsbCount=job.get("lsbCount", 1),
+        )
+        return {"output": job["output"], "bytesWritten": report.bytesWritten}
+
+    encode(
+        job["cover"],
+        payload,
+        job["key"],
+        name=name,
+        outputPath=job["output"],
+        lsbCount=job.get("lsbCount", 1),
+        pngProfile=job.get("pngProfile", DEFAULTPROFILE),
+    )
+    copyMetadata(job["cover"], job["output"])
+    return {"output": job["output"]}
+
+
+def runDecodeJob(job):
+    # Given a decode job, recovers the payload from the stego image and writes
+    # it into the job's output directory
+
+    if job.get("inPlace"):
+        payload = decodeInPlace(job["stego"], job["key"])
+    else:
+        payload = decode(job["stego"], job["key"])
+    if payload is None:
+        raise ValueError("No information could be found")
+
+    os.makedirs(job["output"], exist_ok=True)
+    stem = os.path.splitext(os.path.basename(job["stego"]))[0]
+    if payload.kind == TEXTPAYLOAD:
+        name = stem + TEXTOUTPUTEXT
+    else:
+        name = f"{stem}_{os.path.basename(payload.name)}"
+
+    outputPath = os.path.join(job["output"], name)
+    with open(outputPath, "wb") as f:
+        f.write(payload.data)
+    return {"output": outputPath, "kind": payload.kind, "bytes": len(payload.data)}
+
+
+def runJob(mode, job):
+    # Given a mode and job, runs it and returns a result record. Failures are
+    # recorded rather than raised so one bad file never stops the batch
+
+    start = time.perf_counter()
+    # The fingerprint is left out so the log never holds keys in plain text
+    logged = {name: value for name, value in job.items() if name != "key"}
+    result = {"job": logged, "status": "ok"}
+    try:
+        if mode == ENCODEMODE:
+            result.update(runEncodeJob(job))
+        else:
+            result.update(runDecodeJob(job))
+    except Exception as error:
+        result["status"] = "error"
+        result["error"] = f"{type(error).__name__}: {error}"
+
+    result["seconds"] = round(time.perf_counter() - start, 4)
+    return result
+
+
+def loadManifest(path):
+    # Given a JSON Lines manifest path, returns its jobs
+
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def listImages(directory):
+    # Given a directory, returns the sorted paths of the images inside it
+
+    return sorted(
+        os.path.join(directory, name)
+        for name in os.listdir(directory)
+        if name.lower().endswith(IMAGEEXTS)
+    )
+
+
+def imagePaths(sources):
+    # Given image files and directories, returns every image path, listing
+    # directories in sorted order
+
+    paths = []
+    for source in sources:
+        if os.path.isdir(source):
+            paths.extend(listImages(source))
+        else:
+            paths.append(source)
+    return paths
+
+
+def directoryJobs(mode, args):
+    # Given parsed arguments in directory mode, builds one job per image
+
+    jobs = []
+    if mode == ENCODEMODE:
+        os.makedirs(args.output, exist_ok=True)
+        for cover in listImages(args.covers):
+            job = {"cover": cover, "key": args.key}
+            job["output"] = os.path.join(args.output, os.path.basename(cover))
+            if args.payload is not None:
+                job["payload"] = args.payload
+            else:
+                job["text"] = args.text
+            job["lsbCount"] = args.lsb
+            job["pngProfile"] = args.png_profile
+            job["inPlace"] = args.in_place
+            jobs.append(job)
+    else:
+        for stego in listImages(args.stegos):
+            job = {"stego": stego, "key": args.key, "output": args.output}
+            job["inPlace"] = args.in_place
+            jobs.append(job)
+    return jobs
+
+
+def runBatch(mode, jobs, workers=None, logPath=DEFAULTLOG, tracePath=None):
+    # Given a mode, jobs and a worker count, runs the jobs on a process pool,
+    # appending each result to logPath as it completes. When tracePath is
+    # given, workers also append a stage trace per job there. Returns a summary
+
+    start = time.perf_counter()
+    succeeded = 0
+
+    initializer, initargs = None, ()
+    if tracePath is not None:
+        initializer, initargs = enableInstrumentation, (None, None, tracePath)
+
+    pool = ProcessPoolExecutor(workers, initializer=initializer, initargs=initargs)
+    with open(logPath, "a") as log, pool:
+        futures = [pool.submit(runJob, mode, job) for job in jobs]
+        for future in as_completed(futures):
+            result = future.result()
+            succeeded += result["status"] == "ok"
+            log.write(json.dumps(result) + "\n")
+            log.flush()
+
+    elapsed = time.perf_counter() - start
+    return {
+        "mode": mode,
+        "jobs": len(jobs),
+        "succeeded": succeeded,
+        "failed": len(jobs) - succeeded,
+        "seconds": round(elapsed, 3),
+        "jobsPerSecond": round(len(jobs) / elapsed, 2) if elapsed else None,
+    }
+
+
+def parseArguments(argv):
+    parser = argparse.ArgumentParser(description="Batch encode or decode images.")
+    parser.add_argument("mode", choices=[ENCODEMODE, DECODEMODE])
+    parser.add_argument("--manifest", help="JSON Lines file with one job per line")
+    parser.add_argument("--covers", help="directory of cover images (encode)")
+    parser.add_argument("--stegos", help="directory of stego images (decode)")
+    parser.add_argument("--payload", help="file to embed in every cover")
+    parser.add_argument("--text", help="text to embed in every cover")
+    parser.add_argument(
+        "--lsb",
+        type=int,
+        default=1,
+        choices=range(1, 5),
+        help="low bits written per channel",
+    )
+    parser.add_argument(
+        "--png-profile",
+        default=DEFAULTPROFILE,
+        choices=PNGPROFILES,
+        help="PNG output profile for encoded images",
+    )
+    parser.add_argument(
+        "--in-place",
+        action="store_true",
+        help="embed into and read from uncompressed BMP/TIFF files in place",
+    )
+    parser.add_argument("--key", help="fingerprint for directory mode")
+    parser.add_argument("--output", help="output directory for directory mode")
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--log", default=DEFAULTLOG, help="JSON Lines result log")
+    parser.add_argument("--trace", help="JSON Lines file for per-stage job traces")
+    args = parser.parse_args(argv)
+
+    if args.manifest is None:
+        source = args.covers if args.mode == ENCODEMODE else args.stegos
+        if source is None or args.key is None or args.output is None:
+            parser.error("directory mode needs a source directory, --key and --output")
+        if args.mode == ENCODEMODE and (args.payload is None) == (args.text is None):
+            parser.error("encode needs exactly one of --payload or --text")
+
+    return args
+
+
+def main(argv=None):
+    args = parseArguments(argv)
+    if args.manifest is not None:
+        jobs = loadManifest(args.manifest)
+    else:
+        jobs = directoryJobs(args.mode, args)
+
+    summary = runBatch(args.mode, jobs, args.workers, args.log, args.trace)
+    print(json.dumps(summary))
+    return 0 if summary["failed"] == 0 else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,523 @@
+# COMP6841 - Steganography Project Benchmark File
+#
+# Times every stage of encode and decode across cover sizes and payload
+# sizes, recording wall time, CPU time and tracemalloc peak per stage, and
+# writes the results as JSON so runs can be compared across commits.
+#
+# Usage:
+#   python -m scripts.benchmark --output bench.json
+#   python -m scripts.benchmark --sizes 256 1024 --fractions 0.1 1.0 --repeat 5
+#   python -m scripts.benchmark --sizes 4096 --png-profile fast --compare-png
+#   python -m scripts.benchmark --sizes 2048 --fractions 0.1 --compare-formats
+#
+# Covers are synthesised by resizing a bundled Sample Image to each size and
+# payloads are built from the bundled Sample Files, topped up with seeded
+# random bytes once the fixtures run out. Everything runs offline.
+
+import argparse
+import io
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+
+import numpy as np
+import PIL
+from PIL import Image
+
+from .formats import formatRegistry, readImage, writeImage
+from .heuristics import computeHeuristics
+from .helpers import (
+    BYTETOBIT,
+    CODECMASK,
+    CODECS,
+    CODECSHIFT,
+    CONTAINEROVERHEAD,
+    FLAGRAWPAYLOAD,
+    RGBCHANNELS,
+    buildContainer,
+    clearKeyCache,
+    compressPayload,
+    coverLimit,
+    decompressPayload,
+    decryptBytes,
+    deriveSessionKey,
+    embedLSBBits,
+    encryptBytes,
+    flagsLSBCount,
+    generateSecureSample,
+    loadChannels,
+    lsbFlags,
+    openImage,
+    planeLimit,
+    positionsFor,
+    preserveMetadata,
+    readContainerHeader,
+    readLSBRange,
+)
+from .instrumentation import disableInstrumentation, enableInstrumentation, measure
+from .pngStreams import DEFAULTPROFILE, PNGPROFILES, writePNG
+from .stegoEngine import buildMessage
+
+ROOTDIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SAMPLEIMAGES = os.path.join(ROOTDIR, "Sample Images")
+SAMPLEFILES = os.path.join(ROOTDIR, "Sample Files")
+
+DEFAULTCOVER = "drawing.png"
+DEFAULTSIZES = [256, 1024, 4096, 8000]
+DEFAULTFRACTIONS = [0.01, 0.1, 0.5, 1.0]
+MINPAYLOAD = 1000
+
+DEFAULTKEY = "benchmark"
+PAYLOADSEED = 6841
+
+
+@contextmanager
+def timeStage(stages, name):
+    # Times the enclosed block and records its wall time, CPU time and
+    # tracemalloc peak under 'name' in stages
+
+    with measure() as result:
+        yield
+    stages[name] = result
+
+
+def syntheticCover(source, size):
+    # Given a fixture image and a side length, returns a square RGB cover of
+    # that size resized from the fixture so it keeps natural image statistics
+
+    return openImage(source).convert("RGB").resize((size, size), Image.BILINEAR)
+
+
+def fixturePayload(length, directory=SAMPLEFILES):
+    # Given a length, returns that many bytes taken from the sample files in
+    # name order, topped up with seeded random bytes
+
+    data = bytearray()
+    for name in sorted(os.listdir(directory)):
+        if len(data) >= length:
+            break
+        with open(os.path.join(directory, name), "rb") as f:
+            data += f.read(length - len(data))
+
+    filler = length - len(data)
+    data += np.random.default_rng(PAYLOADSEED).bytes(filler)
+    return bytes(data)
+
+
+def payloadSizes(capacity, fractions):
+    # Given a cover's message capacity in bytes and fractions of it, returns
+    # the distinct payload sizes to run, starting from MINPAYLOAD
+
+    sizes = {MINPAYLOAD} | {int(capacity * fraction) for fraction in fractions}
+    return sorted(size for size in sizes if MINPAYLOAD <= size <= capacity)
+
+
+def benchmarkEncode(
+    coverPath, message, key, workdir, lsbCount=1, pngProfile=DEFAULTPROFILE
+):
+    # Given a cover PNG path and a message, runs every encode stage in turn
+    # and returns (stages, stego PNG bytes, stored message size, codec)
+
+    stages = {}
+
+    with timeStage(stages, "cover decode"):
+        im = Image.open(coverPath)
+        im.load()
+
+    with timeStage(stages, "heuristics"):
+        computeHeuristics(im)
+
+    with timeStage(stages, "kdf"):
+        clearKeyCache()
+        session = deriveSessionKey(key)
+
+    with timeStage(stages, "compress"):
+        codec, stored = compressPayload(message)
+
+    with timeStage(stages, "encrypt"):
+        encrypted = encryptBytes(session.aesKey, stored)
+
+    with timeStage(stages, "bit packing"):
+        flags = FLAGRAWPAYLOAD | codec << CODECSHIFT | lsbFlags(lsbCount)
+        container = buildContainer(session.hash, encrypted, flags)
+        bits = np.unpackbits(np.frombuffer(container, dtype=np.uint8))
+
+    encodeLimit = coverLimit(im)
+    with timeStage(stages, "permutation"):
+        positions = positionsFor(len(bits), lsbCount)
+        mapping = generateSecureSample(key, encodeLimit, positions)
+
+    with timeStage(stages, "embed"):
+        stego = embedLSBBits(im, mapping, bits, lsbCount)
+
+    stegoPath = os.path.join(workdir, "stego.png")
+    with timeStage(stages, "png encode"):
+        buffer = io.BytesIO()
+        writePNG(stego, buffer, pngProfile)
+        stegoBytes = buffer.getvalue()
+
+    with open(stegoPath, "wb") as f:
+        f.write(stegoBytes)
+    with timeStage(stages, "metadata copy"):
+        preserveMetadata(coverPath, stegoPath)
+
+    return stages, stegoBytes, len(stored), codec
+
+
+def benchmarkDecode(stegoBytes, key):
+    # Given stego PNG bytes, runs every decode stage in turn and returns
+    # (stages, decrypted message)
+
+    stages = {}
+
+    with timeStage(stages, "image decode"):
+        plane = loadChannels(stegoBytes)
+
+    with timeStage(stages, "kdf"):
+        clearKeyCache()
+        session = deriveSessionKey(key)
+
+    with timeStage(stages, "header"):
+        header, prefixBits, plane = readContainerHeader(plane, key)
+
+    version, flags, length = header
+    lsbCount = flagsLSBCount(flags)
+    totalBits = prefixBits + length * BYTETOBIT
+    encodeLimit = planeLimit(plane)
+    with timeStage(stages, "permutation"):
+        positions = positionsFor(totalBits, lsbCount)
+        mapping = generateSecureSample(key, encodeLimit, positions)
+
+    with timeStage(stages, "extract"):
+        payload = readLSBRange(plane, mapping, prefixBits, totalBits, lsbCount)
+
+    with timeStage(stages, "decrypt"):
+        stored = decryptBytes(session, payload)
+
+    with timeStage(stages, "decompress"):
+        message = decompressPayload((flags & CODECMASK) >> CODECSHIFT, stored)
+
+    return stages, message
+
+
+def comparePNGProfiles(stegoBytes):
+    # Given stego PNG bytes, re-encodes the image with every PNG profile and
+    # returns each profile's encode time and output size
+
+    im = Image.open(io.BytesIO(stegoBytes))
+    im.load()
+
+    profiles = {}
+    for name in PNGPROFILES:
+        report = writePNG(im, io.BytesIO(), name)
+        profiles[name] = {"seconds": round(report.seconds, 6), "bytes": report.size}
+    return profiles
+
+
+def compareFormats(stegoBytes):
+    # Given stego PNG bytes, writes the image in every registered format that
+    # can hold its mode and reads it back, returning each format's write and
+    # read time, size and whether the pixels survived exactly
+
+    im = Image.open(io.BytesIO(stegoBytes))
+    im.load()
+    pixels = np.asarray(im)
+
+    formats = {}
+    for name, adapter in formatRegistry.items():
+        if im.mode not in adapter.modes:
+            continue
+
+        buffer = io.BytesIO()
+        report = writeImage(im, buffer, name)
+        start = time.perf_counter()
+        restored = readImage(buffer.getvalue())
+        restored.load()
+        readSeconds = time.perf_counter() - start
+
+        formats[name] = {
+            "writeSeconds": round(report.seconds, 6),
+            "readSeconds": round(readSeconds, 6),
+            "roundTripSeconds": round(report.seconds + readSeconds, 6),
+            "bytes": report.size,
+            "exact": bool(np.array_equal(np.asarray(restored), pixels)),
+        }
+    return formats
+
+
+def mergeRuns(runs):
+    # Given the stage records of repeated runs, keeps the fastest time and the
+    # largest memory peak seen for each stage
+
+    merged = {}
+    for name in runs[0]:
+        records = [run[name] for run in runs]
+        merged[name] = {
+            "seconds": round(min(r["seconds"] for r in records), 6),
+            "cpuSeconds": round(min(r["cpuSeconds"] for r in records), 6),
+            "peakBytes": max(r["peakBytes"] for r in records),
+        }
+    return merged
+
+
+def runCase(
+    cover,
+    coverPath,
+    payloadLength,
+    key,
+    repeat,
+    workdir,
+    lsbCount=1,
+    pngProfile=DEFAULTPROFILE,
+    compareProfiles=False,
+    compareImageFormats=False,
+):
+    # Given a cover and payload length, benchmarks encode and decode 'repeat'
+    # times and returns the result record. With compareProfiles, the record
+    # also holds the time and size of the stego PNG under every profile, and
+    # with compareImageFormats, the round trip through every image format
+
+    message = buildMessage(fixturePayload(payloadLength), "payload.bin")
+
+    encodeRuns, decodeRuns = [], []
+    for _ in range(repeat):
+        stages, stegoBytes, storedSize, codec = benchmarkEncode(
+            coverPath, message, key, workdir, lsbCount, pngProfile
+        )
+        encodeRuns.append(stages)
+
+        stages, decoded = benchmarkDecode(stegoBytes, key)
+        decodeRuns.append(stages)
+        if decoded != message:
+            raise RuntimeError(f"Round trip failed for {payloadLength} bytes")
+
+    encodeStages, decodeStages = mergeRuns(encodeRuns), mergeRuns(decodeRuns)
+    width, height = cover.size
+    result = {
+        "width": width,
+        "height": height,
+        "payloadBytes": payloadLength,
+        "lsbCount": lsbCount,
+        "storedBytes": storedSize,
+        "codec": CODECS[codec][0] if codec in CODECS else None,
+        "embeddedBits": (storedSize + CONTAINEROVERHEAD) * BYTETOBIT,
+        "stegoBytes": len(stegoBytes),
+        "encode": {
+            "seconds": round(sum(s["seconds"] for s in encodeStages.values()), 6),
+            "stages": encodeStages,
+        },
+        "decode": {
+            "seconds": round(sum(s["seconds"] for s in decodeStages.values()), 6),
+            "stages": decodeStages,
+        },
+    }
+    if compareProfiles:
+        result["pngProfiles"] = comparePNGProfiles(stegoBytes)
+    if compareImageFormats:
+        result["formats"] = compareFormats(stegoBytes)
+    return result
+
+
+def environment():
+    # Returns a description of the machine and code the benchmark ran on
+
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "HEAD"],
+            cwd=ROOTDIR,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+
+    return {
+        "commit": commit,
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "pillow": PIL.__version__,
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+    }
+
+
+def runBenchmarks(
+    sizes=DEFAULTSIZES,
+    fractions=DEFAULTFRACTIONS,
+    repeat=1,
+    coverSource=os.path.join(SAMPLEIMAGES, DEFAULTCOVER),
+    key=DEFAULTKEY,
+    progress=None,
+    lsbCount=1,
+    pngProfile=DEFAULTPROFILE,
+    compareProfiles=False,
+    compareImageFormats=False,
+):
+    """
+    Benchmarks encode and decode over every cover size and payload size.
+
+    Params:
+        sizes (list): Side lengths of the square synthetic covers.
+        fractions (list): Payload sizes as fractions of each cover's capacity.
+            A 1 KB payload is always included.
+        repeat (int): Runs per case; the fastest time per stage is kept.
+        coverSource (str): The fixture image covers are resized from.
+        key (str): The fingerprint used for every run.
+        progress (callable): Called with each result record as it completes.
+        lsbCount (int): Low bits written per channel, from 1 to 4.
+        pngProfile (str): The PNG output profile timed in the encode stages.
+        compareProfiles (bool): Whether to also time and size every PNG
+            profile on each stego image.
+        compareImageFormats (bool): Whether to also time a write and read of
+            each stego image in every registered image format.
+
+    Returns:
+        dict: The environment, settings and one result record per case.
+    """
+
+    results = []
+    enableInstrumentation(traceMemory=True)
+    try:
+        with tempfile.TemporaryDirectory() as workdir:
+            for size in sizes:
+                cover = syntheticCover(coverSource, size)
+                coverPath = os.path.join(workdir, f"cover{size}.png")
+                cover.save(coverPath)
+
+                positions = size * size * RGBCHANNELS - RGBCHANNELS
+                capacity = positions * lsbCount // BYTETOBIT
+                capacity -= CONTAINEROVERHEAD + len(buildMessage(b"", "payload.bin"))
+                for length in payloadSizes(capacity, fractions):
+                    result = runCase(
+                        cover,
+                        coverPath,
+                        length,
+                        key,
+                        repeat,
+                        workdir,
+                        lsbCount,
+                        pngProfile,
+                        compareProfiles,
+                        compareImageFormats,
+                    )
+                    results.append(result)
+                    if progress is not None:
+                        progress(result)
+    finally:
+        disableInstrumentation()
+
+    return {
+        "environment": environment(),
+        "settings": {
+            "sizes": list(sizes),
+            "fractions": list(fractions),
+            "repeat": repeat,
+            "lsbCount": lsbCount,
+            "pngProfile": pngProfile,
+            "cover": os.path.basename(coverSource),
+        },
+        "maxRSSBytes": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024,
+        "results": results,
+    }
+
+
+def parseArguments(argv):
+    # Given command line arguments, returns the parsed benchmark options
+
+    parser = argparse.ArgumentParser(
+        prog="python -m scripts.benchmark",
+        description="Time each encode and decode stage across cover and payload sizes.",
+    )
+    parser.add_argument(
+        "--sizes",
+        type=int,
+        nargs="+",
+        default=DEFAULTSIZES,
+        help="side lengths of the square covers",
+    )
+    parser.add_argument(
+        "--fractions",
+        type=float,
+        nargs="+",
+        default=DEFAULTFRACTIONS,
+        help="payload sizes as fractions of capacity",
+    )
+    parser.add_argument("--repeat", type=int, default=1, help="runs per case")
+    parser.add_argument(
+        "--lsb",
+        type=int,
+        default=1,
+        choices=range(1, 5),
+        help="low bits written per channel",
+    )
+    parser.add_argument(
+        "--png-profile",
+        default=DEFAULTPROFILE,
+        choices=PNGPROFILES,
+        help="PNG output profile timed in the encode stages",
+    )
+    parser.add_argument(
+        "--compare-png",
+        action="store_true",
+        help="also time and size every PNG profile on each stego image",
+    )
+    parser.add_argument(
+        "--compare-formats",
+        action="store_true",
+        help="also time a write and read of each stego image in every format",
+    )
+    parser.add_argument(
+        "--cover",
+        default=os.path.join(SAMPLEIMAGES, DEFAULTCOVER),
+        help="fixture image the covers are resized from",
+    )
+    parser.add_argument("--output", help="JSON results path (default: stdout)")
+    return parser.parse_args(argv)
+
+
+def printProgress(result):
+    # Prints a one line summary of a finished case to stderr
+
+    print(
+        f"{result['width']}x{result['height']} {result['payloadBytes']} bytes: "
+        f"encode {result['encode']['seconds']:.3f}s, "
+        f"decode {result['decode']['seconds']:.3f}s",
+        file=sys.stderr,
+    )
+
+
+def main(argv=None):
+    # Runs the benchmark suite from the command line
+
+    args = parseArguments(argv)
+    report = runBenchmarks(
+        args.sizes,
+        args.fractions,
+        args.repeat,
+        args.cover,
+        progress=printProgress,
+        lsbCount=args.lsb,
+        pngProfile=args.png_profile,
+        compareProfiles=args.compare_png,
+        compareImageFormats=args.compare_formats,
+    )
+
+    text = json.dumps(report, indent=2)
+    if args.output is None:
+        print(text)
+    else:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -2,22 +2,18 @@
 
 import math
 import os
-from collections import Counter
 
-import numpy as np
 from PIL import Image
 
 RGBCHANNELS = 3
 BYTETOKILOBYTE = 1 / 1000
 KILOBYTETOBYTE = 1000
 BITTOBYTE = 1 / 8
+BYTETOBIT = 8
 
 VARWARNING = 500
 ENTWARNING = 5
-
-RCHAN = 0
-GCHAN = 1
-BCHAN = 2
+RATEWARNING = 0.1
 
 NOFILE = 0
 INVALIDOPTION = 1
@@ -134,6 +130,31 @@ def printEncodingSettings(numBits, numPixels, hash):
     print(f"Fingerprint Used: {hash}")
 
 
+def printCompressionReport(messageSize, storedSize):
+    print("\n═══ COMPRESSION ═══")
+    if storedSize >= messageSize:
+        print("Compression: Skipped, the message does not compress")
+        return
+
+    print(f"Compression Ratio: {messageSize / storedSize:.2f}x")
+    print(f"Message Size: {messageSize} bytes -> {storedSize} bytes")
+    print(f"Capacity Saved: {(messageSize - storedSize) * BYTETOBIT} bits")
+
+
+def printOutputReport(report):
+    print("\n═══ OUTPUT ═══")
+    print(f"Format: {report.format}")
+    print(f"Encode Time: {report.seconds:.2f} s")
+    fileSizeConversion(report.size * BYTETOKILOBYTE, FILESIZE)
+
+
+def printInPlaceReport(report):
+    print("\n═══ IN-PLACE EMBED ═══")
+    print(f"Positions Covered: {report.positions}")
+    print(f"Bytes Rewritten: {report.bytesWritten}")
+    print(f"Embed Time: {report.seconds:.2f} s")
+
+
 def printFileStats(filePath, fileName, fileSize, extension):
     print("═══ FILE STATS ═══")
     print(f"Full File Directory: {filePath}")
@@ -142,32 +163,25 @@ def printFileStats(filePath, fileName, fileSize, extension):
     print(f"File Extension: {extension}\n")
 
 
-def printImageStats(filePath):
+def printImageStats(filePath, encodeLimit):
     im = Image.open(filePath)
     width, height = im.size
-    encodeLimit = width * height * RGBCHANNELS * BITTOBYTE * BYTETOKILOBYTE
+    encodeLimit = encodeLimit * BITTOBYTE * BYTETOKILOBYTE
 
     print("═══ IMAGE STATS ═══")
     print(f"Dimensions: {width}px x {height}px")
+    print(f"Mode: {im.mode}")
     fileSizeConversion(encodeLimit, ENCODABLEINFO)
 
 
-def printStegHeuristics(filePath):
-    totalVariance = calcTotalVariance(filePath)
-    totalEntropy = calcTotalEntropy(filePath)
-
-    rVar = calcChannelVariance(filePath, RCHAN)
-    gVar = calcChannelVariance(filePath, GCHAN)
-    bVar = calcChannelVariance(filePath, BCHAN)
-
-    rEnt = calcChannelEntropy(filePath, RCHAN)
-    gEnt = calcChannelEntropy(filePath, GCHAN)
-    bEnt = calcChannelEntropy(filePath, BCHAN)
+def printStegHeuristics(heuristics):
+    rVar, gVar, bVar = (round(v, 2) for v in heuristics.channelVariance)
+    rEnt, gEnt, bEnt = (round(e, 2) for e in heuristics.channelEntropy)
 
     print("\n═══ STENOGRAPHIC HEURISTICS ═══")
-    print(f"Total Variance: {totalVariance}")
+    print(f"Total Variance: {round(heuristics.totalVariance, 2)}")
     print(f"Channel Variance: [{rVar}, {gVar}, {bVar}] (R,G,B)")
-    print(f"Entropy: {totalEntropy}")
+    print(f"Entropy: {round(heuristics.totalEntropy, 2)}")
     print(f"Channel Entropy: [{rEnt}, {gEnt}, {bEnt}] (R,G,B)")
 
     if rEnt < ENTWARNING or gEnt < ENTWARNING or bEnt < ENTWARNING:
@@ -181,37 +195,15 @@ def printStegHeuristics(filePath):
         )
 
 
-def calcTotalVariance(filePath):
-    img = Image.open(filePath).convert("RGB")
-    pixels = np.array(img)
-    return round(np.var(pixels), 2)
-
-
-def calcTotalEntropy(filePath):
-    img = Image.open(filePath).convert("L")
-    return round(img.entropy(), 2)
-
-
-def calcChannelVariance(filePath, channel):
-    img = Image.open(filePath).convert("RGB")
-    data = np.array(img)
-
-    channelData = data[:, :, channel].flatten()
-    return round(np.var(channelData), 2)
-
-
-def calcChannelEntropy(filePath, channel):
-    img = Image.open(filePath).convert("RGB")
-    data = np.array(img)
-    channelData = data[:, :, channel].flatten()
-
-    counts = Counter(channelData)
-    total = len(channelData)
-    entropy = 0.0
-
-    for count in counts.values():
-        p = count / total
-        entropySum = p * math.log2(p)
-        entropy -= entropySum
+def printSteganalysis(report):
+    print("\n═══ LSB STEGANALYSIS ═══")
+    for channel in report.channels:
+        print(
+            f"{channel.band}: Chi-Square {round(channel.chiSquare, 2)}, "
+            f"RS {round(channel.rsRate * 100, 1)}%, "
+            f"Sample Pairs {round(channel.spaRate * 100, 1)}%"
+        )
+    print(f"Estimated Embedding Rate: {round(report.rate * 100, 1)}%")
 
-    return round(entropy, 2)
+    if report.rate > RATEWARNING:
+        print("\n⚠ WARNING: This image may already carry LSB embedded data ⚠")
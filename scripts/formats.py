@@ -0,0 +1,262 @@
+# COMP6841 - Steganography Project Formats File
+#
+# Registry of the lossless image formats stego images are read from and
+# written to. Each adapter names the Pillow modes it stores exactly and how
+# to read pixels, write pixels and carry metadata across, so encode and
+# decode dispatch on the format rather than assuming PNG. Lossy formats are
+# never registered, since they destroy the embedded bits.
+
+import os
+import time
+from collections import namedtuple
+
+from PIL import features
+
+from .helpers import coverLimit, nativeImage, nativeMode, openImage, preserveMetadata
+from .pngStreams import DEFAULTPROFILE, writePNG
+
+# name: registry key. pillowFormat: the format Pillow reports when reading.
+# extensions: file extensions that select it when writing. modes: the modes
+# it stores exactly. read(im): returns the opened image ready to embed in or
+# extract from. write(im, output, pngProfile): writes the image. preserve(source,
+# destination): carries file metadata from the cover to the stego file
+FormatAdapter = namedtuple(
+    "FormatAdapter",
+    ["name", "pillowFormat", "extensions", "modes", "read", "write", "preserve"],
+)
+
+# The outcome of one writeImage call
+ImageReport = namedtuple("ImageReport", ["format", "seconds", "size"])
+
+DEFAULTFORMAT = "png"
+
+PNGMODES = ("RGB", "RGBA", "L", "LA", "I;16", "I;16B")
+BMPMODES = ("RGB", "L")
+TIFFMODES = ("RGB", "RGBA", "L", "LA", "I;16", "I;16B")
+WEBPMODES = ("RGB", "RGBA")
+
+# In-image metadata each Pillow writer accepts, copied from the cover's info
+BMPMETADATA = ("dpi",)
+TIFFMETADATA = ("dpi", "icc_profile", "exif")
+WEBPMETADATA = ("icc_profile", "exif", "xmp")
+
+formatRegistry = {}
+
+
+def registerFormat(adapter):
+    """
+    Adds a format adapter to the registry, replacing any with the same name.
+
+    Params:
+        adapter (FormatAdapter): The adapter to register.
+
+    Returns:
+        None
+    """
+
+    formatRegistry[adapter.name] = adapter
+
+
+def readNative(im):
+    # Given an opened image, returns it in its native mode. Pixels are left
+    # to load lazily so decoding them can be measured on its own
+
+    return nativeImage(im)
+
+
+def writePNGPixels(im, output, pngProfile=DEFAULTPROFILE):
+    # Writes an image through the parallel PNG band writer
+
+    writePNG(im, output, pngProfile)
+
+
+def pillowWriter(pillowFormat, metadataKeys, **saveOptions):
+    # Given a Pillow format, the info keys it can store and fixed save
+    # options, returns a write function for a FormatAdapter
+
+    def write(im, output, pngProfile=None):
+        metadata = {key: im.info[key] for key in metadataKeys if im.info.get(key)}
+        im.save(output, format=pillowFormat, **metadata, **saveOptions)
+
+    return write
+
+
+def getFormat(name):
+    # Given a format name, returns its adapter, raising ValueError if no
+    # such format is registered
+
+    if name not in formatRegistry:
+        raise ValueError(
+            f"Unsupported format {name!r}, use one of {', '.join(formatRegistry)}"
+        )
+    return formatRegistry[name]
+
+
+def formatFor(path):
+    # Given a file path, returns the adapter its extension selects, or None
+
+    extension = os.path.splitext(path)[1].lower()
+    for adapter in formatRegistry.values():
+        if extension in adapter.extensions:
+            return adapter
+    return None
+
+
+def supportedExtensions():
+    # Returns every file extension a registered format is written under
+
+    return tuple(
+        extension
+        for adapter in formatRegistry.values()
+        for extension in adapter.extensions
+    )
+
+
+def readImage(source):
+    """
+    Opens an image through the adapter for its format.
+
+    Params:
+        source (str | bytes | ndarray | Image): The image.
+
+    Returns:
+        Image: The image in its native mode.
+
+    Raises:
+        ValueError: If the image is stored in a format that is not registered,
+            such as a lossy one.
+    """
+
+    im = openImage(source)
+    if im.format is None:
+        return readNative(im)
+
+    for adapter in formatRegistry.values():
+        if adapter.pillowFormat == im.format:
+            return adapter.read(im)
+    raise ValueError(f"{im.format} is not a supported lossless format")
+
+
+def imageCapacity(im, name=DEFAULTFORMAT, useAlpha=False):
+    """
+    Returns how many samples of an image can carry payload bits when the
+    stego image is written in the given format.
+
+    Params:
+        im (Image): The cover image.
+        name (str): The output format.
+        useAlpha (bool): Whether alpha samples carry bits.
+
+    Returns:
+        int: The number of usable samples.
+
+    Raises:
+        ValueError: If the format cannot store the cover's mode exactly.
+    """
+
+    adapter = getFormat(name)
+    mode = nativeMode(im)
+    if mode not in adapter.modes:
+        raise ValueError(f"{adapter.name} cannot store {mode} images exactly")
+    return coverLimit(im, useAlpha)
+
+
+def writeImage(im, output, name=None, pngProfile=DEFAULTPROFILE):
+    """
+    Writes an image through the adapter for its format.
+
+    Params:
+        im (Image): The image to write.
+        output (str | file): The output path or a binary file object.
+        name (str): The format. Defaults to the one the output path's
+            extension selects, or PNG.
+        pngProfile (str): The PNG output profile, used for PNG only.
+
+    Returns:
+        ImageReport: The format, the seconds spent writing and the size of
+        the file in bytes.
+
+    Raises:
+        ValueError: If the format cannot store the image's mode exactly.
+    """
+
+    if name is None:
+        adapter = formatFor(output) if isinstance(output, str) else None
+        name = DEFAULTFORMAT if adapter is None else adapter.name
+
+    adapter = getFormat(name)
+    if im.mode not in adapter.modes:
+        raise ValueError(f"{adapter.name} cannot store {im.mode} images exactly")
+
+    start = time.perf_counter()
+    offset = None if isinstance(output, str) else output.tell()
+    adapter.write(im, output, pngProfile)
+
+    if offset is None:
+        size = os.path.getsize(output)
+    else:
+        size = output.tell() - offset
+    return ImageReport(adapter.name, time.perf_counter() - start, size)
+
+
+def copyMetadata(sourceFile, destinationFile):
+    # Given a cover path and a stego path, carries metadata across with the
+    # stego file's format adapter
+
+    adapter = formatFor(destinationFile) or getFormat(DEFAULTFORMAT)
+    adapter.preserve(sourceFile, destinationFile)
+
+
+registerFormat(
+    FormatAdapter(
+        "png", "PNG", (".png",), PNGMODES, readNative, writePNGPixels, preserveMetadata
+    )
+)
+registerFormat(
+    FormatAdapter(
+        "bmp",
+        "BMP",
+        (".bmp",),
+        BMPMODES,
+        readNative,
+        pillowWriter("BMP", BMPMETADATA),
+        preserveMetadata,
+    )
+)
+registerFormat(
+    FormatAdapter(
+        "tiff",
+        "TIFF",
+        (".tif", ".tiff"),
+        TIFFMODES,
+        readNative,
+        pillowWriter("TIFF", TIFFMETADATA, compression="raw"),
+        preserveMetadata,
+    )
+)
+registerFormat(
+    FormatAdapter(
+        "tiff-lzw",
+        "TIFF",
+        (),
+        TIFFMODES,
+        readNative,
+        pillowWriter("TIFF", TIFFMETADATA, compression="tiff_lzw"),
+        preserveMetadata,
+    )
+)
+
+# Pillow may be built without libwebp. exact keeps the colour of fully
+# transparent pixels, which lossless WebP would otherwise discard
+if features.check("webp"):
+    registerFormat(
+        FormatAdapter(
+            "webp",
+            "WEBP",
+            (".webp",),
+            WEBPMODES,
+            readNative,
+            pillowWriter("WEBP", WEBPMETADATA, lossless=True, quality=100, exact=True),
+            preserveMetadata,
+        )
+    )
@@ -1,23 +1,37 @@
 # COMP6841 - Steganography Project Helpers File
 
 import base64
+import bz2
 import hashlib
+import io
+import lzma
 import math
 import os
 import re
 import shutil
+import struct
+import threading
+import time
+import zlib
+from collections import OrderedDict, namedtuple
 from os import urandom
 from pathlib import Path
 
 
+import numpy as np
 from blake3 import blake3
 from cryptography.hazmat.backends import default_backend
 from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
 from PIL import Image
 
 from .displayScripts import *
+from .instrumentation import stage
+from .permutationCache import loadPermutation, storePermutation
 
 HASHSIZE = 64
+HASHHALF = 32
+
+BYTETOBIT = 8
 
 RGBCHANNELS = 3
 
@@ -28,6 +42,73 @@ TEXTINPUT = "1"
 FILEINPUT = "2"
 
 DEFAULTSALT = b"TH1SH4SH1SN0T$IMPLE!!"
+KDFITERATIONS = 100000
+
+KEYCACHESIZE = 128
+KEYCACHETTL = 15 * 60
+
+PERMUTATIONCHUNK = 1 << 20
+TRACKEDSAMPLERATIO = 128
+
+# Container header written after the first fingerprint half:
+# magic, version, flags, payload length in bytes. Version 2 added the codec
+# bits to the flags and version 3 the LSB depth bits
+CONTAINERMAGIC = b"\x00SG"
+CONTAINERVERSION = 3
+CONTAINERHEADER = struct.Struct(">3sBBQ")
+
+# Payload is raw IV + ciphertext rather than base64 text
+FLAGRAWPAYLOAD = 0x01
+# Payload is one shard of a split message and starts with a shard header
+FLAGSHARD = 0x02
+
+# Codec the message was compressed with before encryption, in flag bits 2-3
+CODECSHIFT = 2
+CODECMASK = 0x03 << CODECSHIFT
+
+CODECNONE = 0
+CODECZLIB = 1
+CODECLZMA = 2
+CODECBZ2 = 3
+
+CODECS = {
+    CODECZLIB: ("zlib", lambda data: zlib.compress(data, 6), zlib.decompressobj),
+    CODECLZMA: ("lzma", lambda data: lzma.compress(data), lzma.LZMADecompressor),
+    CODECBZ2: ("bz2", lambda data: bz2.compress(data, 9), bz2.BZ2Decompressor),
+}
+
+# Messages up to this size try every codec, larger ones pick a codec from
+# evenly spaced samples and skip compression if the samples barely shrink
+COMPRESSTRIALLIMIT = 1 << 20
+COMPRESSSAMPLES = 8
+COMPRESSSAMPLESIZE = 16 << 10
+COMPRESSSAMPLERATIO = 0.95
+
+# Number of low bits used in each selected channel, less one, in flag bits
+# 4-5. The whole container, header included, is written at that depth
+LSBSHIFT = 4
+LSBMASK = 0x03 << LSBSHIFT
+MAXLSB = 4
+
+# Payload bits also occupy the alpha channel
+FLAGALPHA = 0x40
+
+IVSIZE = 16
+
+# Bits in the first fingerprint half plus the container header
+PREFIXBITS = (HASHHALF + CONTAINERHEADER.size) * BYTETOBIT
+
+# Bytes a raw container adds around the encrypted message
+CONTAINEROVERHEAD = HASHHALF + CONTAINERHEADER.size + IVSIZE
+
+# Pillow modes whose samples are embedded as they are. Other modes are
+# converted once on load, and alpha is the last sample of LA and RGBA pixels
+NATIVEMODES = ("RGB", "RGBA", "L", "LA", "I;16", "I;16B", "I;16L")
+ALPHACHANNELS = (2, 4)
+
+# A cover's samples as one flat array, the samples per pixel and how many of
+# those carry payload bits
+ChannelPlane = namedtuple("ChannelPlane", ["flat", "channels", "used"])
 
 NOFILE = 0
 INVALIDOPTION = 1
@@ -42,62 +123,242 @@ def hashGenerator(string):
     return hashlib.sha256(data).hexdigest()
 
 
-def passwordToKey(password, salt):
-    # Given a cleartext password, creates a 16 byte key
+# A fingerprint with its hash and AES key derived once, so batches using the
+# same fingerprint skip the KDF entirely
+SessionKey = namedtuple("SessionKey", ["fingerprint", "hash", "aesKey"])
+
+keyCache = OrderedDict()
+keyCacheLock = threading.Lock()
+keyCacheStats = {"hits": 0, "misses": 0, "evictions": 0}
+
+
+def passwordToKey(password, salt, iterations=KDFITERATIONS):
+    # Given a cleartext password, creates a 16 byte key. Derived keys are
+    # kept in a bounded LRU cache with a TTL, keyed on the KDF inputs
+
+    cacheKey = (password, salt, iterations)
+    now = time.monotonic()
+
+    with keyCacheLock:
+        cached = keyCache.get(cacheKey)
+        if cached is not None and cached[1] > now:
+            keyCache.move_to_end(cacheKey)
+            keyCacheStats["hits"] += 1
+            return cached[0]
+        keyCacheStats["misses"] += 1
+
+    with stage("kdf"):
+        key = hashlib.pbkdf2_hmac(
+            "sha256", password.encode(), salt, iterations, dklen=16
+        )
+
+    with keyCacheLock:
+        for expired in [k for k, v in keyCache.items() if v[1] <= now]:
+            del keyCache[expired]
+            keyCacheStats["evictions"] += 1
+
+        keyCache[cacheKey] = (key, now + KEYCACHETTL)
+        while len(keyCache) > KEYCACHESIZE:
+            keyCache.popitem(last=False)
+            keyCacheStats["evictions"] += 1
 
-    key = hashlib.pbkdf2_hmac("sha256", password.encode(), salt, 100000, dklen=16)
     return key
 
 
-def encryptText(key, plainText):
-    # Given a plaintext and a key, encrypts text using AES encryption
+def clearKeyCache():
+    # Drops every cached derived key and resets the hit and miss counters
+
+    with keyCacheLock:
+        keyCache.clear()
+        for counter in keyCacheStats:
+            keyCacheStats[counter] = 0
+
+
+def getKeyCacheStats():
+    # Returns a snapshot of the derived key cache counters and its size
+
+    with keyCacheLock:
+        return dict(keyCacheStats, size=len(keyCache))
+
+
+def deriveSessionKey(fingerprint, salt=DEFAULTSALT):
+    # Given a fingerprint, derives its hash and AES key once so they can be
+    # passed into repeated encode and decode calls
+
+    return SessionKey(
+        fingerprint, hashGenerator(fingerprint), passwordToKey(fingerprint, salt)
+    )
+
+
+def asSessionKey(key):
+    # Given a fingerprint string or a SessionKey, returns a SessionKey
+
+    if isinstance(key, SessionKey):
+        return key
+    return deriveSessionKey(key)
 
-    iv = urandom(16)
 
-    cipher = Cipher(algorithms.AES(key), modes.CFB(iv), backend=default_backend())
-    encryptor = cipher.encryptor()
+def aesCipher(key, iv):
+    # Given a 16 byte key and an IV, returns the AES-CFB cipher used for every
+    # payload. CFB is a stream mode, so data can also be fed in chunks
 
-    ciphertext = encryptor.update(plainText.encode()) + encryptor.finalize()
+    return Cipher(algorithms.AES(key), modes.CFB(iv), backend=default_backend())
 
-    return base64.b64encode(iv + ciphertext).decode("utf-8")
+
+def encryptBytes(key, plainBytes, iv=None):
+    # Given plaintext bytes and a key, encrypts them using AES encryption and
+    # returns the IV followed by the raw ciphertext. A fresh random IV is used
+    # unless one is given
+
+    if iv is None:
+        iv = urandom(IVSIZE)
+    encryptor = aesCipher(key, iv).encryptor()
+
+    return iv + encryptor.update(plainBytes) + encryptor.finalize()
+
+
+def decryptBytes(key, encryptedBytes):
+    # Given raw IV + ciphertext bytes and a fingerprint or SessionKey, decrypts
+    # them using AES encryption
+
+    iv = encryptedBytes[:IVSIZE]
+    ciphertext = encryptedBytes[IVSIZE:]
+
+    decryptor = aesCipher(asSessionKey(key).aesKey, iv).decryptor()
+
+    return decryptor.update(ciphertext) + decryptor.finalize()
+
+
+def encryptText(key, plainText):
+    # Given a plaintext and a key, encrypts text using AES encryption
+
+    return base64.b64encode(encryptBytes(key, plainText.encode())).decode("utf-8")
 
 
 def decryptText(key, encryptedData):
     # Given a ciphertext and a key, decrypts text using AES encryption
 
-    encrypted_data_bytes = base64.b64decode(encryptedData)
+    return decryptBytes(key, base64.b64decode(encryptedData)).decode("utf-8")
+
+
+def generateSecureSample(key, limit, count, memoryBudget=None):
+    # Given a key, creates a random uniformly distrubuted permutation of
+    # 'count' numbers with a maximum number of 'limit'.
+    #
+    # The permutation is the first 'count' entries of a reversed Fisher-Yates
+    # shuffle where step i swaps position i with j_i = (XOF word i) % (i + 1).
+    # The blake3 XOF is streamed in chunks rather than held in full, and small
+    # samples only track the positions that were asked for. When the
+    # permutation cache is enabled, a stored sample is memory-mapped instead.
+    # A memoryBudget in bytes rules out the full-size shuffle array
+
+    capacity = limit
+    limit = limit - RGBCHANNELS
+    count = max(0, min(count, limit))
+
+    with stage("permutation"):
+        cached = loadPermutation(key, capacity, count)
+        if cached is not None:
+            return cached
 
-    iv = encrypted_data_bytes[:16]
-    ciphertext = encrypted_data_bytes[16:]
+        hasher = blake3(key.encode())
 
-    key = passwordToKey(key, DEFAULTSALT)
-    cipher = Cipher(algorithms.AES(key), modes.CFB(iv), backend=default_backend())
-    decryptor = cipher.decryptor()
+        shuffleBytes = limit * np.dtype(np.uint32).itemsize
+        if count <= limit // TRACKEDSAMPLERATIO or (
+            memoryBudget is not None and shuffleBytes > memoryBudget
+        ):
+            positions = trackedSample(hasher, limit, count)
+        else:
+            positions = shuffledSample(hasher, limit, count)
 
-    decrypted_data = decryptor.update(ciphertext) + decryptor.finalize()
+        storePermutation(key, capacity, positions)
+        return positions
 
-    return decrypted_data.decode("utf-8")
 
+def sampleSwaps(hasher, start, stop):
+    # Given a blake3 hasher, returns the Fisher-Yates swap targets j_i for
+    # every step i in [start, stop)
 
-def generateSecureSample(key, limit, count):
-    # Given a key, creates a random uniformly distrubuted permutation of
-    # 'count' numbers with a maximum number of 'limit'
+    words = np.frombuffer(
+        hasher.digest(length=8 * (stop - start), seek=8 * start), dtype=">u8"
+    )
+    return words % (np.arange(start, stop, dtype=np.uint64) + 1)
 
-    limit = limit - RGBCHANNELS
-    indices = list(range(limit))
 
-    hasher = blake3(key.encode())
-    randomBytes = hasher.digest(length=8 * limit)
+def trackedSample(hasher, limit, count):
+    # Walking the shuffle steps forwards, the value finally left at position
+    # k is found by starting at j_k after step k and jumping to i whenever a
+    # later step i has j_i equal to the current position. Each chunk of steps
+    # is sorted by (j_i, i) so every tracked position finds its next jump
+    # with a binary search, keeping state proportional to 'count'
+
+    positions = np.arange(count, dtype=np.int64)
+    lastStep = positions.copy()
+    width = np.uint64(limit)
+    tracked = np.arange(min(1, count), dtype=np.int64)
 
-    # Fisher-Yates shuffle to generate deterministically random permutation
-    for i in reversed(range(1, limit)):
-        start = (i * 8) % len(randomBytes)
-        val = int.from_bytes(randomBytes[start : start + 8], "big")
+    for start in range(1, limit, PERMUTATIONCHUNK):
+        stop = min(start + PERMUTATIONCHUNK, limit)
+        swaps = sampleSwaps(hasher, start, stop)
 
-        j = val % (i + 1)
-        indices[i], indices[j] = indices[j], indices[i]
+        born = min(stop, count)
+        if start < born:
+            positions[start:born] = swaps[: born - start]
+            tracked = np.concatenate((tracked, np.arange(start, born)))
 
-    return indices[:count]
+        # Slots are kept ordered by position so the searches below walk the
+        # jumps in order; between chunks only a few slots move, which the
+        # adaptive stable sort handles in near-linear time
+        tracked = tracked[np.argsort(positions[tracked], kind="stable")]
+
+        jumps = np.sort(swaps * width + np.arange(start, stop, dtype=np.uint64))
+        moving = tracked
+        while moving.size:
+            current = positions[moving].astype(np.uint64)
+            query = current * width + lastStep[moving].astype(np.uint64)
+            found = np.searchsorted(jumps, query + np.uint64(1))
+            candidate = jumps[np.minimum(found, len(jumps) - 1)]
+
+            hit = (candidate > query) & (candidate < (current + 1) * width)
+            moving = moving[hit]
+            step = (candidate[hit] % width).astype(np.int64)
+            positions[moving] = step
+            lastStep[moving] = step
+
+    return positions
+
+
+def shuffledSample(hasher, limit, count):
+    # Runs the shuffle over a compact uint32 index array. Runs of steps whose
+    # swap targets are distinct and fall below the run are independent, so
+    # they are applied as one vectorized exchange; runs that collide fall
+    # back to sequential swaps. Run length grows with sqrt(i) to keep
+    # collisions rare
+
+    indices = np.arange(limit, dtype=np.uint32 if limit < 2**32 else np.int64)
+
+    for high in range(limit, 1, -PERMUTATIONCHUNK):
+        low = max(1, high - PERMUTATIONCHUNK)
+        swaps = sampleSwaps(hasher, low, high).astype(np.int64)
+
+        stop = high
+        while stop > low:
+            start = max(low, stop - max(1, math.isqrt(stop) >> 2))
+            targets = swaps[start - low : stop - low]
+
+            if targets.max() < start and len(np.unique(targets)) == len(targets):
+                steps = np.arange(start, stop)
+                exchanged = indices[targets]
+                indices[targets] = indices[steps]
+                indices[steps] = exchanged
+            else:
+                for i in range(stop - 1, start - 1, -1):
+                    j = targets[i - start]
+                    indices[i], indices[j] = indices[j], indices[i]
+
+            stop = start
+
+    return indices[:count].copy()
 
 
 def stringToBinary(string):
@@ -106,79 +367,487 @@ def stringToBinary(string):
     return "".join(format(ord(char), "08b") for char in string)
 
 
-def dataEncoder(info, hash, fingerprint):
-    # Given info encoded as a base64 string, a hash and a fingerprint
-    # combines the data into a structured message and then encrypting it
+def dataEncoder(
+    info, hash, fingerprint, compress=True, lsbCount=1, useAlpha=False, iv=None
+):
+    # Given info as raw bytes, a hash and a fingerprint (or SessionKey),
+    # compresses the data when that makes it smaller, encrypts it (with the
+    # given IV, if any) and wraps it in a container recording the codec, the
+    # LSB depth it will be embedded at and whether it spills into alpha,
+    # returned as an array of bits
 
-    firstHalf = slice(HASHSIZE // 2)
-    lastHalf = slice(HASHSIZE // 2, HASHSIZE)
+    codec = CODECNONE
+    if compress:
+        with stage("compress"):
+            codec, info = compressPayload(info)
 
-    firstFingerprint = hash[firstHalf]
-    lastFingerprint = hash[lastHalf]
-    key = passwordToKey(fingerprint, DEFAULTSALT)
-    encryptedData = encryptText(key, info)
+    aesKey = asSessionKey(fingerprint).aesKey
+    with stage("encrypt"):
+        encryptedData = encryptBytes(aesKey, info, iv)
 
-    data = firstFingerprint + encryptedData + lastFingerprint
-    return stringToBinary(data)
+    with stage("bit packing"):
+        flags = FLAGRAWPAYLOAD | codec << CODECSHIFT | lsbFlags(lsbCount)
+        flags |= FLAGALPHA if useAlpha else 0
+        data = buildContainer(hash, encryptedData, flags)
+        return np.unpackbits(np.frombuffer(data, dtype=np.uint8))
 
 
-def extractLSBBits(filePath, totalBits, key):
-    # Given a filePath, totalBits and a key, attempts to decode embedded
-    # information via LSB bit mask and extracting
+def lsbFlags(lsbCount):
+    # Given how many low bits each channel carries, returns the header flag
+    # bits recording it
+
+    if not 1 <= lsbCount <= MAXLSB:
+        raise ValueError(f"LSB depth must be between 1 and {MAXLSB}")
+    return (lsbCount - 1) << LSBSHIFT
+
+
+def flagsLSBCount(flags):
+    # Given container flags, returns how many low bits each channel carries
+
+    return ((flags & LSBMASK) >> LSBSHIFT) + 1
+
+
+def containerFlags(bits):
+    # Given the bits of a container from dataEncoder, returns the flags
+    # recorded in its header
+
+    prefix = np.packbits(bits[HASHHALF * BYTETOBIT : PREFIXBITS]).tobytes()
+    header = parseContainerHeader(prefix)
+    return 0 if header is None else header[1]
+
+
+def positionsFor(totalBits, lsbCount):
+    # Given a bit count and LSB depth, returns how many channel positions
+    # hold them
+
+    return -(-totalBits // lsbCount)
+
+
+def bitsToSymbols(bits, lsbCount):
+    # Given 0/1 bits, groups them most significant first into lsbCount-bit
+    # channel values, zero padding the last group
+
+    bits = np.asarray(bits, dtype=np.uint8)
+    if lsbCount == 1:
+        return bits
+
+    padding = -len(bits) % lsbCount
+    if padding:
+        bits = np.concatenate([bits, np.zeros(padding, dtype=np.uint8)])
+
+    symbols = np.zeros(len(bits) // lsbCount, dtype=np.uint8)
+    for i in range(lsbCount):
+        symbols |= bits[i::lsbCount] << (lsbCount - 1 - i)
+    return symbols
+
+
+def symbolsToBits(symbols, lsbCount):
+    # Given lsbCount-bit channel values, returns their bits most significant
+    # first
+
+    if lsbCount == 1:
+        return symbols
+
+    shifts = np.arange(lsbCount - 1, -1, -1, dtype=np.uint8)
+    return ((symbols[:, None] >> shifts) & 1).reshape(-1)
+
+
+def compressPayload(data):
+    # Given message bytes, returns (codec, data) for the codec that shrinks
+    # them most, or (CODECNONE, data) when no codec helps. Large messages
+    # choose their codec by compressing samples instead of the whole message
+
+    codecs = list(CODECS)
+    if len(data) > COMPRESSTRIALLIMIT:
+        step = len(data) // COMPRESSSAMPLES
+        sample = b"".join(
+            data[i * step : i * step + COMPRESSSAMPLESIZE]
+            for i in range(COMPRESSSAMPLES)
+        )
+        sizes = {codec: len(CODECS[codec][1](sample)) for codec in codecs}
+        codec = min(sizes, key=sizes.get)
+        if sizes[codec] > len(sample) * COMPRESSSAMPLERATIO:
+            return CODECNONE, data
+        codecs = [codec]
+
+    best = CODECNONE, data
+    for codec in codecs:
+        compressed = CODECS[codec][1](data)
+        if len(compressed) < len(best[1]):
+            best = codec, compressed
+    return best
+
+
+def payloadDecompressor(codec):
+    # Given a codec, returns an object whose decompress method undoes it one
+    # chunk at a time
+
+    return CODECS[codec][2]()
+
+
+def decompressPayload(codec, data):
+    # Given a codec and the bytes it produced, returns the original message
+
+    if codec == CODECNONE:
+        return data
+
+    decompressor = payloadDecompressor(codec)
+    message = decompressor.decompress(data)
+    if not decompressor.eof:
+        raise ValueError("Compressed payload is truncated")
+    return message
+
+
+def buildContainer(hash, payload, flags=0):
+    # Given a hash and payload bytes, prefixes the payload with the first
+    # fingerprint half and a versioned header recording its length
+
+    header = CONTAINERHEADER.pack(CONTAINERMAGIC, CONTAINERVERSION, flags, len(payload))
+    return hash[:HASHHALF].encode() + header + payload
+
+
+def parseContainerHeader(data):
+    # Given the bytes following the first fingerprint half, returns the
+    # (version, flags, length) of the container, or None for legacy images
+    # where base64 text follows the fingerprint directly
+
+    if len(data) < CONTAINERHEADER.size:
+        return None
+
+    magic, version, flags, length = CONTAINERHEADER.unpack_from(data)
+    if magic != CONTAINERMAGIC or version > CONTAINERVERSION:
+        return None
+    return version, flags, length
+
+
+def mappingToOffsets(mapping, channels=RGBCHANNELS, used=RGBCHANNELS):
+    # Given permuted channel indices, returns the flat sample offsets they
+    # address in a pixel buffer with 'channels' samples per pixel, of which
+    # the first 'used' carry bits. Index i maps to pixel ceil(i / used) and
+    # sample i % used, matching the original embed loop for RGB
+
+    mapping = np.asarray(mapping, dtype=np.int64)
+    pixels = (mapping + used - 1) // used
+    return pixels * channels + mapping % used
+
+
+def usableChannels(channels, useAlpha=False):
+    # Given the samples per pixel, returns how many carry payload bits. Alpha
+    # is only written when asked for, as flat alpha planes are easy to spot
+
+    if channels in ALPHACHANNELS and not useAlpha:
+        return channels - 1
+    return channels
+
+
+def nativeMode(im):
+    # Given a PIL image, returns the mode its samples are embedded in: its own
+    # mode when supported, otherwise the closest supported mode. Raises
+    # ValueError for unloaded 16-bit RGB images, which Pillow reads as 8-bit
+
+    if im.mode in ("RGB", "RGBA") and any(
+        str(tile[3]).endswith(";16B") for tile in getattr(im, "tile", ())
+    ):
+        raise ValueError("Pillow reads 16-bit RGB images as 8-bit, use I;16 or 8-bit")
+    if im.mode in NATIVEMODES:
+        return im.mode
+    if im.mode == "1":
+        return "L"
+    return "RGBA" if im.has_transparency_data else "RGB"
+
+
+def nativeImage(im):
+    # Given a PIL image, returns it unchanged when its samples can be embedded
+    # directly, otherwise converted once to its nativeMode
+
+    mode = nativeMode(im)
+    return im if mode == im.mode else im.convert(mode)
+
+
+def channelPlane(pixels, useAlpha=False):
+    # Given a pixel array, returns it as a ChannelPlane without copying
+
+    channels = pixels.shape[2] if pixels.ndim == 3 else 1
+    if useAlpha and channels not in ALPHACHANNELS:
+        raise ValueError("Cover has no alpha channel to embed in")
+    return ChannelPlane(
+        pixels.reshape(-1), channels, usableChannels(channels, useAlpha)
+    )
+
+
+def planeLimit(plane):
+    # Given a ChannelPlane, returns how many samples can carry payload bits
+
+    return len(plane.flat) // plane.channels * plane.used
+
+
+def coverLimit(im, useAlpha=False):
+    # Given a PIL image, returns how many samples can carry payload bits
+    # without decoding its pixels
 
-    im = Image.open(filePath).convert("RGB")
-    pixels = im.load()
     width, height = im.size
-    encodeLimit = width * height * RGBCHANNELS
+    channels = Image.getmodebands(nativeMode(im))
+    if useAlpha and channels not in ALPHACHANNELS:
+        raise ValueError("Cover has no alpha channel to embed in")
+    return width * height * usableChannels(channels, useAlpha)
+
+
+def embedLSBBits(im, mapping, bits, lsbCount=1, useAlpha=False):
+    # Given an image, permuted channel indices and an array of 0/1 bits,
+    # writes the bits lsbCount at a time into the low bits of each sample in
+    # a single scatter and returns the resulting image, in the cover's own
+    # mode and sample depth
+
+    with stage("embed"):
+        im = nativeImage(im)
+        arr = np.array(im)
+        plane = channelPlane(arr, useAlpha)
+
+        symbols = bitsToSymbols(bits, lsbCount)
+        idx = mappingToOffsets(mapping[: len(symbols)], plane.channels, plane.used)
+        plane.flat[idx] = (plane.flat[idx] >> lsbCount << lsbCount) | symbols
+
+        stegoImage = Image.fromarray(arr)
+        stegoImage.info = dict(im.info)
+        return stegoImage
+
+
+def openImage(source):
+    # Given a file path, encoded image bytes, a NumPy pixel array or a PIL
+    # image, returns it as a PIL image
+
+    if isinstance(source, Image.Image):
+        return source
+    if isinstance(source, np.ndarray):
+        return Image.fromarray(source)
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        return Image.open(io.BytesIO(source))
+    return Image.open(source)
+
+
+def loadChannels(source, useAlpha=False):
+    # Given an image source, returns its samples as a ChannelPlane. RGB,
+    # RGBA, L, LA and 16-bit greyscale are read as they are, at their own
+    # sample depth, with no conversion copy. A ChannelPlane is returned as is
+
+    if isinstance(source, ChannelPlane):
+        return source
+    with stage("image decode"):
+        return channelPlane(np.asarray(nativeImage(openImage(source))), useAlpha)
+
+
+def gatherSymbols(plane, mapping, lsbCount):
+    # Given a ChannelPlane and permuted channel indices, returns the low
+    # lsbCount bits of every addressed sample as uint8 values
+
+    offsets = mappingToOffsets(mapping, plane.channels, plane.used)
+    symbols = plane.flat[offsets] & ((1 << lsbCount) - 1)
+    return symbols.astype(np.uint8, copy=False)
+
+
+def readLSBBytes(plane, mapping, lsbCount=1):
+    # Given a ChannelPlane and permuted channel indices, gathers the low
+    # lsbCount bits of each sample in one fancy-index and packs them into
+    # bytes, dropping a trailing partial byte as bitsToAscii always did
+
+    with stage("extract"):
+        if lsbCount == 1:
+            mapping = mapping[: len(mapping) - len(mapping) % BYTETOBIT]
+
+        bits = symbolsToBits(gatherSymbols(plane, mapping, lsbCount), lsbCount)
+        return np.packbits(bits[: len(bits) - len(bits) % BYTETOBIT]).tobytes()
+
+
+def readLSBRange(plane, mapping, start, stop, lsbCount=1):
+    # Given a ChannelPlane, permuted channel indices and a byte aligned range
+    # of container bits, returns those bits packed into bytes, reading only
+    # the samples that hold them
+
+    first = start // lsbCount
+    last = positionsFor(stop, lsbCount)
+    skip = start - first * lsbCount
+
+    if skip == 0 and (stop - start) % (BYTETOBIT * lsbCount) == 0:
+        return readLSBBytes(plane, mapping[first:last], lsbCount)
+
+    with stage("extract"):
+        symbols = gatherSymbols(plane, mapping[first:last], lsbCount)
+        bits = symbolsToBits(symbols, lsbCount)[skip : skip + stop - start]
+        return np.packbits(bits).tobytes()
+
+
+def extractLSBBits(filePath, totalBits, key):
+    # Given a filePath, totalBits and a key, gathers the embedded LSBs at their
+    # permuted positions and returns them packed into bytes
+
+    plane = loadChannels(filePath)
 
     # Deterministically random permutation to embed bits in
-    mapping = generateSecureSample(key, encodeLimit, totalBits)
+    mapping = generateSecureSample(key, planeLimit(plane), totalBits)
+    return readLSBBytes(plane, mapping)
+
+
+def readContainerHeader(plane, fingerprint):
+    # Given a ChannelPlane and a fingerprint, reads the first fingerprint half
+    # and container header, trying the plane with and then without its alpha
+    # samples. Returns (header, prefixBits, plane) for the layout that
+    # matched, where header is None for images embedded before the header
+    # existed, or None when nothing is embedded under this fingerprint
+
+    layouts = [plane]
+    if plane.used < plane.channels:
+        layouts.append(plane._replace(used=plane.channels))
+
+    for layout in layouts:
+        alpha = layout.channels in ALPHACHANNELS and layout.used == layout.channels
+        mapping = generateSecureSample(fingerprint, planeLimit(layout), PREFIXBITS)
+
+        header = matchContainerPrefix(
+            fingerprint,
+            lambda lsbCount: readLSBBytes(
+                layout, mapping[: positionsFor(PREFIXBITS, lsbCount)], lsbCount
+            ),
+            alpha,
+        )
+        if header is not False:
+            return header, PREFIXBITS, layout
+    return None
 
-    bits = []
-    for i in range(totalBits):
-        currentPixel = math.ceil(mapping[i] / 3)
-        currentChannel = mapping[i] % 3
 
-        x = currentPixel % width
-        y = math.floor(currentPixel / width)
+def matchContainerPrefix(fingerprint, readPrefix, alpha=False):
+    # Given a fingerprint and a function returning the prefix bytes read at a
+    # given LSB depth, tries each depth in turn. Returns the header whose
+    # recorded depth and alpha use match how it was read, None for images
+    # embedded before the header existed, or False when nothing matches
 
-        pixel = pixels[x, y]
-        bits.append(str(pixel[currentChannel] & 1))
+    firstFingerprint = hashGenerator(fingerprint)[:HASHHALF].encode()
+    for lsbCount in range(1, MAXLSB + 1):
+        prefix = readPrefix(lsbCount)
+        if not prefix.startswith(firstFingerprint):
+            continue
 
-    return "".join(bits)
+        header = parseContainerHeader(prefix[HASHHALF:])
+        if header is None and lsbCount == 1 and not alpha:
+            return None
+        if (
+            header is not None
+            and flagsLSBCount(header[1]) == lsbCount
+            and bool(header[1] & FLAGALPHA) == alpha
+        ):
+            return header
+    return False
+
+
+def readContainer(source, key):
+    # Given an image source and a fingerprint (or SessionKey), reads the
+    # fingerprint and container header, then exactly the payload bits.
+    # Returns (flags, payload bytes), with flags None for images embedded
+    # before the header existed, whose base64 text is found by a
+    # full-capacity scan. Returns None when nothing is embedded under this key
+
+    fingerprint = key.fingerprint if isinstance(key, SessionKey) else key
+    lastFingerprint = hashGenerator(fingerprint)[HASHHALF:HASHSIZE]
+
+    located = readContainerHeader(loadChannels(source), fingerprint)
+    if located is None:
+        return None
 
+    header, prefixBits, plane = located
+    encodeLimit = planeLimit(plane)
+    if header is None:
+        mapping = generateSecureSample(fingerprint, encodeLimit, encodeLimit)
+        asciiOutput = bitsToAscii(readLSBBytes(plane, mapping))
 
-def bitsToAscii(bitString):
-    # Given the binary data bitString, converts bits into ascii characters
+        endIndex = asciiOutput.find(lastFingerprint)
+        if endIndex == -1:
+            return None
+        return None, asciiOutput[HASHHALF:endIndex].encode("latin-1")
+
+    version, flags, length = header
+    lsbCount = flagsLSBCount(flags)
+    totalBits = prefixBits + length * BYTETOBIT
+    positions = positionsFor(totalBits, lsbCount)
+    if positions > encodeLimit - RGBCHANNELS:
+        return None
 
-    chars = []
-    for i in range(0, len(bitString) - 7, 8):
-        byte = bitString[i : i + 8]
-        ascii_char = chr(int(byte, 2))
-        chars.append(ascii_char)
-    return "".join(chars)
+    mapping = generateSecureSample(fingerprint, encodeLimit, positions)
+    return flags, readLSBRange(plane, mapping, prefixBits, totalBits, lsbCount)
+
+
+def extractPayload(source, key):
+    # Given an image source and a fingerprint (or SessionKey), returns the
+    # decrypted message bytes, or None when no information is embedded under
+    # this key. Shards of a split payload are joined by the sharding module
+
+    return openContainer(readContainer(source, key), key)
+
+
+def openContainer(container, key):
+    # Given the (flags, payload) read from a container and a fingerprint (or
+    # SessionKey), returns the decrypted message bytes, or None if the
+    # container is None
+
+    if container is None:
+        return None
+
+    flags, payload = container
+    if flags is None or not flags & FLAGRAWPAYLOAD:
+        return textToPayload(decryptText(key, payload.decode("latin-1")))
+    if flags & FLAGSHARD:
+        raise ValueError("Image holds one shard of a split payload")
+
+    with stage("decrypt"):
+        message = decryptBytes(key, payload)
+
+    codec = (flags & CODECMASK) >> CODECSHIFT
+    with stage("decompress"):
+        return decompressPayload(codec, message)
+
+
+def textToPayload(text):
+    # Given a message decrypted from a base64 text payload, returns it in the
+    # raw form used today, with any embedded file content base64 decoded
+
+    if text.startswith(EXTHEADER + DEFAULTHEADER):
+        return text.encode()
+
+    fileName = extractName(text)
+    nameLength = len(EXTHEADER) + len(fileName) + 2
+    return text[:nameLength].encode() + base64.b64decode(text[nameLength:])
+
+
+def bitsToAscii(bitData):
+    # Given the packed bytes from extractLSBBits (or a legacy '0'/'1' bit
+    # string), converts them into ascii characters
+
+    if isinstance(bitData, str):
+        bitData = np.packbits(
+            np.frombuffer(bitData.encode(), dtype=np.uint8)[: len(bitData) // 8 * 8]
+            - ord("0")
+        )
+
+    return bytes(bitData).decode("latin-1")
 
 
 def writeToFile(decodedInformation, outputFilePath):
     # Given decodedInformation and an outputFilePath, saves decoded information
     # into a provided file.
 
-    binaryData = base64.b64decode(decodedInformation)
     with open(outputFilePath, "wb") as f:
-        f.write(binaryData)
+        f.write(decodedInformation)
 
 
 def encodingSelection():
     # Helper function for encodingInformation() to help handle encoding file
-    # and text inputs
+    # and text inputs, returning the message as raw bytes
 
-    encodingHeader = EXTHEADER
+    encodingHeader = EXTHEADER.encode()
 
     printEncodingSelections()
     encodingSelection = input("Option Selected: ").lower()
 
     if encodingSelection == TEXTINPUT:
-        encodingHeader += DEFAULTHEADER
+        encodingHeader += DEFAULTHEADER.encode()
 
         info = input("Enter text to encode: ")
         if info == "":
@@ -186,7 +855,7 @@ def encodingSelection():
             printError(INVALIDMSG)
             return None
 
-        encodingHeader += info
+        encodingHeader += info.encode()
 
     elif encodingSelection == FILEINPUT:
         print("\n★ Enter the full file path (including name and extension) ★")
@@ -197,13 +866,12 @@ def encodingSelection():
             return None
 
         fileName = os.path.basename(filePath)
-        encodingHeader += "$"
-        encodingHeader += fileName
-        encodingHeader += "$"
+        encodingHeader += b"$"
+        encodingHeader += fileName.encode()
+        encodingHeader += b"$"
 
         with open(filePath, "rb") as imageFile:
-            info = base64.b64encode(imageFile.read()).decode("utf-8")
-            encodingHeader += info
+            encodingHeader += imageFile.read()
     else:
         clearTerminal()
         printError(INVALIDOPTION)
@@ -212,20 +880,16 @@ def encodingSelection():
     return encodingHeader
 
 
-def printDecodedInformation(inputType, asciiOutput):
-    # Given an inputType and asciiOutput, attempts to decode the embedded
-    # information along with the metadata stored
+def printDecodedInformation(payload):
+    # Given a decoded Payload, displays the embedded information along with
+    # the metadata stored, saving file payloads to disk
 
     print("═══ INFORMATION METADATA ═══")
-    if inputType == TEXTINPUT:
-        decodedInformation = asciiOutput[len(EXTHEADER + DEFAULTHEADER) :]
+    if payload.name is None:
         print(f"Information Format: Plaintext")
-        print(f"Decoded Information: {decodedInformation}")
+        print(f"Decoded Information: {payload.data.decode()}")
     else:
-        decodedInformation = asciiOutput[len(EXTHEADER) :]
-        extractedFile = extractName(decodedInformation)
-        nameLength = len(extractedFile) + 2
-        decodedInformation = asciiOutput[len(EXTHEADER) + nameLength :]
+        extractedFile = payload.name
 
         file = Path(extractedFile)
         extension = file.suffix.lstrip(".")
@@ -236,7 +900,7 @@ def printDecodedInformation(inputType, asciiOutput):
 
         print(f"Information Format: {extension}")
         print(f"Original Filename: {extractedFile}")
-        print(f"Decoded Information: {decodedInformation}")
+        print(f"Decoded Information: {len(payload.data)} bytes")
         print(f"Default Output Name: {outputName}")
 
         print(f"\n★ Please Enter a Name for the Output File (default: {outputName}) ★")
@@ -244,12 +908,18 @@ def printDecodedInformation(inputType, asciiOutput):
         if outputPath == "":
             outputPath = outputName
 
-        writeToFile(decodedInformation.encode(), outputPath)
+        writeToFile(payload.data, outputPath)
 
 
 def extractName(text):
-    # Given text, finds the first substring between two dollar signs ($), and
-    # returns it, in this case the name metadata is stored
+    # Given text or bytes, finds the first substring between two dollar signs
+    # ($), and returns it, in this case the name metadata is stored
+
+    if isinstance(text, bytes):
+        name = re.search(rb"\$(.*?)\$", text)
+        if name:
+            return name.group(1).decode()
+        return None
 
     name = re.search(r"\$(.*?)\$", text)
     if name:
@@ -261,4 +931,5 @@ def preserveMetadata(sourceFile, destinationFile):
     # Given a path to files, sourceFile and destinationFile
     # copies the metadata amongst the files to hide modification
 
-    shutil.copystat(sourceFile, destinationFile)
+    with stage("metadata copy"):
+        shutil.copystat(sourceFile, destinationFile)
@@ -0,0 +1,65 @@
+# COMP6841 - Steganography Project Heuristics File
+#
+# Computes every steganalysis heuristic shown to the user from a single
+# decode of the image, using one bincount histogram per channel.
+
+from collections import namedtuple
+
+import numpy as np
+
+from .helpers import RGBCHANNELS, openImage
+from .instrumentation import stage
+
+GREYLEVELS = 256
+
+# Variances and entropies of the RGB data; channel values are (R, G, B)
+Heuristics = namedtuple(
+    "Heuristics",
+    ["totalVariance", "channelVariance", "totalEntropy", "channelEntropy"],
+)
+
+
+def histogramVariance(histogram):
+    # Given a histogram of 0-255 values, returns their population variance
+
+    levels = np.arange(len(histogram), dtype=np.float64)
+    total = histogram.sum()
+    mean = (histogram * levels).sum() / total
+    return float((histogram * (levels - mean) ** 2).sum() / total)
+
+
+def histogramEntropy(histogram):
+    # Given a histogram, returns its Shannon entropy in bits
+
+    p = histogram[histogram > 0] / histogram.sum()
+    return float(-(p * np.log2(p)).sum())
+
+
+def computeHeuristics(source):
+    """
+    Decodes an image once and computes its variance and entropy heuristics.
+
+    Params:
+        source (str | bytes | ndarray | Image): The image to analyse.
+
+    Returns:
+        Heuristics: Total and per-channel variance and entropy. The total
+        entropy is that of the greyscale image, as Image.entropy() reports.
+    """
+
+    with stage("heuristics"):
+        im = openImage(source).convert("RGB")
+        pixels = np.asarray(im).reshape(-1, RGBCHANNELS)
+
+        histograms = [
+            np.bincount(pixels[:, channel], minlength=GREYLEVELS)
+            for channel in range(RGBCHANNELS)
+        ]
+        greyHistogram = np.asarray(im.convert("L").histogram())
+
+        return Heuristics(
+            totalVariance=histogramVariance(np.sum(histograms, axis=0)),
+            channelVariance=tuple(histogramVariance(h) for h in histograms),
+            totalEntropy=histogramEntropy(greyHistogram),
+            channelEntropy=tuple(histogramEntropy(h) for h in histograms),
+        )
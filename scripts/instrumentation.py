@@ -0,0 +1,216 @@
+# COMP6841 - Steganography Project Instrumentation File
+#
+# Opt-in timing and memory measurement around the main pipeline stages. When
+# disabled, which is the default, every stage is a no-op context manager.
+# When enabled, each stage records wall time, CPU time and tracemalloc peak,
+# every record is passed to the stage callback, and each encode or decode
+# gathers its stages into one trace that goes to the trace callback and,
+# optionally, to a JSON Lines file.
+
+import functools
+import json
+import threading
+import time
+import tracemalloc
+from collections import namedtuple
+from contextlib import contextmanager
+
+# One measured stage. peakBytes is the tracemalloc peak above the memory in
+# use when the stage started, or None when memory tracing is off
+StageRecord = namedtuple(
+    "StageRecord", ["name", "seconds", "cpuSeconds", "peakBytes", "depth"]
+)
+
+instrumentSettings = {
+    "enabled": False,
+    "traceMemory": False,
+    "stageCallback": None,
+    "traceCallback": None,
+    "tracePath": None,
+    "startedTracemalloc": False,
+}
+
+traceLock = threading.Lock()
+activeFrames = threading.local()
+
+
+def enableInstrumentation(
+    stageCallback=None, traceCallback=None, tracePath=None, traceMemory=True
+):
+    """
+    Starts measuring pipeline stages.
+
+    Params:
+        stageCallback (callable): Called with a StageRecord as each stage ends.
+        traceCallback (callable): Called with the trace dict of each encode or
+            decode as it ends.
+        tracePath (str): If given, each trace is appended here as a JSON line.
+        traceMemory (bool): Whether to record tracemalloc peaks. Tracing
+            memory slows allocation-heavy stages noticeably.
+
+    Returns:
+        None
+    """
+
+    instrumentSettings.update(
+        enabled=True,
+        traceMemory=traceMemory,
+        stageCallback=stageCallback,
+        traceCallback=traceCallback,
+        tracePath=tracePath,
+    )
+    if traceMemory and not tracemalloc.is_tracing():
+        tracemalloc.start()
+        instrumentSettings["startedTracemalloc"] = True
+
+
+def disableInstrumentation():
+    # Stops measuring stages, and stops tracemalloc if it was started here
+
+    if instrumentSettings["startedTracemalloc"]:
+        tracemalloc.stop()
+    instrumentSettings.update(
+        enabled=False,
+        traceMemory=False,
+        stageCallback=None,
+        traceCallback=None,
+        tracePath=None,
+        startedTracemalloc=False,
+    )
+
+
+def frameStack():
+    # Returns this thread's stack of open stages
+
+    if not hasattr(activeFrames, "stack"):
+        activeFrames.stack = []
+        activeFrames.trace = None
+    return activeFrames.stack
+
+
+def tracedPeak():
+    # Returns the tracemalloc peak since the last reset, or None if memory is
+    # not being traced
+
+    if not instrumentSettings["traceMemory"] or not tracemalloc.is_tracing():
+        return None
+    return tracemalloc.get_traced_memory()[1]
+
+
+@contextmanager
+def measure():
+    # Measures the enclosed block, yielding a dict that holds its seconds,
+    # cpuSeconds and peakBytes once the block exits. Nested measurements
+    # share tracemalloc's single peak counter, so each one folds the peak it
+    # saw back into the enclosing measurement before resetting it
+
+    stack = frameStack()
+    frame = {"peak": None, "baseline": None}
+
+    peak = tracedPeak()
+    if peak is not None:
+        if stack:
+            stack[-1]["peak"] = max(stack[-1]["peak"] or 0, peak)
+        tracemalloc.reset_peak()
+        frame["baseline"] = tracemalloc.get_traced_memory()[0]
+
+    stack.append(frame)
+    result = {}
+    wall, cpu = time.perf_counter(), time.process_time()
+    try:
+        yield result
+    finally:
+        result["seconds"] = time.perf_counter() - wall
+        result["cpuSeconds"] = time.process_time() - cpu
+        stack.pop()
+
+        peak = tracedPeak()
+        if peak is None or frame["baseline"] is None:
+            result["peakBytes"] = None
+        else:
+            peak = max(peak, frame["peak"] or 0)
+            result["peakBytes"] = peak - frame["baseline"]
+            if stack:
+                stack[-1]["peak"] = max(stack[-1]["peak"] or 0, peak)
+
+
+@contextmanager
+def stage(name):
+    # Records the enclosed block as a pipeline stage when instrumentation is
+    # enabled, and does nothing otherwise
+
+    if not instrumentSettings["enabled"]:
+        yield
+        return
+
+    depth = len(frameStack())
+    with measure() as result:
+        yield
+
+    record = StageRecord(
+        name, result["seconds"], result["cpuSeconds"], result["peakBytes"], depth
+    )
+    if activeFrames.trace is not None:
+        activeFrames.trace["stages"].append(record._asdict())
+    if instrumentSettings["stageCallback"] is not None:
+        instrumentSettings["stageCallback"](record)
+
+
+@contextmanager
+def traceOperation(operation, **fields):
+    # Gathers every stage run inside the block into one trace for the
+    # operation, emitted when the block exits. Traces do not nest; an inner
+    # operation's stages join the outer trace
+
+    if not instrumentSettings["enabled"]:
+        yield
+        return
+
+    frameStack()
+    if activeFrames.trace is not None:
+        yield
+        return
+
+    trace = {"operation": operation, **fields, "started": time.time()}
+    trace["status"] = "ok"
+    trace["stages"] = []
+    activeFrames.trace = trace
+    try:
+        with measure() as result:
+            yield
+    except Exception as error:
+        trace["status"] = "error"
+        trace["error"] = f"{type(error).__name__}: {error}"
+        raise
+    finally:
+        activeFrames.trace = None
+        trace.update(result)
+        emitTrace(trace)
+
+
+def traced(operation):
+    # Decorates a public encode or decode function so every call is gathered
+    # into one trace for the operation
+
+    def decorate(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            with traceOperation(operation):
+                return function(*args, **kwargs)
+
+        return wrapper
+
+    return decorate
+
+
+def emitTrace(trace):
+    # Passes a finished trace to the trace callback and appends it to the
+    # trace file
+
+    if instrumentSettings["traceCallback"] is not None:
+        instrumentSettings["traceCallback"](trace)
+
+    if instrumentSettings["tracePath"] is not None:
+        line = json.dumps(trace, default=str) + "\n"
+        with traceLock, open(instrumentSettings["tracePath"], "a") as f:
+            f.write(line)
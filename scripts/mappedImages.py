@@ -0,0 +1,363 @@
+# COMP6841 - Steganography Project Mapped Images File
+#
+# Embeds into and extracts from uncompressed BMP and TIFF files in place.
+# The file is memory-mapped with numpy.memmap and every permuted channel
+# index is translated straight to the byte offset of that sample's low bits,
+# allowing for row padding, bottom-up BMP rows and TIFF strips. Only bytes
+# whose value changes are written, and decoding reads only the offsets the
+# container occupies, so a small payload in a huge cover costs I/O in
+# proportion to the payload rather than the image.
+
+import os
+import shutil
+import struct
+import time
+from collections import namedtuple
+
+import numpy as np
+from PIL import Image
+
+from .helpers import (
+    ALPHACHANNELS,
+    FLAGALPHA,
+    RGBCHANNELS,
+    ChannelPlane,
+    asSessionKey,
+    bitsToSymbols,
+    containerFlags,
+    extractPayload,
+    flagsLSBCount,
+    generateSecureSample,
+    mappingToOffsets,
+    positionsFor,
+    preserveMetadata,
+    usableChannels,
+)
+from .instrumentation import stage, traced
+from .stegoEngine import buildMessage, encodeBits, parseMessage
+
+BMPFILEHEADER = struct.Struct("<2sIHHI")
+BMPINFOHEADER = struct.Struct("<IiiHHI")
+BMPMAGIC = b"BM"
+BMPRGB = 0
+
+# Byte offsets of the red, green and blue samples in a BMP pixel
+BMPSAMPLEORDER = (2, 1, 0)
+
+TIFFLITTLEENDIAN = b"II"
+TIFFUNCOMPRESSED = 1
+TIFFCHUNKY = 1
+TIFFWIDTH = 256
+TIFFHEIGHT = 257
+TIFFBITSPERSAMPLE = 258
+TIFFCOMPRESSION = 259
+TIFFSTRIPOFFSETS = 273
+TIFFSAMPLESPERPIXEL = 277
+TIFFROWSPERSTRIP = 278
+TIFFPLANARCONFIG = 284
+TIFFTILEWIDTH = 322
+
+# Where each sample of an uncompressed image lives in its file. rowStarts
+# holds the file offset of every row in top-down order, and sampleOffsets
+# the offset of each sample's low-order byte within a pixel
+MappedLayout = namedtuple(
+    "MappedLayout",
+    ["width", "height", "channels", "pixelBytes", "rowStarts", "sampleOffsets"],
+)
+
+# The outcome of an in-place embed: the sample positions the container
+# covers, the bytes actually rewritten and the seconds it took
+InPlaceReport = namedtuple("InPlaceReport", ["positions", "bytesWritten", "seconds"])
+
+
+def bmpLayout(path, im):
+    # Given a BMP path and its opened image, returns its MappedLayout,
+    # raising ValueError for compressed or paletted BMPs
+
+    with open(path, "rb") as f:
+        head = f.read(BMPFILEHEADER.size + BMPINFOHEADER.size)
+
+    magic, _, _, _, dataOffset = BMPFILEHEADER.unpack_from(head)
+    _, width, height, _, bitCount, compression = BMPINFOHEADER.unpack_from(
+        head, BMPFILEHEADER.size
+    )
+    if magic != BMPMAGIC or compression != BMPRGB:
+        raise ValueError("Only uncompressed BMPs can be embedded in place")
+
+    if bitCount in (24, 32) and im.mode == "RGB":
+        sampleOffsets = BMPSAMPLEORDER
+    elif bitCount == 8 and im.mode == "L":
+        sampleOffsets = (0,)
+    else:
+        raise ValueError(f"{bitCount}-bit {im.mode} BMPs cannot be embedded in place")
+
+    # Rows are padded to 4 bytes and stored bottom-up unless height is negative
+    stride = (bitCount * width + 31) // 32 * 4
+    rows = np.arange(abs(height), dtype=np.int64)
+    if height > 0:
+        rows = rows[::-1]
+
+    return MappedLayout(
+        width,
+        abs(height),
+        len(sampleOffsets),
+        bitCount // 8,
+        dataOffset + rows * stride,
+        np.array(sampleOffsets, dtype=np.int64),
+    )
+
+
+def tiffLayout(path, im):
+    # Given a TIFF path and its opened image, returns its MappedLayout,
+    # raising ValueError for compressed, tiled or planar TIFFs
+
+    tags = im.tag_v2
+    if (
+        tags.get(TIFFCOMPRESSION, TIFFUNCOMPRESSED) != TIFFUNCOMPRESSED
+        or tags.get(TIFFPLANARCONFIG, TIFFCHUNKY) != TIFFCHUNKY
+        or TIFFTILEWIDTH in tags
+    ):
+        raise ValueError("Only uncompressed, stripped TIFFs can be embedded in place")
+
+    width, height = tags[TIFFWIDTH], tags[TIFFHEIGHT]
+    channels = tags.get(TIFFSAMPLESPERPIXEL, 1)
+    bits = tags.get(TIFFBITSPERSAMPLE, (8,))
+    bits = bits[0] if isinstance(bits, tuple) else bits
+    if bits not in (8, 16) or channels != len(im.getbands()):
+        raise ValueError(f"{bits}-bit {im.mode} TIFFs cannot be embedded in place")
+
+    # The low-order byte of a 16-bit sample comes first in little-endian files
+    sampleBytes = bits // 8
+    with open(path, "rb") as f:
+        lowByte = 0 if f.read(2) == TIFFLITTLEENDIAN else sampleBytes - 1
+
+    stripOffsets = np.array(tags[TIFFSTRIPOFFSETS], dtype=np.int64)
+    rowsPerStrip = min(tags.get(TIFFROWSPERSTRIP, height), height)
+    rows = np.arange(height, dtype=np.int64)
+    rowBytes = width * channels * sampleBytes
+    rowStarts = stripOffsets[rows // rowsPerStrip] + rows % rowsPerStrip * rowBytes
+
+    return MappedLayout(
+        width,
+        height,
+        channels,
+        channels * sampleBytes,
+        rowStarts,
+        np.arange(channels, dtype=np.int64) * sampleBytes + lowByte,
+    )
+
+
+def readLayout(path):
+    """
+    Locates every sample of an uncompressed BMP or TIFF in its file, reading
+    only the headers.
+
+    Params:
+        path (str): The image file.
+
+    Returns:
+        MappedLayout: Where each row and sample lives in the file.
+
+    Raises:
+        ValueError: If the image is not an uncompressed BMP or TIFF whose
+            samples can be addressed directly.
+    """
+
+    with Image.open(path) as im:
+        if im.format == "BMP":
+            return bmpLayout(path, im)
+        if im.format == "TIFF":
+            return tiffLayout(path, im)
+    raise ValueError("Only BMP and TIFF images can be embedded in place")
+
+
+def supportsInPlace(path):
+    # Given an image path, returns whether it can be embedded in place
+
+    try:
+        readLayout(path)
+    except (OSError, ValueError):
+        return False
+    return True
+
+
+class MappedSamples:
+    """
+    The samples of an uncompressed image file as a flat sequence in decoded
+    order (row by row, sample by sample), backed by a memory map. Indexing
+    with an array of sample offsets returns the low-order byte of each.
+
+    Params:
+        path (str): The image file.
+        layout (MappedLayout): The file's layout from readLayout.
+        writable (bool): Whether the map may be written to.
+    """
+
+    def __init__(self, path, layout, writable=False):
+        self.layout = layout
+        self.map = np.memmap(path, dtype=np.uint8, mode="r+" if writable else "r")
+
+    def __len__(self):
+        return self.layout.width * self.layout.height * self.layout.channels
+
+    def fileOffsets(self, offsets):
+        """
+        Translates decoded sample offsets to byte offsets in the file.
+
+        Params:
+            offsets (ndarray): Offsets as mappingToOffsets returns them.
+
+        Returns:
+            ndarray: The file offset of each sample's low-order byte.
+        """
+
+        layout = self.layout
+        pixels, samples = np.divmod(
+            np.asarray(offsets, dtype=np.int64), layout.channels
+        )
+        rows, columns = np.divmod(pixels, layout.width)
+        return (
+            layout.rowStarts[rows]
+            + columns * layout.pixelBytes
+            + layout.sampleOffsets[samples]
+        )
+
+    def __getitem__(self, offsets):
+        return self.map[self.fileOffsets(offsets)]
+
+
+def mappedPlane(path):
+    # Given an uncompressed BMP or TIFF path, returns a read-only ChannelPlane
+    # over its memory-mapped samples, with alpha unused as loadChannels does
+
+    layout = readLayout(path)
+    samples = MappedSamples(path, layout)
+    return ChannelPlane(samples, layout.channels, usableChannels(layout.channels))
+
+
+def embedInPlace(coverPath, bits, key, outputPath=None):
+    """
+    Embeds container bits into an uncompressed BMP or TIFF by rewriting only
+    the bytes whose low bits change. With an output path, the cover is copied
+    there first and the copy is modified; otherwise the cover itself is.
+
+    Params:
+        coverPath (str): The cover image.
+        bits (ndarray): The container bits from encodeBits.
+        key (str | SessionKey): The fingerprint used to embed.
+        outputPath (str): Where the stego image is written.
+
+    Returns:
+        InPlaceReport: The positions covered, bytes rewritten and seconds.
+
+    Raises:
+        ValueError: If the cover cannot be embedded in place, the bits exceed
+            its capacity, or alpha is requested for a cover without it.
+    """
+
+    start = time.perf_counter()
+    layout = readLayout(coverPath)
+
+    flags = containerFlags(bits)
+    lsbCount = flagsLSBCount(flags)
+    useAlpha = bool(flags & FLAGALPHA)
+    if useAlpha and layout.channels not in ALPHACHANNELS:
+        raise ValueError("Cover has no alpha channel to embed in")
+
+    used = usableChannels(layout.channels, useAlpha)
+    encodeLimit = layout.width * layout.height * used
+    positions = positionsFor(len(bits), lsbCount)
+    if positions > encodeLimit - RGBCHANNELS:
+        raise ValueError(
+            f"Payload needs {len(bits)} bits but the cover holds "
+            f"{encodeLimit * lsbCount} at {lsbCount} bits per channel"
+        )
+
+    fingerprint = asSessionKey(key).fingerprint
+    mapping = generateSecureSample(fingerprint, encodeLimit, positions)
+
+    target = coverPath
+    if outputPath is not None and os.path.abspath(outputPath) != os.path.abspath(
+        coverPath
+    ):
+        shutil.copyfile(coverPath, outputPath)
+        target = outputPath
+
+    with stage("embed"):
+        samples = MappedSamples(target, layout, writable=True)
+        offsets = samples.fileOffsets(mappingToOffsets(mapping, layout.channels, used))
+
+        current = samples.map[offsets]
+        updated = (current >> lsbCount << lsbCount) | bitsToSymbols(bits, lsbCount)
+        changed = updated != current
+        samples.map[offsets[changed]] = updated[changed]
+        samples.map.flush()
+
+    if target != coverPath:
+        preserveMetadata(coverPath, target)
+
+    bytesWritten = int(np.count_nonzero(changed))
+    return InPlaceReport(positions, bytesWritten, time.perf_counter() - start)
+
+
+@traced("encode in place")
+def encodeInPlace(
+    coverPath,
+    payload,
+    key,
+    outputPath=None,
+    name=None,
+    compress=True,
+    lsbCount=1,
+    useAlpha=False,
+):
+    """
+    Hides a payload in an uncompressed BMP or TIFF without decoding or
+    re-encoding the image.
+
+    Params:
+        coverPath (str): The cover image.
+        payload (str | bytes | Payload): The information to hide.
+        key (str | SessionKey): The fingerprint used to encrypt and embed.
+        outputPath (str): Where the stego image is written. If None, the
+            cover is modified in place.
+        name (str): The file name recorded for byte payloads.
+        compress (bool): Whether to try compressing the message first.
+        lsbCount (int): Low bits written per channel, from 1 to 4.
+        useAlpha (bool): Whether to also embed in the alpha channel.
+
+    Returns:
+        InPlaceReport: The positions covered, bytes rewritten and seconds.
+
+    Raises:
+        ValueError: If the cover cannot be embedded in place or the payload
+            exceeds its capacity.
+    """
+
+    key = asSessionKey(key)
+    bits = encodeBits(buildMessage(payload, name), key, compress, lsbCount, useAlpha)
+    return embedInPlace(coverPath, bits, key, outputPath)
+
+
+@traced("decode in place")
+def decodeInPlace(path, key):
+    """
+    Recovers a payload from an uncompressed BMP or TIFF, reading only the
+    bytes the container occupies.
+
+    Params:
+        path (str): The stego image.
+        key (str | SessionKey): The fingerprint used when encoding.
+
+    Returns:
+        Payload: The decoded payload, or None if nothing is embedded under
+        this key.
+
+    Raises:
+        ValueError: If the image cannot be read in place.
+    """
+
+    message = extractPayload(mappedPlane(path), asSessionKey(key))
+    if message is None:
+        return None
+    return parseMessage(message)
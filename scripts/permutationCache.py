@@ -0,0 +1,161 @@
+# COMP6841 - Steganography Project Permutation Cache File
+
+import os
+import tempfile
+
+import numpy as np
+from blake3 import blake3
+
+CACHEDOMAIN = b"stego-tools permutation cache v2"
+CACHEEXT = ".npy"
+TEMPEXT = ".tmp"
+
+# Random key for the cache file names, created with owner-only permissions
+# in the cache directory the first time it is enabled
+CACHESECRETNAME = "cache.key"
+CACHESECRETSIZE = 32
+
+DEFAULTCACHEBYTES = 1 << 30
+
+cacheSettings = {"directory": None, "maxBytes": DEFAULTCACHEBYTES, "secret": None}
+
+
+def enablePermutationCache(directory, maxBytes=DEFAULTCACHEBYTES):
+    # Given a directory and a size budget, stores generated permutations there
+    # as .npy files so later encodes and decodes can memory-map them
+
+    os.makedirs(directory, exist_ok=True)
+    cacheSettings["secret"] = cacheSecret(directory)
+    cacheSettings["directory"] = directory
+    cacheSettings["maxBytes"] = maxBytes
+
+
+def cacheSecret(directory):
+    # Given a cache directory, returns its secret naming key, creating it
+    # readable by the owner only if it does not exist yet. A new key is
+    # written in full to a private temporary file and then linked into
+    # place, so another process never reads a partly written key
+
+    path = os.path.join(directory, CACHESECRETNAME)
+    if not os.path.exists(path):
+        handle, tempPath = tempfile.mkstemp(suffix=TEMPEXT, dir=directory)
+        try:
+            with os.fdopen(handle, "wb") as f:
+                f.write(os.urandom(CACHESECRETSIZE))
+            os.link(tempPath, path)
+        except FileExistsError:
+            # Another process created the key first
+            pass
+        finally:
+            os.remove(tempPath)
+
+    with open(path, "rb") as f:
+        secret = f.read()
+    if len(secret) != CACHESECRETSIZE:
+        raise ValueError(f"Permutation cache key {path} is corrupt")
+    return secret
+
+
+def disablePermutationCache():
+    # Stops reading and writing cached permutations
+
+    cacheSettings["directory"] = None
+    cacheSettings["secret"] = None
+
+
+def cachePath(key, limit):
+    # Given a key and capacity, returns the cache file for their permutation.
+    # The name is a blake3 digest keyed with the cache's random secret, so
+    # without read access to the secret file the names cannot be matched
+    # against guessed fingerprints
+
+    hasher = blake3(CACHEDOMAIN, key=cacheSettings["secret"])
+    hasher.update(key.encode())
+    hasher.update(limit.to_bytes(8, "big"))
+    return os.path.join(cacheSettings["directory"], hasher.hexdigest() + CACHEEXT)
+
+
+def loadPermutation(key, limit, count):
+    # Given a key, capacity and count, returns a read-only memory map of the
+    # first 'count' cached positions, or None if the cache is disabled or
+    # holds fewer positions than requested
+
+    if cacheSettings["directory"] is None:
+        return None
+
+    path = cachePath(key, limit)
+    try:
+        positions = np.load(path, mmap_mode="r")
+    except (OSError, ValueError):
+        return None
+
+    if len(positions) < count:
+        return None
+
+    # Touch the file so eviction sees it as recently used
+    os.utime(path)
+    return positions[:count]
+
+
+def storePermutation(key, limit, positions):
+    # Given a key, capacity and generated positions, writes them to the cache
+    # and evicts least recently used entries beyond the size budget
+
+    if cacheSettings["directory"] is None:
+        return
+
+    path = cachePath(key, limit)
+    dtype = np.uint32 if limit < 2**32 else np.int64
+
+    # Each writer gets its own temporary file, so threads and processes
+    # caching the same permutation never write into one another's
+    handle, tempPath = tempfile.mkstemp(suffix=TEMPEXT, dir=os.path.dirname(path))
+    try:
+        with os.fdopen(handle, "wb") as f:
+            np.save(f, np.asarray(positions, dtype=dtype))
+        os.replace(tempPath, path)
+    except BaseException:
+        os.remove(tempPath)
+        raise
+
+    evictPermutations(keep=path)
+
+
+def evictPermutations(keep=None):
+    # Removes the least recently used cache files until the directory fits in
+    # the configured size budget, never removing 'keep'
+
+    directory = cacheSettings["directory"]
+    entries = []
+    for name in os.listdir(directory):
+        if not name.endswith(CACHEEXT):
+            continue
+        path = os.path.join(directory, name)
+        try:
+            stat = os.stat(path)
+        except OSError:
+            continue
+        entries.append((stat.st_mtime, stat.st_size, path))
+
+    totalBytes = sum(size for _, size, _ in entries)
+    for _, size, path in sorted(entries):
+        if totalBytes <= cacheSettings["maxBytes"]:
+            break
+        if path == keep:
+            continue
+        try:
+            os.remove(path)
+        except OSError:
+            continue
+        totalBytes -= size
+
+
+def clearPermutationCache():
+    # Deletes every cached permutation in the configured directory
+
+    if cacheSettings["directory"] is None:
+        return
+
+    for name in os.listdir(cacheSettings["directory"]):
+        if name.endswith(CACHEEXT):
+            os.remove(os.path.join(cacheSettings["directory"], name))
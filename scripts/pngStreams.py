@@ -0,0 +1,495 @@
+# COMP6841 - Steganography Project PNG Streams File
+#
+# Reads and writes 8-bit, non-interlaced RGB/RGBA PNGs a strip of rows at a
+# time, so covers larger than memory can be processed. Strips are decoded by
+# handing Pillow a small PNG made of the previous strip's last row (stored
+# unfiltered) followed by the strip's still-filtered scanlines, which keeps
+# every PNG filter type correct without reimplementing unfiltering.
+#
+# Writing filters and deflates bands of rows on a thread pool and joins them
+# into one zlib stream, for whole images as well as strips. Output profiles
+# trade encode time against file size by choosing the zlib level and which
+# PNG filters each row may use.
+
+import io
+import os
+import struct
+import time
+import zlib
+from collections import deque, namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from PIL import Image
+
+PNGSIGNATURE = b"\x89PNG\r\n\x1a\n"
+CHUNKHEAD = struct.Struct(">I4s")
+IHDRFORMAT = struct.Struct(">IIBBBBB")
+
+# Supported colour types and their channels per pixel
+PNGCOLOURTYPES = {2: 3, 6: 4}
+PNGBITDEPTH = 8
+
+# Zlib stream header for a deflate stream with a 32K window
+ZLIBHEADER = b"\x78\x01"
+ADLERBASE = 65521
+
+# Colour types written for each number of channels per pixel
+WRITECOLOURTYPES = {1: 0, 2: 4, 3: 2, 4: 6}
+
+# Image modes writePNG writes itself, and their PNG bit depth
+WRITEBITDEPTHS = {"L": 8, "LA": 8, "RGB": 8, "RGBA": 8, "I;16": 16, "I;16B": 16}
+
+# iCCP profile name followed by the compression method
+ICCPROFILENAME = b"ICC Profile\x00\x00"
+
+READSIZE = 1 << 16
+
+# Uncompressed bytes per band when writing a whole image
+BANDBYTES = 1 << 20
+
+FILTERNONE = 0
+FILTERSUB = 1
+FILTERUP = 2
+FILTERAVERAGE = 3
+FILTERPAETH = 4
+ALLFILTERS = (FILTERNONE, FILTERSUB, FILTERUP, FILTERAVERAGE, FILTERPAETH)
+
+# Without the row above, the first row of a band uses the closest filter
+# that only looks left
+FIRSTROWFILTERS = {
+    FILTERNONE: FILTERNONE,
+    FILTERSUB: FILTERSUB,
+    FILTERUP: FILTERNONE,
+    FILTERAVERAGE: FILTERSUB,
+    FILTERPAETH: FILTERSUB,
+}
+
+# A zlib level and the PNG filters each row may choose between. With more
+# than one filter, each row takes the one with the smallest sum of absolute
+# signed bytes, as libpng's adaptive heuristic does
+PNGProfile = namedtuple("PNGProfile", ["level", "filters"])
+
+PNGPROFILES = {
+    "fast": PNGProfile(1, (FILTERUP,)),
+    "balanced": PNGProfile(6, ALLFILTERS),
+    "small": PNGProfile(9, ALLFILTERS),
+}
+DEFAULTPROFILE = "balanced"
+
+PNGInfo = namedtuple(
+    "PNGInfo", ["width", "height", "channels", "colourType", "ancillary"]
+)
+
+# The outcome of one writePNG call
+PNGReport = namedtuple("PNGReport", ["profile", "seconds", "size"])
+
+
+def readChunks(f):
+    # Given an open PNG file positioned after the signature, yields each
+    # chunk as (type, data)
+
+    while True:
+        head = f.read(CHUNKHEAD.size)
+        if len(head) < CHUNKHEAD.size:
+            return
+        length, chunkType = CHUNKHEAD.unpack(head)
+        data = f.read(length)
+        f.read(4)
+        yield chunkType, data
+        if chunkType == b"IEND":
+            return
+
+
+def writeChunk(f, chunkType, data):
+    # Given an open file, writes one PNG chunk with its CRC
+
+    f.write(CHUNKHEAD.pack(len(data), chunkType))
+    f.write(data)
+    f.write(struct.pack(">I", zlib.crc32(chunkType + data)))
+
+
+def parseIHDR(data):
+    # Given IHDR chunk data, returns (width, height, channels, colourType),
+    # raising ValueError for layouts strips cannot be streamed from
+
+    width, height, bitDepth, colourType, _, _, interlace = IHDRFORMAT.unpack(data)
+    if bitDepth != PNGBITDEPTH or colourType not in PNGCOLOURTYPES or interlace:
+        raise ValueError("Streaming needs an 8-bit, non-interlaced RGB or RGBA PNG")
+    return width, height, PNGCOLOURTYPES[colourType], colourType
+
+
+def readPNGInfo(path):
+    # Given a PNG path, returns its PNGInfo, reading only the chunks that
+    # come before the image data
+
+    ihdr = None
+    ancillary = []
+    with open(path, "rb") as f:
+        if f.read(len(PNGSIGNATURE)) != PNGSIGNATURE:
+            raise ValueError("Not a PNG file")
+
+        for chunkType, data in readChunks(f):
+            if chunkType == b"IHDR":
+                ihdr = parseIHDR(data)
+            elif chunkType == b"IDAT":
+                break
+            elif chunkType[0:1].islower():
+                ancillary.append((chunkType, data))
+
+    if ihdr is None:
+        raise ValueError("PNG has no IHDR chunk")
+    return PNGInfo(*ihdr, ancillary)
+
+
+def decodeStrip(info, previousRow, scanlines, rows):
+    # Given the previous unfiltered row and a strip's filtered scanlines,
+    # returns the strip's pixels as a (rows, width, channels) array
+
+    header = IHDRFORMAT.pack(
+        info.width, rows + 1, PNGBITDEPTH, info.colourType, 0, 0, 0
+    )
+    data = zlib.compress(b"\x00" + previousRow.tobytes() + scanlines, 0)
+
+    mini = io.BytesIO()
+    mini.write(PNGSIGNATURE)
+    writeChunk(mini, b"IHDR", header)
+    writeChunk(mini, b"IDAT", data)
+    writeChunk(mini, b"IEND", b"")
+
+    pixels = np.array(Image.open(io.BytesIO(mini.getvalue())))
+    return pixels[1:]
+
+
+def iterPNGStrips(path, stripRows):
+    # Given a PNG path and a strip height, yields (firstRow, pixels) for each
+    # strip in order while holding only one strip's data in memory
+
+    info = readPNGInfo(path)
+    stride = info.width * info.channels + 1
+    stripBytes = stripRows * stride
+
+    decompressor = zlib.decompressobj()
+    pending = bytearray()
+    previousRow = np.zeros(info.width * info.channels, dtype=np.uint8)
+    firstRow = 0
+
+    with open(path, "rb") as f:
+        f.read(len(PNGSIGNATURE))
+        for chunkType, data in readChunks(f):
+            if chunkType != b"IDAT":
+                continue
+
+            while data:
+                pending += decompressor.decompress(data, stripBytes)
+                data = decompressor.unconsumed_tail
+
+                while len(pending) >= stripBytes or (
+                    pending and firstRow + len(pending) // stride == info.height
+                ):
+                    rows = min(stripRows, len(pending) // stride)
+                    pixels = decodeStrip(
+                        info, previousRow, bytes(pending[: rows * stride]), rows
+                    )
+                    del pending[: rows * stride]
+
+                    # The caller owns the yielded strip and may modify it, so
+                    # the next strip is unfiltered against a copy of this row
+                    previousRow = pixels[-1].reshape(-1).copy()
+                    yield firstRow, pixels
+                    firstRow += rows
+
+    if firstRow != info.height:
+        raise ValueError("PNG image data ended early")
+
+
+def adler32Combine(adler1, adler2, length2):
+    # Given the Adler-32 of two byte runs and the second run's length,
+    # returns the Adler-32 of their concatenation (as zlib's adler32_combine)
+
+    remainder = length2 % ADLERBASE
+    sum1 = adler1 & 0xFFFF
+    sum2 = (remainder * sum1) % ADLERBASE
+    sum1 = (sum1 + (adler2 & 0xFFFF) + ADLERBASE - 1) % ADLERBASE
+    sum2 = (sum2 + (adler1 >> 16) + (adler2 >> 16) + ADLERBASE - remainder) % ADLERBASE
+    return sum1 | (sum2 << 16)
+
+
+def resolveProfile(profile):
+    # Given a profile name or PNGProfile, returns the PNGProfile
+
+    if isinstance(profile, PNGProfile):
+        return profile
+    if profile not in PNGPROFILES:
+        raise ValueError(f"Unknown PNG profile {profile!r}")
+    return PNGPROFILES[profile]
+
+
+def stripBytes(strip):
+    # Given a (rows, width[, channels]) strip, returns it as one row of
+    # big-endian sample bytes per image row, and its bytes per pixel
+
+    strip = np.ascontiguousarray(strip, dtype=strip.dtype.newbyteorder(">"))
+    channels = strip.shape[2] if strip.ndim == 3 else 1
+    rows = strip.view(np.uint8).reshape(len(strip), -1)
+    return rows, channels * strip.dtype.itemsize
+
+
+def filterRows(rows, above, bpp, filterType):
+    # Given rows of bytes, the row above each and the bytes per pixel,
+    # returns the rows with one PNG filter applied
+
+    if filterType == FILTERNONE:
+        return rows
+    if filterType == FILTERUP:
+        return rows - above
+
+    left = np.zeros_like(rows)
+    left[:, bpp:] = rows[:, :-bpp]
+    if filterType == FILTERSUB:
+        return rows - left
+    if filterType == FILTERAVERAGE:
+        return rows - ((left.astype(np.uint16) + above) >> 1).astype(np.uint8)
+
+    upperLeft = np.zeros_like(above)
+    upperLeft[:, bpp:] = above[:, :-bpp]
+    a, b, c = (x.astype(np.int16) for x in (left, above, upperLeft))
+    pa, pb, pc = np.abs(b - c), np.abs(a - c), np.abs(a + b - 2 * c)
+    predictor = np.where((pa <= pb) & (pa <= pc), a, np.where(pb <= pc, b, c))
+    return rows - predictor.astype(np.uint8)
+
+
+def filterScanlines(rows, bpp, filters, previousRow=None):
+    # Given rows of bytes, returns PNG scanlines, each a filter type byte and
+    # the filtered row. previousRow is the raw row above the first; when it
+    # is unknown the first row only uses filters that look left
+
+    scanlines = np.empty((rows.shape[0], rows.shape[1] + 1), dtype=np.uint8)
+    if previousRow is None:
+        firstFilters = tuple(sorted({FIRSTROWFILTERS[f] for f in filters}))
+        if len(rows) > 1:
+            scanlines[1:] = filterScanlines(rows[1:], bpp, filters, rows[0])
+        scanlines[:1] = filterScanlines(
+            rows[:1], bpp, firstFilters, np.zeros_like(rows[0])
+        )
+        return scanlines
+
+    above = np.empty_like(rows)
+    above[0] = previousRow
+    above[1:] = rows[:-1]
+
+    if len(filters) == 1:
+        scanlines[:, 0] = filters[0]
+        scanlines[:, 1:] = filterRows(rows, above, bpp, filters[0])
+        return scanlines
+
+    best = None
+    for filterType in filters:
+        filtered = filterRows(rows, above, bpp, filterType)
+        cost = np.abs(filtered.view(np.int8).astype(np.int16)).sum(axis=1)
+        if best is None:
+            best = cost
+            scanlines[:, 0] = filterType
+            scanlines[:, 1:] = filtered
+            continue
+
+        better = cost < best
+        best = np.where(better, cost, best)
+        scanlines[better, 0] = filterType
+        scanlines[better, 1:] = filtered[better]
+    return scanlines
+
+
+def compressStrip(
+    strip, level, final, transform=None, filters=(FILTERNONE,), previousRow=None
+):
+    # Given a strip of pixels, applies an optional transform then returns its
+    # raw deflate data along with the Adler-32 and length of its scanlines.
+    # Non-final strips end on a sync flush so the pieces concatenate into one
+    # valid deflate stream
+
+    if transform is not None:
+        strip = transform(strip)
+
+    rows, bpp = stripBytes(strip)
+    data = filterScanlines(rows, bpp, filters, previousRow).tobytes()
+
+    compressor = zlib.compressobj(level, zlib.DEFLATED, -zlib.MAX_WBITS)
+    flush = zlib.Z_FINISH if final else zlib.Z_SYNC_FLUSH
+    compressed = compressor.compress(data) + compressor.flush(flush)
+    return compressed, zlib.adler32(data), len(data)
+
+
+class PNGStripWriter:
+    """
+    Writes a PNG strip by strip, filtering and compressing strips in
+    parallel threads.
+
+    Params:
+        path (str | file): The output path or a binary file object.
+        width (int): Image width in pixels.
+        height (int): Image height in pixels.
+        channels (int): 1 for greyscale, 2 with alpha, 3 for RGB or 4 for RGBA.
+        ancillary (list): (type, data) chunks copied after IHDR.
+        profile (str | PNGProfile): The output profile, see PNGPROFILES.
+        workers (int): Strips compressed at once; also bounds buffered strips.
+        bitDepth (int): 8, or 16 for strips of uint16 samples.
+    """
+
+    def __init__(
+        self,
+        path,
+        width,
+        height,
+        channels,
+        ancillary=(),
+        profile=DEFAULTPROFILE,
+        workers=None,
+        bitDepth=PNGBITDEPTH,
+    ):
+        colourType = WRITECOLOURTYPES[channels]
+
+        self.ownsFile = not hasattr(path, "write")
+        self.file = open(path, "wb") if self.ownsFile else path
+        self.height = height
+        self.profile = resolveProfile(profile)
+        self.rowsSubmitted = 0
+        self.previousRow = None
+        self.adler = 1
+        self.pool = ThreadPoolExecutor(workers)
+        self.maxPending = self.pool._max_workers
+        self.pending = deque()
+
+        self.file.write(PNGSIGNATURE)
+        header = IHDRFORMAT.pack(width, height, bitDepth, colourType, 0, 0, 0)
+        writeChunk(self.file, b"IHDR", header)
+        for chunkType, data in ancillary:
+            writeChunk(self.file, chunkType, data)
+        writeChunk(self.file, b"IDAT", ZLIBHEADER)
+
+    def write(self, strip, transform=None):
+        """
+        Queues the next strip of rows, blocking while too many are pending.
+
+        Params:
+            strip (ndarray): (rows, width, channels) pixels.
+            transform (callable): Optional function applied to the strip on
+                the worker thread before compression.
+        """
+
+        self.rowsSubmitted += len(strip)
+        final = self.rowsSubmitted == self.height
+        level, filters = self.profile
+        self.pending.append(
+            self.pool.submit(
+                compressStrip,
+                strip,
+                level,
+                final,
+                transform,
+                filters,
+                self.previousRow,
+            )
+        )
+
+        # A transformed strip is only known once its worker has run, so the
+        # next strip's first row cannot filter against it
+        self.previousRow = None
+        if transform is None:
+            self.previousRow = stripBytes(strip[-1:])[0][0]
+
+        while len(self.pending) > self.maxPending:
+            self.flushOne()
+
+    def flushOne(self):
+        compressed, adler, length = self.pending.popleft().result()
+        self.adler = adler32Combine(self.adler, adler, length)
+        if compressed:
+            writeChunk(self.file, b"IDAT", compressed)
+
+    def close(self):
+        """
+        Writes the remaining strips, the zlib trailer and IEND.
+        """
+
+        while self.pending:
+            self.flushOne()
+        self.pool.shutdown()
+
+        if self.rowsSubmitted != self.height:
+            self.closeFile()
+            raise ValueError("PNG closed before every row was written")
+
+        writeChunk(self.file, b"IDAT", struct.pack(">I", self.adler))
+        writeChunk(self.file, b"IEND", b"")
+        self.closeFile()
+
+    def closeFile(self):
+        if self.ownsFile:
+            self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, excType, exc, traceback):
+        if excType is None:
+            self.close()
+        else:
+            self.pool.shutdown()
+            self.closeFile()
+
+
+def writePNG(im, output, profile=DEFAULTPROFILE, workers=None):
+    """
+    Writes an image as PNG, filtering and compressing bands of rows in
+    parallel threads into one zlib stream. Modes the writer does not cover,
+    and images with a transparency key, are saved through Pillow at the
+    profile's zlib level.
+
+    Params:
+        im (Image): The image to write.
+        output (str | file): The output path or a binary file object.
+        profile (str | PNGProfile): The output profile, see PNGPROFILES.
+        workers (int): Bands compressed at once.
+
+    Returns:
+        PNGReport: The profile, the seconds spent encoding and the size of
+        the PNG in bytes.
+    """
+
+    start = time.perf_counter()
+    offset = None if isinstance(output, str) else output.tell()
+    level, filters = resolveProfile(profile)
+
+    if im.mode not in WRITEBITDEPTHS or "transparency" in im.info:
+        im.save(output, format="PNG", compress_level=level)
+    else:
+        pixels = np.asarray(im)
+        width, height = im.size
+        channels = pixels.shape[2] if pixels.ndim == 3 else 1
+        bandRows = max(1, BANDBYTES // max(1, pixels[0].nbytes))
+
+        ancillary = []
+        if im.info.get("icc_profile"):
+            iccData = ICCPROFILENAME + zlib.compress(im.info["icc_profile"])
+            ancillary.append((b"iCCP", iccData))
+
+        writer = PNGStripWriter(
+            output,
+            width,
+            height,
+            channels,
+            ancillary,
+            profile,
+            workers,
+            WRITEBITDEPTHS[im.mode],
+        )
+        with writer:
+            for firstRow in range(0, height, bandRows):
+                writer.write(pixels[firstRow : firstRow + bandRows])
+
+    if offset is None:
+        size = os.path.getsize(output)
+    else:
+        size = output.tell() - offset
+    return PNGReport(profile, time.perf_counter() - start, size)
@@ -0,0 +1,277 @@
+# COMP6841 - Steganography Project Probe File
+#
+# Triage for finding which images hold a payload under which of many
+# candidate fingerprints. A full decode per key pays for a whole image
+# decode, a capacity-sized read and the key derivation. A probe instead
+# reads only the HASHHALF * 8 positions that hold the first fingerprint
+# half, for every key at once against one decoded image, and never derives
+# a key or decrypts anything. The permutation depends only on the key and
+# the image's capacity, so across a directory it is generated once per key
+# and distinct image size rather than once per key and image.
+#
+# Usage:
+#   python -m scripts.probe --images DIR --keys keys.txt
+#   python -m scripts.probe --images a.png b.bmp --key one --key two --workers 4
+#
+# Each hit is printed as one JSON line holding the image, the key, the LSB
+# depth and whether alpha samples carry bits.
+
+import argparse
+import json
+import os
+import sys
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from PIL import Image
+
+from .batchRunner import imagePaths
+from .formats import readImage
+from .helpers import (
+    ALPHACHANNELS,
+    BYTETOBIT,
+    HASHHALF,
+    MAXLSB,
+    RGBCHANNELS,
+    channelPlane,
+    generateSecureSample,
+    hashGenerator,
+    mappingToOffsets,
+    nativeMode,
+    openImage,
+    positionsFor,
+    usableChannels,
+)
+
+# Positions holding the first fingerprint half at one bit per sample
+HASHBITS = HASHHALF * BYTETOBIT
+
+# An image found to hold a container: the image, the fingerprint, the LSB
+# depth it was written at and whether alpha samples carry bits
+ProbeHit = namedtuple("ProbeHit", ["path", "key", "lsbCount", "alpha"])
+
+
+def probeLayouts(channels, pixels):
+    # Given an image's samples per pixel and pixel count, returns (used,
+    # limit) for each layout a container may have been written in: without
+    # alpha and, for images with alpha, with it
+
+    usedCounts = [usableChannels(channels)]
+    if channels in ALPHACHANNELS:
+        usedCounts.append(channels)
+    return [(used, pixels * used) for used in usedCounts]
+
+
+def imageLayouts(path):
+    # Given an image path, returns its probe layouts from the header alone,
+    # or an empty list if it cannot be read
+
+    try:
+        with openImage(path) as im:
+            channels = Image.getmodebands(nativeMode(im))
+            width, height = im.size
+            return probeLayouts(channels, width * height)
+    except (OSError, ValueError):
+        return []
+
+
+def keyPrefixes(keys):
+    # Given fingerprints, returns the first hash half of each as a
+    # (keys, HASHHALF) byte array
+
+    prefixes = b"".join(hashGenerator(key)[:HASHHALF].encode() for key in keys)
+    return np.frombuffer(prefixes, dtype=np.uint8).reshape(len(keys), HASHHALF)
+
+
+def prefixMappings(key, limits):
+    # Given a fingerprint and image capacities, returns the positions holding
+    # the first hash half for each capacity large enough to hold a container
+
+    return {
+        limit: generateSecureSample(key, limit, HASHBITS)
+        for limit in limits
+        if limit - RGBCHANNELS >= HASHBITS
+    }
+
+
+def matchPrefixes(plane, mappings, prefixes):
+    # Given a ChannelPlane, a (keys, HASHBITS) array of positions in it and
+    # the matching (keys, HASHHALF) hash halves, reads every key's samples in
+    # one gather and returns (keyIndex, lsbCount) for each depth at which a
+    # key's hash half is found
+
+    offsets = mappingToOffsets(mappings, plane.channels, plane.used)
+    samples = plane.flat[offsets]
+
+    matches = []
+    for lsbCount in range(1, MAXLSB + 1):
+        symbols = samples[:, : positionsFor(HASHBITS, lsbCount)]
+        symbols = symbols & ((1 << lsbCount) - 1)
+        shifts = np.arange(lsbCount - 1, -1, -1, dtype=np.uint8)
+        bits = (symbols[..., None].astype(np.uint8) >> shifts) & 1
+        bits = bits.reshape(len(mappings), -1)[:, :HASHBITS]
+
+        found = (np.packbits(bits, axis=1) == prefixes).all(axis=1)
+        matches.extend((int(index), lsbCount) for index in np.flatnonzero(found))
+    return matches
+
+
+def probePlane(plane, mappings, prefixes):
+    # Given the ChannelPlane of one image with alpha unused,
+    # {limit: {keyIndex: positions}} and every key's hash half, returns
+    # (keyIndex, lsbCount, alpha) for every match in every layout
+
+    hits = []
+    pixels = len(plane.flat) // plane.channels
+    for used, limit in probeLayouts(plane.channels, pixels):
+        byKey = mappings.get(limit, {})
+        if not byKey:
+            continue
+
+        indices = np.fromiter(byKey, dtype=np.int64)
+        layout = plane._replace(used=used)
+        stacked = np.stack([byKey[index] for index in indices])
+        alpha = plane.channels in ALPHACHANNELS and used == plane.channels
+        for row, lsbCount in matchPrefixes(layout, stacked, prefixes[indices]):
+            hits.append((int(indices[row]), lsbCount, alpha))
+    return hits
+
+
+def probeImage(source, keys):
+    """
+    Checks one image for a container under each of several fingerprints,
+    without deriving keys or extracting payloads.
+
+    Params:
+        source (str | bytes | ndarray | Image): The image to check.
+        keys (list[str]): The candidate fingerprints.
+
+    Returns:
+        list[ProbeHit]: One hit per fingerprint and layout found, with path
+        set to the source when it is a path and None otherwise.
+
+    Raises:
+        ValueError: If the image is not in a registered lossless format.
+    """
+
+    keys = list(keys)
+    plane = channelPlane(np.asarray(readImage(source)))
+    pixels = len(plane.flat) // plane.channels
+    limits = [limit for _, limit in probeLayouts(plane.channels, pixels)]
+
+    mappings = {}
+    for index, key in enumerate(keys):
+        for limit, positions in prefixMappings(key, limits).items():
+            mappings.setdefault(limit, {})[index] = positions
+
+    path = source if isinstance(source, str) else None
+    return [
+        ProbeHit(path, keys[index], lsbCount, alpha)
+        for index, lsbCount, alpha in probePlane(plane, mappings, keyPrefixes(keys))
+    ]
+
+
+def probeJob(path, keys, mappings, prefixes):
+    # Given an image path and everything probePlane needs, decodes the image
+    # once and returns its hits. Runs in a pool worker; unreadable or lossy
+    # images simply have none
+
+    try:
+        plane = channelPlane(np.asarray(readImage(path)))
+    except (OSError, ValueError):
+        return []
+    return [
+        ProbeHit(path, keys[index], lsbCount, alpha)
+        for index, lsbCount, alpha in probePlane(plane, mappings, prefixes)
+    ]
+
+
+def probeImages(paths, keys, workers=None):
+    """
+    Checks every image against every candidate fingerprint on a process
+    pool. Positions are generated in parallel over keys, once per key and
+    distinct image capacity, then each image is decoded once and checked
+    against all keys in parallel over images.
+
+    Params:
+        paths (list[str]): The image files.
+        keys (list[str]): The candidate fingerprints.
+        workers (int): The number of pool processes.
+
+    Returns:
+        list[ProbeHit]: The hits, in the order of paths.
+    """
+
+    paths, keys = list(paths), list(keys)
+    layouts = {path: imageLayouts(path) for path in paths}
+    limits = sorted({limit for found in layouts.values() for _, limit in found})
+    prefixes = keyPrefixes(keys)
+
+    with ProcessPoolExecutor(workers) as pool:
+        mappings = {}
+        perKey = pool.map(prefixMappings, keys, [limits] * len(keys))
+        for index, keyMappings in enumerate(perKey):
+            for limit, positions in keyMappings.items():
+                mappings.setdefault(limit, {})[index] = positions
+
+        futures = []
+        for path in paths:
+            imageMappings = {
+                limit: mappings[limit]
+                for _, limit in layouts[path]
+                if limit in mappings
+            }
+            if imageMappings:
+                futures.append(
+                    pool.submit(probeJob, path, keys, imageMappings, prefixes)
+                )
+
+        return [hit for future in futures for hit in future.result()]
+
+
+def readKeys(path):
+    # Given a file of fingerprints, one per line, returns the non-empty ones
+
+    with open(path, encoding="utf-8") as f:
+        return [line.rstrip("\r\n") for line in f if line.rstrip("\r\n")]
+
+
+def parseArguments(argv):
+    parser = argparse.ArgumentParser(
+        prog="python -m scripts.probe",
+        description="Find which images hold a payload under which fingerprints.",
+    )
+    parser.add_argument(
+        "--images", nargs="+", required=True, help="image files or directories"
+    )
+    parser.add_argument("--keys", help="file with one candidate fingerprint per line")
+    parser.add_argument(
+        "--key", action="append", default=[], help="a candidate fingerprint"
+    )
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    args = parser.parse_args(argv)
+
+    if args.keys is None and not args.key:
+        parser.error("give candidate fingerprints with --keys or --key")
+    return args
+
+
+def main(argv=None):
+    args = parseArguments(argv)
+    keys = args.key + (readKeys(args.keys) if args.keys is not None else [])
+    paths = imagePaths(args.images)
+
+    hits = probeImages(paths, keys, args.workers)
+    for hit in hits:
+        print(json.dumps(hit._asdict()))
+
+    print(
+        f"{len(hits)} hits across {len(paths)} images and {len(keys)} keys",
+        file=sys.stderr,
+    )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,244 @@
+# COMP6841 - Steganography Project Sharding File
+#
+# Splits one payload across several covers. Each shard is encrypted on its
+# own and its container carries a shard header (set id, index, total), so
+# shards can be embedded in parallel and decoded in whatever order they
+# arrive.
+
+import io
+import struct
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from os import urandom
+
+import numpy as np
+
+from .helpers import (
+    BYTETOBIT,
+    CONTAINERHEADER,
+    FLAGRAWPAYLOAD,
+    FLAGSHARD,
+    HASHHALF,
+    IVSIZE,
+    RGBCHANNELS,
+    asSessionKey,
+    buildContainer,
+    coverLimit,
+    decryptBytes,
+    encryptBytes,
+    openImage,
+    readContainer,
+)
+from .pngStreams import writePNG
+from .stegoEngine import buildMessage, embedEncodedBits, parseMessage
+
+# Random id shared by every shard of one payload, shard index, shard total
+SHARDHEADER = struct.Struct(">8sII")
+SHARDSETIDSIZE = 8
+
+SHARDOVERHEAD = HASHHALF + CONTAINERHEADER.size + SHARDHEADER.size + IVSIZE
+
+
+def shardCapacity(cover):
+    # Given a cover, returns how many message bytes one shard can carry in it
+
+    capacity = (coverLimit(openImage(cover)) - RGBCHANNELS) // BYTETOBIT
+    return max(0, capacity - SHARDOVERHEAD)
+
+
+def splitSizes(total, capacities):
+    # Given a message length and per-cover capacities, returns chunk sizes
+    # proportional to each cover's capacity so shards take similar time
+
+    available = sum(capacities)
+    if total > available:
+        raise ValueError(f"Payload needs {total} bytes but the covers hold {available}")
+
+    sizes = [total * capacity // available for capacity in capacities]
+    remainder = total - sum(sizes)
+    for i, capacity in enumerate(capacities):
+        extra = min(remainder, capacity - sizes[i])
+        sizes[i] += extra
+        remainder -= extra
+    return sizes
+
+
+def encodeShard(cover, chunk, key, setId, index, total):
+    # Given a cover and one message chunk, encrypts the chunk independently
+    # and embeds it with its shard header, returning the stego PNG bytes
+
+    payload = SHARDHEADER.pack(setId, index, total) + encryptBytes(key.aesKey, chunk)
+    data = buildContainer(key.hash, payload, FLAGRAWPAYLOAD | FLAGSHARD)
+    bits = np.unpackbits(np.frombuffer(data, dtype=np.uint8))
+
+    buffer = io.BytesIO()
+    writePNG(embedEncodedBits(cover, bits, key), buffer)
+    return buffer.getvalue()
+
+
+def encodeShards(covers, payload, key, name=None, outputPaths=None, workers=None):
+    """
+    Splits a payload across several covers and embeds the shards in parallel.
+
+    Params:
+        covers (list): Cover images (paths, bytes, arrays or PIL images).
+        payload (str | bytes | Payload): The information to hide.
+        key (str | SessionKey): The fingerprint used to encrypt and embed.
+        name (str): The file name recorded for byte payloads.
+        outputPaths (list): If given, shard i is also written to path i.
+        workers (int): Maximum number of covers embedded at once.
+
+    Returns:
+        list: The stego PNG bytes for each cover, in cover order.
+
+    Raises:
+        ValueError: If the payload exceeds the covers' combined capacity.
+    """
+
+    key = asSessionKey(key)
+    message = buildMessage(payload, name)
+    sizes = splitSizes(len(message), [shardCapacity(cover) for cover in covers])
+
+    setId = urandom(SHARDSETIDSIZE)
+    chunks = []
+    offset = 0
+    for size in sizes:
+        chunks.append(message[offset : offset + size])
+        offset += size
+
+    # PNG compression, blake3 and the NumPy scatter release the GIL, so
+    # threads keep every cover busy without pickling images across processes
+    with ThreadPoolExecutor(workers) as pool:
+        futures = [
+            pool.submit(encodeShard, cover, chunk, key, setId, index, len(covers))
+            for index, (cover, chunk) in enumerate(zip(covers, chunks))
+        ]
+        stegos = [future.result() for future in futures]
+
+    if outputPaths is not None:
+        for path, stego in zip(outputPaths, stegos):
+            with open(path, "wb") as f:
+                f.write(stego)
+
+    return stegos
+
+
+class ShardAssembler:
+    """
+    Collects shards in any order and joins them once every index is present.
+
+    Params:
+        key (str | SessionKey): The fingerprint used when encoding.
+    """
+
+    def __init__(self, key):
+        self.key = asSessionKey(key)
+        self.setId = None
+        self.total = None
+        self.chunks = {}
+
+    def add(self, stego):
+        """
+        Decodes one stego image and stores its shard.
+
+        Params:
+            stego (str | bytes | ndarray | Image): A shard image.
+
+        Returns:
+            int: The shard's index.
+
+        Raises:
+            ValueError: If the image holds no shard under this key, or a
+                shard from a different payload.
+        """
+
+        return self.addContainer(readContainer(stego, self.key))
+
+    def addContainer(self, container):
+        """
+        Stores a shard from a container already read with readContainer.
+
+        Params:
+            container (tuple): The (flags, payload) read from a shard image.
+
+        Returns:
+            int: The shard's index.
+
+        Raises:
+            ValueError: If the container is not a shard, its header is
+                truncated or invalid, it belongs to a different payload, or
+                its index was already received with different data.
+        """
+
+        if container is None or container[0] is None or not container[0] & FLAGSHARD:
+            raise ValueError("No shard could be found under this key")
+
+        payload = container[1]
+        if len(payload) < SHARDHEADER.size:
+            raise ValueError("Shard is too short to hold its header")
+        setId, index, total = SHARDHEADER.unpack_from(payload)
+        if total < 1 or not 0 <= index < total:
+            raise ValueError("Shard header is invalid")
+        if self.setId is None:
+            self.setId, self.total = setId, total
+        elif setId != self.setId or total != self.total:
+            raise ValueError("Shard belongs to a different payload")
+
+        chunk = decryptBytes(self.key, payload[SHARDHEADER.size :])
+        if self.chunks.get(index, chunk) != chunk:
+            raise ValueError(f"Shard {index} was received twice with different data")
+        self.chunks[index] = chunk
+        return index
+
+    @property
+    def complete(self):
+        return self.total is not None and len(self.chunks) == self.total
+
+    def missing(self):
+        """
+        Returns:
+            list: The shard indices not received yet.
+        """
+
+        if self.total is None:
+            return []
+        return [i for i in range(self.total) if i not in self.chunks]
+
+    def payload(self):
+        """
+        Joins the shards in index order.
+
+        Returns:
+            Payload: The reassembled payload.
+
+        Raises:
+            ValueError: If shards are still missing.
+        """
+
+        if not self.complete:
+            raise ValueError(f"Missing shards: {self.missing()}")
+        return parseMessage(b"".join(self.chunks[i] for i in range(self.total)))
+
+
+def decodeShards(stegos, key, workers=None):
+    """
+    Decodes shard images concurrently and joins them, whatever their order.
+
+    Params:
+        stegos (list): Shard images (paths, bytes, arrays or PIL images).
+        key (str | SessionKey): The fingerprint used when encoding.
+        workers (int): Maximum number of images decoded at once.
+
+    Returns:
+        Payload: The reassembled payload.
+
+    Raises:
+        ValueError: If an image holds no shard or shards are missing.
+    """
+
+    assembler = ShardAssembler(key)
+    with ThreadPoolExecutor(workers) as pool:
+        futures = [pool.submit(readContainer, stego, assembler.key) for stego in stegos]
+        for future in as_completed(futures):
+            assembler.addContainer(future.result())
+
+    return assembler.payload()
@@ -0,0 +1,324 @@
+# COMP6841 - Steganography Project Steganalysis File
+#
+# Statistical detection of LSB replacement, for checking inbound images for
+# hidden data. Each channel is analysed with three classic attacks, all
+# vectorized over NumPy arrays a band of rows at a time:
+#
+#   Chi-square attack: LSB replacement equalises the counts of each pair of
+#       values 2k and 2k + 1, so a histogram that fits those pair averages
+#       too well suggests embedding. Reported as a probability.
+#   RS analysis: flipping LSBs in small pixel groups makes them smoother or
+#       noisier in proportions that drift predictably with the embedding
+#       rate, which is recovered from a quadratic.
+#   Sample pair analysis: counts of adjacent sample pairs in related trace
+#       sets give a second quadratic estimate of the rate.
+#
+# Usage:
+#   python -m scripts.steganalysis --images DIR --workers 4
+#
+# One JSON line is printed per image, then a summary with the throughput in
+# megapixels per second.
+
+import argparse
+import json
+import math
+import os
+import sys
+import time
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from .batchRunner import imagePaths
+from .helpers import nativeImage, openImage
+from .instrumentation import stage
+
+# Samples analysed per band, bounding the temporary arrays for huge images
+BANDSAMPLES = 1 << 22
+
+# Histogram pairs with fewer expected samples are left out of the chi-square
+CHIMINEXPECTED = 5
+
+# Pixels per RS group, of which the middle two are flipped
+RSGROUP = 4
+
+MEGAPIXEL = 1_000_000
+
+# The analysis of one channel: the chi-square probability of embedding and
+# the RS and sample pair estimates of the fraction of samples embedded in,
+# with rate their mean
+ChannelAnalysis = namedtuple(
+    "ChannelAnalysis", ["band", "chiSquare", "rsRate", "spaRate", "rate"]
+)
+
+# The analysis of one image: its channels, the highest channel rate and the
+# seconds taken
+SteganalysisReport = namedtuple(
+    "SteganalysisReport", ["path", "megapixels", "channels", "rate", "seconds"]
+)
+
+# Totals over a scanned set of images
+ScanSummary = namedtuple(
+    "ScanSummary", ["images", "megapixels", "seconds", "megapixelsPerSecond"]
+)
+
+
+def channelBands(channel):
+    # Given a 2D channel array, yields it a band of whole rows at a time
+
+    rows = max(1, BANDSAMPLES // max(1, channel.shape[1]))
+    for start in range(0, channel.shape[0], rows):
+        yield channel[start : start + rows]
+
+
+def chiSquareSurvival(statistic, freedom):
+    # Given a chi-square statistic and its degrees of freedom, returns the
+    # probability of a value at least as large, using the Wilson-Hilferty
+    # normal approximation
+
+    scale = 2 / (9 * freedom)
+    z = ((statistic / freedom) ** (1 / 3) - (1 - scale)) / math.sqrt(scale)
+    return 0.5 * math.erfc(z / math.sqrt(2))
+
+
+def chiSquareAttack(histogram):
+    # Given a channel's histogram, returns the probability that its pairs of
+    # values were equalised by LSB replacement
+
+    pairs = histogram[: len(histogram) // 2 * 2].reshape(-1, 2).astype(np.float64)
+    expected = pairs.mean(axis=1)
+    kept = expected > CHIMINEXPECTED
+    freedom = int(kept.sum()) - 1
+    if freedom < 1:
+        return 0.0
+
+    statistic = (((pairs[kept, 0] - expected[kept]) ** 2) / expected[kept]).sum()
+    return chiSquareSurvival(statistic, freedom)
+
+
+def smallerRoot(a, b, c):
+    # Given the coefficients of a*x^2 + b*x + c, returns its real root of
+    # smallest magnitude. Near full embedding, sampling noise can push the
+    # discriminant just below zero, so the vertex stands in for the roots
+
+    if a == 0:
+        return None if b == 0 else -c / b
+    discriminant = b * b - 4 * a * c
+    if discriminant < 0:
+        return -b / (2 * a)
+    root = math.sqrt(discriminant)
+    return min((-b + root) / (2 * a), (-b - root) / (2 * a), key=abs)
+
+
+def clampRate(rate):
+    # Given an estimated rate or None, returns it clipped to [0, 1]
+
+    return 0.0 if rate is None else min(1.0, max(0.0, float(rate)))
+
+
+def workingType(channel):
+    # Given a channel array, returns a signed type wide enough for the
+    # differences and flips of its samples
+
+    return np.int16 if channel.dtype.itemsize == 1 else np.int32
+
+
+def flipPositive(values):
+    # Applies the F1 flip, 2k <-> 2k + 1
+
+    return values ^ 1
+
+
+def flipNegative(values):
+    # Applies the F-1 flip, 2k - 1 <-> 2k
+
+    return ((values + 1) ^ 1) - 1
+
+
+def rsCounts(x0, x1, x2, x3):
+    # Given the four samples of every RS group as separate arrays, returns
+    # the regular and singular group counts when the middle two are flipped
+    # with F1 and with F-1. Smoothness is the sum of absolute differences
+    # between neighbours, and working column-wise avoids any group copies
+
+    smoothness = np.abs(x1 - x0) + np.abs(x2 - x1) + np.abs(x3 - x2)
+    counts = []
+    for flip in (flipPositive, flipNegative):
+        y1, y2 = flip(x1), flip(x2)
+        changed = np.abs(y1 - x0) + np.abs(y2 - y1) + np.abs(x3 - y2)
+        counts.append(int(np.count_nonzero(changed > smoothness)))
+        counts.append(int(np.count_nonzero(changed < smoothness)))
+    return counts
+
+
+def rsAnalysis(channel):
+    # Given a 2D channel array, returns the RS estimate of the fraction of its
+    # samples carrying embedded bits, from horizontal groups of RSGROUP
+
+    usable = channel.shape[1] // RSGROUP * RSGROUP
+    totals = np.zeros(8, dtype=np.int64)
+    groupCount = 0
+    for band in channelBands(channel):
+        groups = band[:, :usable].astype(workingType(channel))
+        columns = [groups[:, offset::RSGROUP] for offset in range(RSGROUP)]
+        totals[:4] += rsCounts(*columns)
+        totals[4:] += rsCounts(*(flipPositive(column) for column in columns))
+        groupCount += columns[0].size
+    if groupCount == 0:
+        return 0.0
+
+    regular, singular, regularNeg, singularNeg = totals[:4] / groupCount
+    regularFlip, singularFlip, regularNegFlip, singularNegFlip = totals[4:] / groupCount
+
+    d0 = regular - singular
+    d1 = regularFlip - singularFlip
+    dNeg0 = regularNeg - singularNeg
+    dNeg1 = regularNegFlip - singularNegFlip
+
+    x = smallerRoot(2 * (d1 + d0), dNeg0 - dNeg1 - d1 - 3 * d0, d0 - dNeg0)
+    if x is None or x == 0.5:
+        return 0.0
+    return clampRate(x / (x - 0.5))
+
+
+def samplePairAnalysis(channel):
+    # Given a 2D channel array, returns the sample pair estimate of the
+    # fraction of its samples carrying embedded bits, from horizontally
+    # adjacent pairs (u, v)
+
+    closer = further = sameTrace = pairs = 0
+    for band in channelBands(channel):
+        band = band.astype(workingType(channel))
+        u, v = band[:, :-1], band[:, 1:]
+        # Positive when v is even and above u or odd and below it
+        direction = (v - u) * (1 - 2 * (v & 1))
+        closer += int(np.count_nonzero(direction > 0))
+        further += int(np.count_nonzero(direction < 0))
+        sameTrace += int(np.count_nonzero((u >> 1) == (v >> 1)))
+        pairs += u.size
+    if sameTrace == 0:
+        return 0.0
+
+    rate = smallerRoot(sameTrace / 2, 2 * closer - pairs, further - closer)
+    return clampRate(rate)
+
+
+def analyseChannel(band, channel):
+    # Given a band name and its 2D sample array, runs all three attacks
+
+    levels = 1 << (8 * channel.dtype.itemsize)
+    histogram = np.zeros(levels, dtype=np.int64)
+    for rows in channelBands(channel):
+        histogram += np.bincount(rows.reshape(-1), minlength=levels)
+
+    rsRate = rsAnalysis(channel)
+    spaRate = samplePairAnalysis(channel)
+    return ChannelAnalysis(
+        band, chiSquareAttack(histogram), rsRate, spaRate, (rsRate + spaRate) / 2
+    )
+
+
+def analyseImage(source):
+    """
+    Estimates how much of each channel of an image carries LSB-embedded data.
+
+    Params:
+        source (str | bytes | ndarray | Image): The image to analyse.
+
+    Returns:
+        SteganalysisReport: Per-channel chi-square probabilities and RS and
+        sample pair rate estimates, and the highest channel rate.
+    """
+
+    start = time.perf_counter()
+    with stage("steganalysis"):
+        im = nativeImage(openImage(source))
+        pixels = np.asarray(im)
+        if pixels.ndim == 2:
+            pixels = pixels[:, :, None]
+
+        channels = tuple(
+            analyseChannel(band, pixels[:, :, index])
+            for index, band in enumerate(im.getbands())
+        )
+
+    height, width = pixels.shape[:2]
+    return SteganalysisReport(
+        source if isinstance(source, str) else None,
+        width * height / MEGAPIXEL,
+        channels,
+        max(channel.rate for channel in channels),
+        time.perf_counter() - start,
+    )
+
+
+def analyseJob(path):
+    # Given an image path, returns its report, or None if it cannot be read.
+    # Runs in a pool worker
+
+    try:
+        return analyseImage(path)
+    except (OSError, ValueError):
+        return None
+
+
+def scanImages(paths, workers=None):
+    """
+    Analyses many images on a process pool.
+
+    Params:
+        paths (list[str]): The image files.
+        workers (int): The number of pool processes.
+
+    Returns:
+        tuple[list[SteganalysisReport], ScanSummary]: A report per readable
+        image, in the order of paths, and the totals with throughput.
+    """
+
+    start = time.perf_counter()
+    with ProcessPoolExecutor(workers) as pool:
+        reports = [report for report in pool.map(analyseJob, paths) if report]
+
+    elapsed = time.perf_counter() - start
+    megapixels = sum(report.megapixels for report in reports)
+    summary = ScanSummary(
+        len(reports),
+        round(megapixels, 3),
+        round(elapsed, 3),
+        round(megapixels / elapsed, 2) if elapsed else None,
+    )
+    return reports, summary
+
+
+def reportRecord(report):
+    # Given a SteganalysisReport, returns it as a JSON-ready dict
+
+    record = report._asdict()
+    record["channels"] = [channel._asdict() for channel in report.channels]
+    return record
+
+
+def parseArguments(argv):
+    parser = argparse.ArgumentParser(
+        prog="python -m scripts.steganalysis",
+        description="Scan images for signs of LSB embedding.",
+    )
+    parser.add_argument(
+        "--images", nargs="+", required=True, help="image files or directories"
+    )
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parseArguments(argv)
+    reports, summary = scanImages(imagePaths(args.images), args.workers)
+    for report in reports:
+        print(json.dumps(reportRecord(report)))
+    print(json.dumps(summary._asdict()))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
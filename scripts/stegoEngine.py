@@ -0,0 +1,227 @@
+# COMP6841 - Steganography Project Engine File
+#
+# Headless encode and decode API. Nothing here prints, prompts or writes to
+# disk unless an output path is passed, so the tool can be embedded in other
+# services and measured without a TTY.
+
+import io
+from collections import namedtuple
+
+from .formats import DEFAULTFORMAT, formatFor, readImage, writeImage
+from .helpers import (
+    DEFAULTHEADER,
+    EXTHEADER,
+    FLAGALPHA,
+    RGBCHANNELS,
+    asSessionKey,
+    containerFlags,
+    coverLimit,
+    dataEncoder,
+    embedLSBBits,
+    extractName,
+    extractPayload,
+    flagsLSBCount,
+    generateSecureSample,
+    positionsFor,
+)
+from .instrumentation import stage, traced
+from .pngStreams import DEFAULTPROFILE
+
+TEXTPAYLOAD = "text"
+FILEPAYLOAD = "file"
+
+DEFAULTPAYLOADNAME = "payload.bin"
+
+# A decoded message: kind is TEXTPAYLOAD or FILEPAYLOAD, name is the original
+# file name (None for text) and data holds the raw bytes
+Payload = namedtuple("Payload", ["kind", "name", "data"])
+
+
+def buildMessage(payload, name=None):
+    """
+    Wraps a payload in the message format stored inside the container.
+
+    Params:
+        payload (str | bytes | Payload): Text is stored as a text message,
+            bytes as a file message.
+        name (str): The file name recorded for byte payloads.
+
+    Returns:
+        bytes: The message ready for encryption.
+    """
+
+    if isinstance(payload, Payload):
+        if payload.kind == TEXTPAYLOAD:
+            return (EXTHEADER + DEFAULTHEADER).encode() + payload.data
+        name, payload = payload.name, payload.data
+
+    if isinstance(payload, str):
+        return (EXTHEADER + DEFAULTHEADER + payload).encode()
+
+    name = name or DEFAULTPAYLOADNAME
+    return f"{EXTHEADER}${name}$".encode() + bytes(payload)
+
+
+def parseMessage(message):
+    """
+    Splits a decrypted message into its kind, file name and data.
+
+    Params:
+        message (bytes): The decrypted message.
+
+    Returns:
+        Payload: The structured message.
+    """
+
+    textHeader = (EXTHEADER + DEFAULTHEADER).encode()
+    if message.startswith(textHeader):
+        return Payload(TEXTPAYLOAD, None, message[len(textHeader) :])
+
+    name = extractName(message)
+    start = len(EXTHEADER) + len(name.encode()) + 2
+    return Payload(FILEPAYLOAD, name, message[start:])
+
+
+def encodeBits(message, key, compress=True, lsbCount=1, useAlpha=False, iv=None):
+    """
+    Compresses and encrypts a message and wraps it in a container.
+
+    Params:
+        message (bytes): The message from buildMessage.
+        key (str | SessionKey): The fingerprint used to encrypt and embed.
+        compress (bool): Whether to try compressing the message first.
+        lsbCount (int): Low bits written per channel, from 1 to 4. Deeper
+            embedding holds more per pixel but is easier to detect.
+        useAlpha (bool): Whether the bits also go in the alpha channel of
+            LA and RGBA covers.
+        iv (bytes): The AES IV. Defaults to a fresh random one, which should
+            only be overridden to keep an updated container close to the
+            one it replaces.
+
+    Returns:
+        ndarray: The container as an array of bits.
+    """
+
+    key = asSessionKey(key)
+    return dataEncoder(message, key.hash, key, compress, lsbCount, useAlpha, iv)
+
+
+def embedEncodedBits(cover, bits, key):
+    """
+    Embeds container bits into a cover at the key's permuted positions, at
+    the LSB depth and alpha use recorded in the container header. The cover
+    keeps its own mode and sample depth.
+
+    Params:
+        cover (str | bytes | ndarray | Image): The cover image.
+        bits (ndarray): The container bits from encodeBits.
+        key (str | SessionKey): The fingerprint used to embed.
+
+    Returns:
+        Image: The stego image.
+
+    Raises:
+        ValueError: If the bits exceed the cover's capacity, or alpha is
+            requested for a cover without it.
+    """
+
+    with stage("image decode"):
+        im = readImage(cover)
+        im.load()
+
+    flags = containerFlags(bits)
+    lsbCount = flagsLSBCount(flags)
+    useAlpha = bool(flags & FLAGALPHA)
+    encodeLimit = coverLimit(im, useAlpha)
+    positions = positionsFor(len(bits), lsbCount)
+    if positions > encodeLimit - RGBCHANNELS:
+        raise ValueError(
+            f"Payload needs {len(bits)} bits but the cover holds "
+            f"{encodeLimit * lsbCount} at {lsbCount} bits per channel"
+        )
+
+    fingerprint = asSessionKey(key).fingerprint
+    mapping = generateSecureSample(fingerprint, encodeLimit, positions)
+    return embedLSBBits(im, mapping, bits, lsbCount, useAlpha)
+
+
+@traced("encode")
+def encode(
+    cover,
+    payload,
+    key,
+    name=None,
+    outputPath=None,
+    compress=True,
+    lsbCount=1,
+    useAlpha=False,
+    pngProfile=DEFAULTPROFILE,
+    outputFormat=None,
+):
+    """
+    Hides a payload inside a cover image.
+
+    Params:
+        cover (str | bytes | ndarray | Image): The cover image.
+        payload (str | bytes | Payload): The information to hide.
+        key (str | SessionKey): The fingerprint used to encrypt and embed.
+        name (str): The file name recorded for byte payloads.
+        outputPath (str): If given, the stego image is also written here.
+        compress (bool): Whether to try compressing the message first.
+        lsbCount (int): Low bits written per channel, from 1 to 4.
+        useAlpha (bool): Whether to also embed in the alpha channel.
+        pngProfile (str): The PNG output profile: "fast", "balanced" or
+            "small".
+        outputFormat (str): A registered lossless format, see
+            formats.formatRegistry. Defaults to the format outputPath's
+            extension selects, or PNG.
+
+    Returns:
+        bytes: The encoded stego image, in the cover's mode.
+
+    Raises:
+        ValueError: If the payload exceeds the cover's capacity, or the
+            output format cannot store the cover's mode exactly.
+    """
+
+    if outputFormat is None and outputPath is not None:
+        adapter = formatFor(outputPath)
+        outputFormat = None if adapter is None else adapter.name
+
+    message = buildMessage(payload, name)
+    bits = encodeBits(message, key, compress, lsbCount, useAlpha)
+    stego = embedEncodedBits(cover, bits, key)
+
+    with stage("image encode"):
+        buffer = io.BytesIO()
+        writeImage(stego, buffer, outputFormat or DEFAULTFORMAT, pngProfile)
+        stegoBytes = buffer.getvalue()
+
+    if outputPath is not None:
+        with open(outputPath, "wb") as f:
+            f.write(stegoBytes)
+
+    return stegoBytes
+
+
+@traced("decode")
+def decode(stego, key):
+    """
+    Recovers a payload hidden in a stego image.
+
+    Params:
+        stego (str | bytes | ndarray | Image): The stego image.
+        key (str | SessionKey): The fingerprint used when encoding.
+
+    Returns:
+        Payload: The decoded payload, or None if nothing is embedded under
+        this key.
+
+    Raises:
+        ValueError: If the image is not in a registered lossless format.
+    """
+
+    message = extractPayload(readImage(stego), key)
+    if message is None:
+        return None
+    return parseMessage(message)
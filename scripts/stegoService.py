@@ -0,0 +1,641 @@
+# COMP6841 - Steganography Project Service File
+#
+# A local HTTP service for encoding and decoding, so other processes can call
+# the tool without paying interpreter start-up and imports on every job. It
+# listens on a TCP port or a Unix socket, spools each upload to disk a chunk
+# at a time, hands the CPU-bound work to a process pool through a bounded
+# queue, and streams the result file back. When the queue is full, requests
+# are turned away with 503 before their upload is read.
+#
+# Usage:
+#   python -m scripts.stegoService --port 8641 --workers 4 --queue 16
+#   python -m scripts.stegoService --socket /tmp/stego.sock
+#
+# Endpoints:
+#   POST /encode?name=NAME&lsb=1&format=png&profile=balanced
+#       The body is the cover image followed by the payload, with the cover's
+#       length in X-Cover-Length. Pass kind=text to embed the payload as
+#       UTF-8 text. Responds with the stego image.
+#   POST /decode
+#       The body is the stego image. Responds with the payload, its kind and
+#       percent-encoded file name in X-Payload-Kind and X-Payload-Name, or 404.
+#   GET /metrics
+#       Queue depth, jobs in flight, request counts and latency percentiles
+#       as JSON.
+#
+# Both POST endpoints take the fingerprint in X-Stego-Key.
+
+import argparse
+import asyncio
+import json
+import os
+import shutil
+import signal
+import sys
+import tempfile
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from urllib.parse import parse_qs, quote, urlsplit
+
+import numpy as np
+from PIL import UnidentifiedImageError
+
+from .formats import DEFAULTFORMAT, getFormat
+from .instrumentation import enableInstrumentation
+from .pngStreams import DEFAULTPROFILE
+from .stegoEngine import FILEPAYLOAD, TEXTPAYLOAD, encode
+from .streaming import STREAMCHUNK, decodeStream
+
+DEFAULTHOST = "127.0.0.1"
+DEFAULTPORT = 8641
+DEFAULTQUEUE = 16
+
+MAXHEADER = 1 << 16
+MAXUPLOAD = 1 << 30
+
+# Recent request latencies kept per endpoint for the percentiles in /metrics
+LATENCYWINDOW = 1024
+LATENCYPERCENTILES = (50, 90, 99)
+
+ENCODEPATH = "/encode"
+DECODEPATH = "/decode"
+METRICSPATH = "/metrics"
+
+KEYHEADER = "x-stego-key"
+COVERLENGTHHEADER = "x-cover-length"
+
+STATUSTEXT = {
+    200: "OK",
+    400: "Bad Request",
+    404: "Not Found",
+    405: "Method Not Allowed",
+    411: "Length Required",
+    413: "Payload Too Large",
+    500: "Internal Server Error",
+    503: "Service Unavailable",
+}
+
+CONTENTTYPES = {
+    "png": "image/png",
+    "bmp": "image/bmp",
+    "tiff": "image/tiff",
+    "tiff-lzw": "image/tiff",
+    "webp": "image/webp",
+}
+BINARYTYPE = "application/octet-stream"
+TEXTTYPE = "text/plain; charset=utf-8"
+JSONTYPE = "application/json"
+
+
+class RequestError(Exception):
+    """
+    A request the service refuses, carrying the HTTP status to answer with.
+
+    Params:
+        status (int): The HTTP status code.
+        message (str): The reason given to the client.
+    """
+
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+def runEncodeJob(job):
+    # Given an encode job of spooled file paths, embeds the payload and writes
+    # the stego image to the job's output path. Runs in a pool worker
+
+    with open(job["payload"], "rb") as f:
+        payload = f.read()
+    if job["kind"] == TEXTPAYLOAD:
+        payload = payload.decode("utf-8")
+
+    encode(
+        job["cover"],
+        payload,
+        job["key"],
+        name=job["name"],
+        outputPath=job["output"],
+        lsbCount=job["lsbCount"],
+        pngProfile=job["pngProfile"],
+        outputFormat=job["format"],
+    )
+    return {"output": job["output"]}
+
+
+def runDecodeJob(job):
+    # Given a decode job of spooled file paths, writes the recovered payload
+    # to the job's output path. Runs in a pool worker
+
+    result = decodeStream(job["stego"], job["key"], job["output"])
+    if result is None:
+        return None
+    return {"output": job["output"], "kind": result.kind, "name": result.name}
+
+
+def warmWorker():
+    # Does nothing, so submitting it starts a pool worker ahead of the first
+    # request
+
+    return os.getpid()
+
+
+def latencySummary(latencies):
+    # Given recent latencies in seconds, returns their count and percentiles
+    # in milliseconds
+
+    summary = {"count": len(latencies)}
+    if latencies:
+        values = np.percentile(np.fromiter(latencies, float), LATENCYPERCENTILES)
+        for percentile, value in zip(LATENCYPERCENTILES, values):
+            summary[f"p{percentile}Ms"] = round(float(value) * 1000, 2)
+    return summary
+
+
+class StegoService:
+    """
+    The service's state: the process pool, the bounded job queue, the
+    dispatchers feeding one to the other, and the request metrics.
+
+    Params:
+        workers (int): The number of pool processes.
+        queueLimit (int): The most jobs that may wait for a worker.
+        tracePath (str): If given, workers append a stage trace per job here.
+    """
+
+    def __init__(self, workers=None, queueLimit=DEFAULTQUEUE, tracePath=None):
+        self.workers = workers or os.cpu_count()
+        self.queueLimit = queueLimit
+        self.tracePath = tracePath
+        self.queue = None
+        self.pool = None
+        self.dispatchers = []
+        self.spoolDirectory = None
+        self.inFlight = 0
+        self.started = time.time()
+        self.endpoints = {
+            path: {
+                "completed": 0,
+                "notFound": 0,
+                "failed": 0,
+                "rejected": 0,
+                "latencies": deque(maxlen=LATENCYWINDOW),
+            }
+            for path in (ENCODEPATH, DECODEPATH)
+        }
+
+    async def start(self):
+        """
+        Starts the pool workers and the dispatchers.
+
+        Returns:
+            None
+        """
+
+        initializer, initargs = None, ()
+        if self.tracePath is not None:
+            initializer, initargs = enableInstrumentation, (None, None, self.tracePath)
+
+        self.pool = ProcessPoolExecutor(
+            self.workers, initializer=initializer, initargs=initargs
+        )
+        loop = asyncio.get_running_loop()
+        await asyncio.gather(
+            *(loop.run_in_executor(self.pool, warmWorker) for _ in range(self.workers))
+        )
+
+        self.queue = asyncio.Queue(self.queueLimit)
+        self.spoolDirectory = tempfile.mkdtemp(prefix="stegoService-")
+        self.dispatchers = [
+            asyncio.create_task(self.dispatch()) for _ in range(self.workers)
+        ]
+
+    async def stop(self):
+        """
+        Stops the dispatchers and the pool, and removes any spooled files.
+
+        Returns:
+            None
+        """
+
+        for dispatcher in self.dispatchers:
+            dispatcher.cancel()
+        await asyncio.gather(*self.dispatchers, return_exceptions=True)
+        self.pool.shutdown(cancel_futures=True)
+        shutil.rmtree(self.spoolDirectory, ignore_errors=True)
+
+    async def dispatch(self):
+        # Hands queued jobs to the pool one at a time, so at most one job per
+        # worker is ever in flight and the rest wait in the bounded queue
+
+        loop = asyncio.get_running_loop()
+        while True:
+            function, job, future = await self.queue.get()
+            self.inFlight += 1
+            try:
+                result = await loop.run_in_executor(self.pool, function, job)
+            except Exception as error:
+                if not future.done():
+                    future.set_exception(error)
+            else:
+                if not future.done():
+                    future.set_result(result)
+            finally:
+                self.inFlight -= 1
+                self.queue.task_done()
+
+    async def submit(self, function, job):
+        # Given a pool function and its job, queues it and returns its result,
+        # raising RequestError 503 if the queue is full
+
+        future = asyncio.get_running_loop().create_future()
+        try:
+            self.queue.put_nowait((function, job, future))
+        except asyncio.QueueFull:
+            raise RequestError(503, "Job queue is full, retry later")
+        return await future
+
+    def metrics(self):
+        """
+        Reports the queue, the workers and per-endpoint request statistics.
+
+        Returns:
+            dict: The metrics, with latencies in milliseconds.
+        """
+
+        endpoints = {}
+        for path, counters in self.endpoints.items():
+            endpoints[path.lstrip("/")] = {
+                "completed": counters["completed"],
+                "notFound": counters["notFound"],
+                "failed": counters["failed"],
+                "rejected": counters["rejected"],
+                "latency": latencySummary(counters["latencies"]),
+            }
+
+        return {
+            "queueDepth": self.queue.qsize(),
+            "queueLimit": self.queueLimit,
+            "inFlight": self.inFlight,
+            "workers": self.workers,
+            "uptimeSeconds": round(time.time() - self.started, 1),
+            "endpoints": endpoints,
+        }
+
+    def spoolPath(self, suffix=""):
+        # Returns a fresh path in the spool directory
+
+        handle, path = tempfile.mkstemp(suffix=suffix, dir=self.spoolDirectory)
+        os.close(handle)
+        return path
+
+    async def handleConnection(self, reader, writer):
+        # Serves requests on one connection until the client closes it or a
+        # response has to close it
+
+        try:
+            keepAlive = True
+            while keepAlive:
+                try:
+                    head = await reader.readuntil(b"\r\n\r\n")
+                except asyncio.IncompleteReadError:
+                    break
+                except asyncio.LimitOverrunError:
+                    await sendResponse(writer, 400, "Request header too large")
+                    break
+                keepAlive = await self.handleRequest(head, reader, writer)
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def handleRequest(self, head, reader, writer):
+        # Given a request's head, reads its body, routes it and sends the
+        # response. Returns whether the connection may be kept open
+
+        try:
+            method, target, headers = parseHead(head)
+        except RequestError as error:
+            await sendResponse(writer, error.status, str(error), close=True)
+            return False
+        url = urlsplit(target)
+        query = {key: values[-1] for key, values in parse_qs(url.query).items()}
+        keepAlive = headers.get("connection", "").lower() != "close"
+
+        if url.path == METRICSPATH and method == "GET":
+            await sendJSON(writer, 200, self.metrics(), keepAlive)
+            return keepAlive
+
+        routes = {ENCODEPATH: self.serveEncode, DECODEPATH: self.serveDecode}
+        if url.path not in routes:
+            await sendResponse(writer, 404, "Unknown endpoint", close=True)
+            return False
+        if method != "POST":
+            await sendResponse(writer, 405, "Use POST", close=True)
+            return False
+
+        counters = self.endpoints[url.path]
+        start = time.perf_counter()
+        spooled = []
+        try:
+            # Turn the request away before reading an upload that cannot be
+            # queued; the unread body means the connection must close
+            if self.queue.full():
+                raise RequestError(503, "Job queue is full, retry later")
+
+            length = bodyLength(headers)
+            key = headers.get(KEYHEADER)
+            if not key:
+                raise RequestError(400, "Missing X-Stego-Key header")
+            response = await routes[url.path](
+                reader, headers, query, key, length, spooled
+            )
+        except RequestError as error:
+            removeFiles(spooled)
+            if error.status == 404:
+                # A decode that finds nothing under the key was still served,
+                # and its body has been read in full
+                counters["notFound"] += 1
+                counters["latencies"].append(time.perf_counter() - start)
+                await sendResponse(writer, 404, str(error), close=not keepAlive)
+                return keepAlive
+
+            if error.status == 503:
+                counters["rejected"] += 1
+            else:
+                counters["failed"] += 1
+            await sendResponse(writer, error.status, str(error), close=True)
+            return False
+        except Exception as error:
+            counters["failed"] += 1
+            removeFiles(spooled)
+            logFailure(url.path, error)
+            await sendResponse(writer, 500, "Internal server error", close=True)
+            return False
+
+        status, contentType, extraHeaders, path = response
+        try:
+            await sendFile(writer, status, contentType, extraHeaders, path, keepAlive)
+        finally:
+            removeFiles(spooled)
+
+        counters["completed"] += 1
+        counters["latencies"].append(time.perf_counter() - start)
+        return keepAlive
+
+    async def serveEncode(self, reader, headers, query, key, length, spooled):
+        # Spools the cover and payload, embeds on the pool and returns the
+        # response for the stego image
+
+        try:
+            coverLength = int(headers[COVERLENGTHHEADER])
+        except (KeyError, ValueError):
+            raise RequestError(400, "Missing or invalid X-Cover-Length header")
+        if not 0 < coverLength <= length:
+            raise RequestError(400, "X-Cover-Length exceeds the request body")
+
+        kind = query.get("kind", FILEPAYLOAD)
+        if kind not in (FILEPAYLOAD, TEXTPAYLOAD):
+            raise RequestError(400, f"Unknown payload kind {kind!r}")
+        if hasControlCharacters(query.get("name", "")):
+            raise RequestError(400, "Payload names cannot hold control characters")
+        try:
+            lsbCount = int(query.get("lsb", 1))
+            adapter = getFormat(query.get("format", DEFAULTFORMAT))
+        except ValueError as error:
+            raise RequestError(400, str(error))
+
+        coverPath = self.spoolPath()
+        payloadPath = self.spoolPath()
+        outputPath = self.spoolPath(adapter.extensions[0] if adapter.extensions else "")
+        spooled.extend((coverPath, payloadPath, outputPath))
+
+        await spoolBody(reader, coverPath, coverLength)
+        await spoolBody(reader, payloadPath, length - coverLength)
+
+        job = {
+            "cover": coverPath,
+            "payload": payloadPath,
+            "output": outputPath,
+            "key": key,
+            "kind": kind,
+            "name": query.get("name") if kind == FILEPAYLOAD else None,
+            "lsbCount": lsbCount,
+            "pngProfile": query.get("profile", DEFAULTPROFILE),
+            "format": adapter.name,
+        }
+        try:
+            await self.submit(runEncodeJob, job)
+        except (ValueError, UnidentifiedImageError) as error:
+            logFailure(ENCODEPATH, error)
+            raise RequestError(400, "The cover could not be encoded")
+
+        extraHeaders = {"X-Output-Format": adapter.name}
+        return 200, CONTENTTYPES.get(adapter.name, BINARYTYPE), extraHeaders, outputPath
+
+    async def serveDecode(self, reader, headers, query, key, length, spooled):
+        # Spools the stego image, decodes on the pool and returns the response
+        # for the recovered payload
+
+        stegoPath = self.spoolPath()
+        outputPath = self.spoolPath()
+        spooled.extend((stegoPath, outputPath))
+        await spoolBody(reader, stegoPath, length)
+
+        job = {"stego": stegoPath, "output": outputPath, "key": key}
+        try:
+            result = await self.submit(runDecodeJob, job)
+        except (ValueError, UnidentifiedImageError) as error:
+            logFailure(DECODEPATH, error)
+            raise RequestError(400, "The image could not be decoded")
+        if result is None:
+            raise RequestError(404, "No information could be found")
+
+        contentType = TEXTTYPE if result["kind"] == TEXTPAYLOAD else BINARYTYPE
+        extraHeaders = {"X-Payload-Kind": result["kind"]}
+        if result["name"]:
+            # The name comes from the image, so it is encoded to keep it from
+            # adding header lines of its own
+            extraHeaders["X-Payload-Name"] = quote(result["name"], safe="")
+        return 200, contentType, extraHeaders, outputPath
+
+
+def parseHead(head):
+    # Given a request's head bytes, returns its method, target and headers
+    # with lower-case names, raising RequestError for a malformed request line
+
+    lines = head.decode("utf-8", "replace").split("\r\n")
+    try:
+        method, target, _ = lines[0].split(" ", 2)
+    except ValueError:
+        raise RequestError(400, "Malformed request line")
+
+    headers = {}
+    for line in lines[1:]:
+        if ":" in line:
+            name, value = line.split(":", 1)
+            headers[name.strip().lower()] = value.strip()
+    return method, target, headers
+
+
+def bodyLength(headers):
+    # Given request headers, returns the body's length, raising RequestError
+    # if it is missing, chunked or too large
+
+    if "transfer-encoding" in headers or "content-length" not in headers:
+        raise RequestError(411, "Send the body with a Content-Length")
+    try:
+        length = int(headers["content-length"])
+    except ValueError:
+        raise RequestError(400, "Invalid Content-Length")
+    if length > MAXUPLOAD:
+        raise RequestError(413, f"Uploads are limited to {MAXUPLOAD} bytes")
+    return length
+
+
+async def spoolBody(reader, path, length):
+    # Copies the next 'length' bytes of the request body into a file, a chunk
+    # at a time, raising RequestError if the client stops early
+
+    with open(path, "wb") as f:
+        remaining = length
+        while remaining:
+            chunk = await reader.read(min(STREAMCHUNK, remaining))
+            if not chunk:
+                raise RequestError(400, "Request body ended early")
+            f.write(chunk)
+            remaining -= len(chunk)
+
+
+def hasControlCharacters(text):
+    # Given a string, returns whether it holds any ASCII control character
+
+    return any(ord(character) < 0x20 or ord(character) == 0x7F for character in text)
+
+
+def logFailure(path, error):
+    # Given an endpoint and the error a request failed with, logs the detail
+    # server-side. Job errors can name spool files, so clients only ever get
+    # a generic message
+
+    print(f"{path} failed: {type(error).__name__}: {error}", file=sys.stderr)
+
+
+def removeFiles(paths):
+    # Deletes spooled files, ignoring any already gone
+
+    for path in paths:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+def responseHead(status, contentType, length, headers=None, close=False):
+    # Returns the encoded status line and headers of a response
+
+    lines = [f"HTTP/1.1 {status} {STATUSTEXT[status]}"]
+    lines.append(f"Content-Type: {contentType}")
+    lines.append(f"Content-Length: {length}")
+    if status == 503:
+        lines.append("Retry-After: 1")
+    for name, value in (headers or {}).items():
+        lines.append(f"{name}: {value}")
+    lines.append(f"Connection: {'close' if close else 'keep-alive'}")
+    return ("\r\n".join(lines) + "\r\n\r\n").encode("utf-8")
+
+
+async def sendResponse(writer, status, message, close=False):
+    # Sends a short plain-text response
+
+    body = (message + "\n").encode("utf-8")
+    writer.write(responseHead(status, TEXTTYPE, len(body), close=close) + body)
+    await writer.drain()
+
+
+async def sendJSON(writer, status, data, keepAlive=True):
+    # Sends a JSON response
+
+    body = json.dumps(data).encode("utf-8")
+    head = responseHead(status, JSONTYPE, len(body), close=not keepAlive)
+    writer.write(head + body)
+    await writer.drain()
+
+
+async def sendFile(writer, status, contentType, headers, path, keepAlive=True):
+    # Streams a file back as the response body a chunk at a time
+
+    length = os.path.getsize(path)
+    writer.write(responseHead(status, contentType, length, headers, not keepAlive))
+    with open(path, "rb") as f:
+        while chunk := f.read(STREAMCHUNK):
+            writer.write(chunk)
+            await writer.drain()
+    await writer.drain()
+
+
+async def serve(args):
+    # Starts the service and serves until SIGINT or SIGTERM, then stops the
+    # pool so no worker processes are left behind
+
+    service = StegoService(args.workers, args.queue, args.trace)
+    await service.start()
+
+    if args.socket is not None:
+        server = await asyncio.start_unix_server(
+            service.handleConnection, args.socket, limit=MAXHEADER
+        )
+        address = args.socket
+    else:
+        server = await asyncio.start_server(
+            service.handleConnection, args.host, args.port, limit=MAXHEADER
+        )
+        address = f"http://{args.host}:{args.port}"
+
+    print(
+        f"Serving on {address} with {service.workers} workers "
+        f"and a queue of {service.queueLimit}",
+        file=sys.stderr,
+    )
+    stopping = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(signum, stopping.set)
+
+    try:
+        async with server:
+            await stopping.wait()
+    finally:
+        await service.stop()
+        if args.socket is not None and os.path.exists(args.socket):
+            os.remove(args.socket)
+
+
+def parseArguments(argv):
+    parser = argparse.ArgumentParser(
+        prog="python -m scripts.stegoService",
+        description="Serve encode and decode requests over HTTP.",
+    )
+    parser.add_argument("--host", default=DEFAULTHOST)
+    parser.add_argument("--port", type=int, default=DEFAULTPORT)
+    parser.add_argument("--socket", help="listen on this Unix socket instead")
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument(
+        "--queue",
+        type=int,
+        default=DEFAULTQUEUE,
+        help="jobs that may wait for a worker before requests are refused",
+    )
+    parser.add_argument("--trace", help="JSON Lines file for per-stage job traces")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parseArguments(argv)
+    asyncio.run(serve(args))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
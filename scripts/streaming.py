@@ -0,0 +1,408 @@
+# COMP6841 - Steganography Project Streaming File
+#
+# Encodes and decodes file payloads a chunk at a time. The payload is read,
+# encrypted and scattered into the cover in fixed-size chunks, and decoding
+# gathers, decrypts and writes it back out the same way, so the payload bytes
+# are never held in memory whole. Memory is not constant, though: the whole
+# cover is decoded into one array, and the permutation holds a 32-bit
+# position for every payload bit, so peak use is O(cover + 32 x payload)
+# bytes. The container written is identical to the one stegoEngine.encode
+# produces and either side can read the other's images.
+#
+# Usage:
+#   python -m scripts.streaming encode --cover IMG --payload FILE --key K --output OUT
+#   python -m scripts.streaming decode --stego IMG --key K --output FILE
+#
+# Pass "-" as the payload to read stdin, or as the decode output to write to
+# stdout. Stdin is spooled to a temporary file first, since the container
+# header records the payload length before any payload bits. Streamed payloads
+# are embedded uncompressed, but compressed containers decode a chunk at a time.
+
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+from collections import namedtuple
+from os import urandom
+
+import numpy as np
+from PIL import Image
+
+from .formats import copyMetadata, readImage, writeImage
+from .helpers import (
+    BYTETOBIT,
+    CONTAINERHEADER,
+    CONTAINERMAGIC,
+    CODECMASK,
+    CODECNONE,
+    CODECSHIFT,
+    CONTAINERVERSION,
+    DEFAULTHEADER,
+    EXTHEADER,
+    FLAGRAWPAYLOAD,
+    FLAGSHARD,
+    HASHHALF,
+    IVSIZE,
+    RGBCHANNELS,
+    aesCipher,
+    asSessionKey,
+    channelPlane,
+    flagsLSBCount,
+    generateSecureSample,
+    loadChannels,
+    mappingToOffsets,
+    payloadDecompressor,
+    planeLimit,
+    positionsFor,
+    readContainerHeader,
+    readLSBRange,
+)
+from .instrumentation import stage, traced
+from .pngStreams import DEFAULTPROFILE, PNGPROFILES
+from .stegoEngine import (
+    DEFAULTPAYLOADNAME,
+    FILEPAYLOAD,
+    TEXTPAYLOAD,
+    buildMessage,
+    decode,
+    parseMessage,
+)
+
+STREAMCHUNK = 1 << 20
+
+STDIO = "-"
+
+# The outcome of a streamed decode: kind and name as in stegoEngine.Payload,
+# and the number of payload bytes written
+StreamedPayload = namedtuple("StreamedPayload", ["kind", "name", "length"])
+
+
+def openSource(source):
+    # Given a payload path, "-" or a binary file object, returns a readable
+    # binary file, its length in bytes and whether the caller must close it.
+    # Unseekable streams are spooled to a temporary file to learn the length
+
+    if isinstance(source, str) and source != STDIO:
+        f = open(source, "rb")
+        return f, os.fstat(f.fileno()).st_size, True
+
+    stream = sys.stdin.buffer if source == STDIO else source
+    if stream.seekable():
+        start = stream.tell()
+        length = stream.seek(0, os.SEEK_END) - start
+        stream.seek(start)
+        return stream, length, False
+
+    spool = tempfile.TemporaryFile()
+    shutil.copyfileobj(stream, spool, STREAMCHUNK)
+    length = spool.tell()
+    spool.seek(0)
+    return spool, length, True
+
+
+def scatterBytes(plane, mapping, data):
+    # Given a ChannelPlane, the permuted indices reserved for 'data' and the
+    # bytes themselves, writes their bits into the sample LSBs
+
+    bits = np.unpackbits(np.frombuffer(data, dtype=np.uint8))
+    idx = mappingToOffsets(mapping, plane.channels, plane.used)
+    plane.flat[idx] = (plane.flat[idx] >> 1 << 1) | bits
+
+
+@traced("encode stream")
+def encodeStream(
+    cover,
+    source,
+    key,
+    outputPath,
+    name=None,
+    chunkSize=STREAMCHUNK,
+    pngProfile=DEFAULTPROFILE,
+):
+    """
+    Hides a file payload inside a cover image, reading and encrypting it a
+    chunk at a time. Peak memory is O(cover + 32 x payload) bytes, for the
+    decoded cover and a 32-bit position per payload bit.
+
+    Params:
+        cover (str | bytes | ndarray | Image): The cover image.
+        source (str | file): A payload path, "-" for stdin, or a binary file
+            object.
+        key (str | SessionKey): The fingerprint used to encrypt and embed.
+        outputPath (str): Where the stego image is written, in the format its
+            extension selects.
+        name (str): The file name recorded for the payload. Defaults to the
+            payload's base name.
+        chunkSize (int): The number of payload bytes handled per step.
+        pngProfile (str): The PNG output profile: "fast", "balanced" or
+            "small".
+
+    Returns:
+        int: The number of payload bytes embedded.
+
+    Raises:
+        ValueError: If the payload exceeds the cover's capacity.
+    """
+
+    if name is None:
+        if isinstance(source, str) and source != STDIO:
+            name = os.path.basename(source)
+        else:
+            name = DEFAULTPAYLOADNAME
+
+    key = asSessionKey(key)
+    messageHead = buildMessage(b"", name)
+
+    stream, length, owned = openSource(source)
+    try:
+        payloadLength = IVSIZE + len(messageHead) + length
+        prefixLength = HASHHALF + CONTAINERHEADER.size
+        totalBits = (prefixLength + payloadLength) * BYTETOBIT
+
+        with stage("image decode"):
+            im = readImage(cover)
+            im.load()
+
+        # The whole cover and the positions of every payload bit stay in
+        # memory; only the payload itself is streamed
+        arr = np.array(im)
+        plane = channelPlane(arr)
+        encodeLimit = planeLimit(plane)
+        if totalBits > encodeLimit - RGBCHANNELS:
+            raise ValueError(
+                f"Payload needs {totalBits} bits but the cover holds {encodeLimit}"
+            )
+
+        mapping = generateSecureSample(key.fingerprint, encodeLimit, totalBits)
+
+        iv = urandom(IVSIZE)
+        encryptor = aesCipher(key.aesKey, iv).encryptor()
+        header = CONTAINERHEADER.pack(
+            CONTAINERMAGIC, CONTAINERVERSION, FLAGRAWPAYLOAD, payloadLength
+        )
+        prefix = key.hash[:HASHHALF].encode() + header + iv
+        first = encryptor.update(messageHead)
+
+        position = 0
+        for data in (prefix, first):
+            stop = position + len(data) * BYTETOBIT
+            scatterBytes(plane, mapping[position:stop], data)
+            position = stop
+
+        while True:
+            chunk = stream.read(chunkSize)
+            if not chunk:
+                break
+            data = encryptor.update(chunk)
+            stop = position + len(data) * BYTETOBIT
+            scatterBytes(plane, mapping[position:stop], data)
+            position = stop
+    finally:
+        if owned:
+            stream.close()
+
+    if position != totalBits:
+        raise ValueError("Payload changed size while it was being embedded")
+
+    stegoImage = Image.fromarray(arr)
+    stegoImage.info = dict(im.info)
+    with stage("image encode"):
+        writeImage(stegoImage, outputPath, pngProfile=pngProfile)
+    if isinstance(cover, str):
+        copyMetadata(cover, outputPath)
+
+    return length
+
+
+def splitMessageHead(buffer):
+    # Given the start of a decrypted message, returns (kind, name, head
+    # length) once the text header or the closing '$' of the file name has
+    # been seen, or None if more bytes are needed
+
+    textHead = (EXTHEADER + DEFAULTHEADER).encode()
+    if buffer.startswith(textHead):
+        return TEXTPAYLOAD, None, len(textHead)
+    if len(buffer) < len(textHead) and textHead.startswith(buffer):
+        return None
+
+    fileHead = (EXTHEADER + "$").encode()
+    end = buffer.find(b"$", len(fileHead))
+    if end == -1:
+        return None
+    return FILEPAYLOAD, buffer[len(fileHead) : end].decode(), end + 1
+
+
+@traced("decode stream")
+def decodeStream(stego, key, output, chunkSize=STREAMCHUNK):
+    """
+    Recovers a payload hidden in a stego image, gathering and decrypting it a
+    chunk at a time. Peak memory is O(cover + 32 x payload) bytes, for the
+    decoded image and a 32-bit position per payload bit.
+
+    Params:
+        stego (str | bytes | ndarray | Image): The stego image.
+        key (str | SessionKey): The fingerprint used when encoding.
+        output (str | file): A path, "-" for stdout, or a binary file object
+            the payload is written to.
+        chunkSize (int): The number of payload bytes handled per step.
+
+    Returns:
+        StreamedPayload: The kind, name and length of the payload written, or
+        None if nothing is embedded under this key.
+
+    Raises:
+        ValueError: If the image holds one shard of a split payload.
+    """
+
+    key = asSessionKey(key)
+    located = readContainerHeader(loadChannels(readImage(stego)), key.fingerprint)
+    if located is None:
+        return None
+
+    header, prefixBits, plane = located
+    if header is None or not header[1] & FLAGRAWPAYLOAD:
+        # Base64 containers from older versions are small, decode them whole
+        payload = decode(stego, key)
+        if payload is None:
+            return None
+        writeOutput(output, [payload.data])
+        return StreamedPayload(payload.kind, payload.name, len(payload.data))
+
+    version, flags, length = header
+    if flags & FLAGSHARD:
+        raise ValueError("Image holds one shard of a split payload")
+
+    lsbCount = flagsLSBCount(flags)
+    encodeLimit = planeLimit(plane)
+    totalBits = prefixBits + length * BYTETOBIT
+    positions = positionsFor(totalBits, lsbCount)
+    if positions > encodeLimit - RGBCHANNELS or length < IVSIZE:
+        return None
+
+    mapping = generateSecureSample(key.fingerprint, encodeLimit, positions)
+    ivStop = prefixBits + IVSIZE * BYTETOBIT
+    iv = readLSBRange(plane, mapping, prefixBits, ivStop, lsbCount)
+    decryptor = aesCipher(key.aesKey, iv).decryptor()
+
+    codec = (flags & CODECMASK) >> CODECSHIFT
+    decompressor = None if codec == CODECNONE else payloadDecompressor(codec)
+
+    def decryptedChunks():
+        for start in range(ivStop, totalBits, chunkSize * BYTETOBIT):
+            stop = min(start + chunkSize * BYTETOBIT, totalBits)
+            data = readLSBRange(plane, mapping, start, stop, lsbCount)
+            chunk = decryptor.update(data)
+            yield chunk if decompressor is None else decompressor.decompress(chunk)
+
+        if decompressor is not None and not decompressor.eof:
+            raise ValueError("Compressed payload is truncated")
+
+    chunks = decryptedChunks()
+    buffer = b""
+    head = None
+    for chunk in chunks:
+        buffer += chunk
+        head = splitMessageHead(buffer)
+        if head is not None:
+            break
+
+    if head is None:
+        kind, name, data = parseMessage(buffer)
+        writeOutput(output, [data])
+        return StreamedPayload(kind, name, len(data))
+
+    kind, name, headLength = head
+    written = writeOutput(output, [buffer[headLength:]], chunks)
+    return StreamedPayload(kind, name, written)
+
+
+def writeOutput(output, *parts):
+    # Given a path, "-" or a binary file object and iterables of byte chunks,
+    # writes every chunk in order and returns the number of bytes written
+
+    if isinstance(output, str) and output != STDIO:
+        with open(output, "wb") as f:
+            return writeOutput(f, *parts)
+
+    stream = sys.stdout.buffer if output == STDIO else output
+    written = 0
+    for part in parts:
+        for chunk in part:
+            stream.write(chunk)
+            written += len(chunk)
+    stream.flush()
+    return written
+
+
+def parseArguments(argv):
+    # Given command line arguments, returns the parsed streaming options
+
+    parser = argparse.ArgumentParser(
+        prog="python -m scripts.streaming",
+        description="Encode or decode large payloads a chunk at a time.",
+    )
+    modes = parser.add_subparsers(dest="mode", required=True)
+
+    encodeParser = modes.add_parser("encode", help="hide a file in a cover image")
+    encodeParser.add_argument("--cover", required=True, help="cover image")
+    encodeParser.add_argument(
+        "--payload", required=True, help='payload file, or "-" for stdin'
+    )
+    encodeParser.add_argument("--name", help="file name recorded for the payload")
+    encodeParser.add_argument("--key", required=True, help="fingerprint")
+    encodeParser.add_argument("--output", required=True, help="stego image path")
+    encodeParser.add_argument(
+        "--png-profile",
+        default=DEFAULTPROFILE,
+        choices=PNGPROFILES,
+        help="PNG output profile",
+    )
+
+    decodeParser = modes.add_parser("decode", help="recover a hidden payload")
+    decodeParser.add_argument("--stego", required=True, help="stego image")
+    decodeParser.add_argument("--key", required=True, help="fingerprint")
+    decodeParser.add_argument(
+        "--output", required=True, help='payload path, or "-" for stdout'
+    )
+
+    for modeParser in (encodeParser, decodeParser):
+        modeParser.add_argument(
+            "--chunk",
+            type=int,
+            default=STREAMCHUNK,
+            help="payload bytes handled per step",
+        )
+
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    # Runs a streamed encode or decode from the command line
+
+    args = parseArguments(argv)
+
+    if args.mode == "encode":
+        length = encodeStream(
+            args.cover,
+            args.payload,
+            args.key,
+            args.output,
+            args.name,
+            args.chunk,
+            args.png_profile,
+        )
+        print(f"Embedded {length} bytes into {args.output}", file=sys.stderr)
+        return 0
+
+    result = decodeStream(args.stego, args.key, args.output, args.chunk)
+    if result is None:
+        print("No information could be found", file=sys.stderr)
+        return 1
+
+    print(f"Recovered {result.length} bytes ({result.kind})", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
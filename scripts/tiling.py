@@ -0,0 +1,243 @@
+# COMP6841 - Steganography Project Tiling File
+#
+# Encodes and decodes PNG covers in horizontal strips under a fixed memory
+# budget. Permuted bit positions are sorted once and routed to the strip
+# that owns them; on encode, each strip's scatter and compression run on a
+# thread pool. Pixel memory depends on the budget and the image width, not
+# the image height. Position and bit arrays still grow with the payload.
+
+import functools
+
+import numpy as np
+
+from .helpers import (
+    BYTETOBIT,
+    MAXLSB,
+    PREFIXBITS,
+    RGBCHANNELS,
+    SessionKey,
+    asSessionKey,
+    bitsToSymbols,
+    flagsLSBCount,
+    generateSecureSample,
+    mappingToOffsets,
+    matchContainerPrefix,
+    openContainer,
+    positionsFor,
+    preserveMetadata,
+    symbolsToBits,
+)
+from .instrumentation import traced
+from .pngStreams import DEFAULTPROFILE, PNGStripWriter, iterPNGStrips, readPNGInfo
+from .stegoEngine import buildMessage, encodeBits, parseMessage
+
+DEFAULTMEMORYBUDGET = 256 << 20
+DEFAULTWORKERS = 4
+
+# Copies of a strip alive at once: decompressed scanlines, decoded pixels,
+# filtered scanlines and compressed output
+STRIPBUFFERS = 4
+
+
+def stripRowsFor(info, memoryBudget, workers):
+    # Given a PNG's info, a budget in bytes and a worker count, returns how
+    # many rows each strip may hold so every in-flight strip fits the budget
+
+    rowBytes = info.width * info.channels + 1
+    return max(1, memoryBudget // (rowBytes * STRIPBUFFERS * (workers + 1)))
+
+
+def routeOffsets(mapping, channels, used=RGBCHANNELS):
+    # Given permuted channel indices, returns their flat offsets in ascending
+    # order and the permutation that sorted them
+
+    offsets = mappingToOffsets(mapping, channels, used)
+    order = np.argsort(offsets, kind="stable")
+    return offsets[order], order
+
+
+def gatherTiled(path, info, mapping, stripRows, lsbMask=1, used=RGBCHANNELS):
+    # Given a PNG path and permuted channel indices, reads the image strip by
+    # strip and returns the low bits selected by lsbMask at every index, in
+    # mapping order. 'used' is the samples per pixel that carry bits
+
+    offsets, order = routeOffsets(mapping, info.channels, used)
+    bits = np.empty(len(offsets), dtype=np.uint8)
+    rowLength = info.width * info.channels
+
+    for firstRow, strip in iterPNGStrips(path, stripRows):
+        base = firstRow * rowLength
+        lo, hi = np.searchsorted(offsets, [base, base + strip.size])
+        if lo < hi:
+            bits[order[lo:hi]] = strip.reshape(-1)[offsets[lo:hi] - base] & lsbMask
+
+    return bits
+
+
+def readContainerTiled(path, key, memoryBudget=DEFAULTMEMORYBUDGET):
+    """
+    Reads a container from a PNG in strips, mirroring helpers.readContainer.
+
+    Params:
+        path (str): The stego PNG.
+        key (str | SessionKey): The fingerprint used when encoding.
+        memoryBudget (int): Bytes available for pixel strips.
+
+    Returns:
+        tuple: (flags, payload bytes), or None if nothing is embedded under
+        this key.
+
+    Raises:
+        ValueError: For images embedded before the container header existed,
+            which need a full-capacity scan.
+    """
+
+    fingerprint = key.fingerprint if isinstance(key, SessionKey) else key
+
+    info = readPNGInfo(path)
+    stripRows = stripRowsFor(info, memoryBudget, 0)
+
+    # Gather every bit a prefix could use once per layout, without and then
+    # with alpha, and try each LSB depth on it
+    for used in sorted({RGBCHANNELS, info.channels}):
+        encodeLimit = info.width * info.height * used
+        mapping = generateSecureSample(
+            fingerprint, encodeLimit, PREFIXBITS, memoryBudget
+        )
+        lowBits = gatherTiled(path, info, mapping, stripRows, (1 << MAXLSB) - 1, used)
+
+        def readPrefix(lsbCount):
+            symbols = lowBits[: positionsFor(PREFIXBITS, lsbCount)]
+            bits = symbolsToBits(symbols & ((1 << lsbCount) - 1), lsbCount)
+            return np.packbits(bits[:PREFIXBITS]).tobytes()
+
+        header = matchContainerPrefix(fingerprint, readPrefix, used != RGBCHANNELS)
+        if header is not False:
+            break
+    else:
+        return None
+    if header is None:
+        raise ValueError("Images without a container header need a full decode")
+
+    version, flags, length = header
+    lsbCount = flagsLSBCount(flags)
+    totalBits = PREFIXBITS + length * BYTETOBIT
+    positions = positionsFor(totalBits, lsbCount)
+    if positions > encodeLimit - RGBCHANNELS:
+        return None
+
+    mapping = generateSecureSample(fingerprint, encodeLimit, positions, memoryBudget)
+    first = PREFIXBITS // lsbCount
+    skip = PREFIXBITS - first * lsbCount
+    symbols = gatherTiled(
+        path, info, mapping[first:], stripRows, (1 << lsbCount) - 1, used
+    )
+    bits = symbolsToBits(symbols, lsbCount)[skip : skip + length * BYTETOBIT]
+    return flags, np.packbits(bits).tobytes()
+
+
+@traced("decode tiled")
+def decodeTiled(path, key, memoryBudget=DEFAULTMEMORYBUDGET):
+    """
+    Recovers a payload from a PNG without loading the whole image.
+
+    Params:
+        path (str): The stego PNG.
+        key (str | SessionKey): The fingerprint used when encoding.
+        memoryBudget (int): Bytes available for pixel strips.
+
+    Returns:
+        Payload: The decoded payload, or None if nothing is embedded under
+        this key.
+    """
+
+    message = openContainer(readContainerTiled(path, key, memoryBudget), key)
+    if message is None:
+        return None
+    return parseMessage(message)
+
+
+def scatterStrip(offsets, symbols, keep, strip):
+    # Given strip-relative offsets and channel values, writes the values into
+    # the low bits of the strip that 'keep' clears and returns it
+
+    flat = strip.reshape(-1)
+    flat[offsets] = (flat[offsets] & keep) | symbols
+    return strip
+
+
+@traced("encode tiled")
+def encodeTiled(
+    coverPath,
+    payload,
+    key,
+    outputPath,
+    name=None,
+    memoryBudget=DEFAULTMEMORYBUDGET,
+    workers=DEFAULTWORKERS,
+    pngProfile=DEFAULTPROFILE,
+    lsbCount=1,
+):
+    """
+    Hides a payload in a PNG cover one strip at a time.
+
+    Params:
+        coverPath (str): The cover PNG (8-bit, non-interlaced RGB or RGBA).
+        payload (str | bytes | Payload): The information to hide.
+        key (str | SessionKey): The fingerprint used to encrypt and embed.
+        outputPath (str): Where the stego PNG is written.
+        name (str): The file name recorded for byte payloads.
+        memoryBudget (int): Bytes available for pixel strips.
+        workers (int): Strips embedded and compressed at once.
+        pngProfile (str): The PNG output profile: "fast", "balanced" or
+            "small".
+        lsbCount (int): Low bits written per channel, from 1 to 4.
+
+    Returns:
+        None
+
+    Raises:
+        ValueError: If the payload exceeds the cover's capacity or the PNG
+            layout cannot be streamed.
+    """
+
+    key = asSessionKey(key)
+    info = readPNGInfo(coverPath)
+    stripRows = stripRowsFor(info, memoryBudget, workers)
+    encodeLimit = info.width * info.height * RGBCHANNELS
+
+    bits = encodeBits(buildMessage(payload, name), key, lsbCount=lsbCount)
+    symbols = bitsToSymbols(bits, lsbCount)
+    if len(symbols) > encodeLimit - RGBCHANNELS:
+        raise ValueError(
+            f"Payload needs {len(bits)} bits but the cover holds "
+            f"{encodeLimit * lsbCount} at {lsbCount} bits per channel"
+        )
+
+    mapping = generateSecureSample(
+        key.fingerprint, encodeLimit, len(symbols), memoryBudget
+    )
+    offsets, order = routeOffsets(mapping, info.channels)
+    symbols = symbols[order]
+    keep = 0xFF ^ ((1 << lsbCount) - 1)
+    rowLength = info.width * info.channels
+
+    writer = PNGStripWriter(
+        outputPath,
+        info.width,
+        info.height,
+        info.channels,
+        info.ancillary,
+        pngProfile,
+        workers,
+    )
+    with writer:
+        for firstRow, strip in iterPNGStrips(coverPath, stripRows):
+            base = firstRow * rowLength
+            lo, hi = np.searchsorted(offsets, [base, base + strip.size])
+            transform = functools.partial(
+                scatterStrip, offsets[lo:hi] - base, symbols[lo:hi], keep
+            )
+            writer.write(strip, transform)
+
+    preserveMetadata(coverPath, outputPath)
@@ -0,0 +1,322 @@
+# COMP6841 - Steganography Project Updating File
+#
+# Replaces the payload of an existing stego image without re-encoding it
+# from scratch. The new container is laid over the same permuted positions
+# as the old one, and only samples whose low bits differ are written. The
+# positions a shorter payload no longer needs are given fresh random bits,
+# so the old tail cannot be recovered. Uncompressed BMP and TIFF files are
+# patched through a memory map; other formats are rewritten once.
+#
+# Usage:
+#   python -m scripts.updating --stego IMG --key K --payload FILE
+#   python -m scripts.updating --stego IMG --key K --text "new message" --output OUT
+
+import argparse
+import os
+import shutil
+import sys
+import time
+from collections import namedtuple
+from os import urandom
+
+import numpy as np
+from PIL import Image
+
+from .formats import copyMetadata, formatFor, readImage, writeImage
+from .helpers import (
+    BYTETOBIT,
+    FLAGALPHA,
+    FLAGSHARD,
+    IVSIZE,
+    PREFIXBITS,
+    RGBCHANNELS,
+    ChannelPlane,
+    asSessionKey,
+    bitsToSymbols,
+    channelPlane,
+    flagsLSBCount,
+    gatherSymbols,
+    generateSecureSample,
+    mappingToOffsets,
+    planeLimit,
+    positionsFor,
+    readContainerHeader,
+    readLSBRange,
+    usableChannels,
+)
+from .instrumentation import stage, traced
+from .mappedImages import MappedSamples, readLayout, supportsInPlace
+from .pngStreams import DEFAULTPROFILE, PNGPROFILES
+from .stegoEngine import buildMessage, encodeBits
+
+# The outcome of an update: the positions the old and new containers cover
+# together, the channel writes made, the writes avoided because a sample's
+# low bits already matched, and the positions freed by a shorter payload
+UpdateReport = namedtuple(
+    "UpdateReport",
+    ["positions", "channelWrites", "writesAvoided", "freedPositions", "seconds"],
+)
+
+
+def locateContainer(plane, key):
+    # Given a ChannelPlane and a SessionKey, returns the plane layout holding
+    # the key's container and its (version, flags, length) header, raising
+    # ValueError when there is no container this can update
+
+    located = readContainerHeader(plane, key.fingerprint)
+    if located is None:
+        raise ValueError("No information is embedded under this key")
+
+    header, _, layout = located
+    if header is None:
+        raise ValueError(
+            "Images embedded before the container header must be re-encoded"
+        )
+    if header[1] & FLAGSHARD:
+        raise ValueError("Shards of a split payload must be re-encoded together")
+    return layout, header
+
+
+def targetSymbols(bits, lsbCount, positions):
+    # Given the new container bits, the LSB depth and the positions to cover,
+    # returns the symbol for each position: the container's own, then random
+    # symbols for the positions it no longer needs
+
+    symbols = bitsToSymbols(bits, lsbCount)
+    spare = positions - len(symbols)
+    if spare <= 0:
+        return symbols
+
+    random = np.frombuffer(urandom(spare), dtype=np.uint8) & ((1 << lsbCount) - 1)
+    return np.concatenate((symbols, random))
+
+
+def planUpdate(plane, message, key, compress=True, reuseIV=False):
+    # Given a ChannelPlane holding a container, a new message and a
+    # SessionKey, returns the plane layout, the LSB depth, the sample offsets
+    # to write, their new low bits and the UpdateReport counts
+
+    layout, (_, flags, length) = locateContainer(plane, key)
+    lsbCount = flagsLSBCount(flags)
+    encodeLimit = planeLimit(layout)
+    oldPositions = positionsFor(PREFIXBITS + length * BYTETOBIT, lsbCount)
+
+    mapping = generateSecureSample(key.fingerprint, encodeLimit, oldPositions)
+    iv = None
+    if reuseIV:
+        ivBits = PREFIXBITS + IVSIZE * BYTETOBIT
+        iv = readLSBRange(layout, mapping, PREFIXBITS, ivBits, lsbCount)
+
+    useAlpha = bool(flags & FLAGALPHA)
+    bits = encodeBits(message, key, compress, lsbCount, useAlpha, iv)
+    newPositions = positionsFor(len(bits), lsbCount)
+    if newPositions > encodeLimit - RGBCHANNELS:
+        raise ValueError(
+            f"Payload needs {len(bits)} bits but the cover holds "
+            f"{encodeLimit * lsbCount} at {lsbCount} bits per channel"
+        )
+
+    # A permutation's first entries do not depend on how many are drawn, so
+    # a longer container only extends the old positions
+    positions = max(oldPositions, newPositions)
+    if positions > len(mapping):
+        mapping = generateSecureSample(key.fingerprint, encodeLimit, positions)
+
+    with stage("diff"):
+        current = gatherSymbols(layout, mapping, lsbCount)
+        target = targetSymbols(bits, lsbCount, positions)
+        changed = current != target
+
+        offsets = mappingToOffsets(mapping, layout.channels, layout.used)
+        writes = int(np.count_nonzero(changed))
+        counts = (
+            positions,
+            writes,
+            positions - writes,
+            max(0, oldPositions - newPositions),
+        )
+        return layout, lsbCount, offsets[changed], target[changed], counts
+
+
+def writeSymbols(flat, offsets, symbols, lsbCount):
+    # Given a sample array or memory map, sample offsets and their new low
+    # bits, writes them in one scatter
+
+    flat[offsets] = (flat[offsets] >> lsbCount << lsbCount) | symbols
+
+
+@traced("update")
+def updatePayload(
+    stego,
+    payload,
+    key,
+    name=None,
+    outputPath=None,
+    compress=True,
+    reuseIV=False,
+    pngProfile=DEFAULTPROFILE,
+):
+    """
+    Replaces the payload hidden in a stego image, writing only the samples
+    whose low bits change. The LSB depth and alpha use of the existing
+    container are kept.
+
+    Params:
+        stego (str | bytes | ndarray | Image): The stego image.
+        payload (str | bytes | Payload): The new information to hide.
+        key (str | SessionKey): The fingerprint the image was encoded with.
+        name (str): The file name recorded for byte payloads.
+        outputPath (str): Where the updated image is written. Defaults to
+            the stego image itself, which must then be a path.
+        compress (bool): Whether to try compressing the message first.
+        reuseIV (bool): Whether to encrypt with the existing container's IV,
+            so ciphertext before the first changed byte stays the same and
+            is not rewritten. With AES-CFB this reveals to anyone holding
+            both versions where they diverge and how the first differing
+            block changed, so it is off by default.
+        pngProfile (str): The PNG output profile, for images rewritten as PNG.
+
+    Returns:
+        UpdateReport: The positions covered, the channel writes made and
+        avoided, the positions freed and the seconds taken.
+
+    Raises:
+        ValueError: If nothing updatable is embedded under this key, the new
+            payload exceeds the cover's capacity, or there is nowhere to
+            write the result.
+    """
+
+    start = time.perf_counter()
+    key = asSessionKey(key)
+    message = buildMessage(payload, name)
+
+    if outputPath is None:
+        if not isinstance(stego, str):
+            raise ValueError("An output path is needed for in-memory images")
+        outputPath = stego
+
+    # Uncompressed BMP and TIFF files keeping their format are patched in place
+    if (
+        isinstance(stego, str)
+        and formatFor(outputPath) is formatFor(stego)
+        and supportsInPlace(stego)
+    ):
+        return updateInPlace(stego, message, key, outputPath, compress, reuseIV, start)
+
+    stat = os.stat(stego) if isinstance(stego, str) else None
+    with stage("image decode"):
+        im = readImage(stego)
+        pixels = np.array(im)
+
+    plane = channelPlane(pixels)
+    _, lsbCount, offsets, symbols, counts = planUpdate(
+        plane, message, key, compress, reuseIV
+    )
+    with stage("embed"):
+        writeSymbols(plane.flat, offsets, symbols, lsbCount)
+
+    stegoImage = Image.fromarray(pixels)
+    stegoImage.info = dict(im.info)
+    writeImage(stegoImage, outputPath, pngProfile=pngProfile)
+    restoreMetadata(stego, outputPath, stat)
+    return UpdateReport(*counts, time.perf_counter() - start)
+
+
+def updateInPlace(stego, message, key, outputPath, compress, reuseIV, start):
+    # Given an uncompressed BMP or TIFF path, writes only the changed bytes,
+    # into a copy at outputPath when it differs from the stego path. The
+    # update is planned from a read-only map before anything is copied
+
+    stat = os.stat(stego)
+    layout = readLayout(stego)
+    plane = ChannelPlane(
+        MappedSamples(stego, layout), layout.channels, usableChannels(layout.channels)
+    )
+    _, lsbCount, offsets, symbols, counts = planUpdate(
+        plane, message, key, compress, reuseIV
+    )
+
+    if os.path.abspath(outputPath) != os.path.abspath(stego):
+        shutil.copyfile(stego, outputPath)
+
+    with stage("embed"):
+        samples = MappedSamples(outputPath, layout, writable=True)
+        writeSymbols(samples.map, samples.fileOffsets(offsets), symbols, lsbCount)
+        samples.map.flush()
+
+    restoreMetadata(stego, outputPath, stat)
+    return UpdateReport(*counts, time.perf_counter() - start)
+
+
+def restoreMetadata(stego, outputPath, stat):
+    # Carries file metadata across to the output, restoring the original
+    # access and modification times when the stego file was overwritten
+
+    if stat is None:
+        return
+    if os.path.abspath(outputPath) != os.path.abspath(stego):
+        copyMetadata(stego, outputPath)
+    else:
+        os.utime(outputPath, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+
+
+def parseArguments(argv):
+    parser = argparse.ArgumentParser(
+        prog="python -m scripts.updating",
+        description="Replace a stego image's payload, rewriting only changed bits.",
+    )
+    parser.add_argument("--stego", required=True, help="stego image to update")
+    parser.add_argument("--key", required=True, help="fingerprint")
+    payload = parser.add_mutually_exclusive_group(required=True)
+    payload.add_argument("--payload", help="file to embed instead")
+    payload.add_argument("--text", help="text to embed instead")
+    parser.add_argument("--output", help="updated image path, defaults to --stego")
+    parser.add_argument(
+        "--reuse-iv",
+        action="store_true",
+        help="keep the existing IV so an unchanged message prefix is not rewritten",
+    )
+    parser.add_argument(
+        "--png-profile",
+        default=DEFAULTPROFILE,
+        choices=PNGPROFILES,
+        help="PNG output profile",
+    )
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    # Runs an update from the command line
+
+    args = parseArguments(argv)
+    if args.text is not None:
+        payload, name = args.text, None
+    else:
+        with open(args.payload, "rb") as f:
+            payload = f.read()
+        name = os.path.basename(args.payload)
+
+    try:
+        report = updatePayload(
+            args.stego,
+            payload,
+            args.key,
+            name,
+            args.output,
+            reuseIV=args.reuse_iv,
+            pngProfile=args.png_profile,
+        )
+    except ValueError as error:
+        print(error, file=sys.stderr)
+        return 1
+
+    print(
+        f"Wrote {report.channelWrites} of {report.positions} channels, "
+        f"avoiding {report.writesAvoided} writes",
+        file=sys.stderr,
+    )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
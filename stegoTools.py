@@ -6,7 +6,12 @@ import os
 from PIL import Image
 
 from scripts.displayScripts import *
+from scripts.formats import copyMetadata, formatFor, supportedExtensions, writeImage
 from scripts.helpers import *
+from scripts.heuristics import computeHeuristics
+from scripts.steganalysis import analyseImage
+from scripts.mappedImages import embedInPlace, supportsInPlace
+from scripts.stegoEngine import decode, embedEncodedBits, encodeBits
 
 ENCODE = "1"
 DECODE = "2"
@@ -40,8 +45,6 @@ INVALIDOPTION = 1
 NOINFORMATION = 2
 INVALIDMSG = 3
 
-print("★ Stego Tools ★\n")
-
 
 def mainMenu():
     """
@@ -119,17 +122,18 @@ def encodingSettings(filePath):
 
     printFileStats(filePath, fileName, fileSize, extension)
 
-    if extension != EXTPNG:
+    if formatFor(filePath) is None:
         print(
-            f"\nPlease use the .png format, the {extension} format is currently not supported"
+            f"\nPlease use one of the {', '.join(supportedExtensions())} formats, the {extension} format is currently not supported"
         )
         input("\nPress Enter to return to the encoding menu...")
         clearTerminal()
         print("★ Returning to encoding menu... ★\n")
         encodeMenu()
 
-    printImageStats(filePath)
-    printStegHeuristics(filePath)
+    printImageStats(filePath, coverLimit(Image.open(filePath)))
+    printStegHeuristics(computeHeuristics(filePath))
+    printSteganalysis(analyseImage(filePath))
 
     print("\n★ Do you want to embed data in this image? ★")
     confirmation = input('Enter "yes" or "no": ').lower()
@@ -210,19 +214,21 @@ def encodingInformation(filePath, hash, key):
     if encodingHeader == None:
         encodingInformation(filePath, hash, key)
 
-    encodedData = dataEncoder(encodingHeader, hash, key)
+    encodedData = encodeBits(encodingHeader, key)
     totalBits = len(encodedData)
 
     im = Image.open(filePath)
-    width, height = im.size
-    encodeLimit = width * height * RGBCHANNELS
-    if totalBits > encodeLimit:
-        encodingErrorDisplay()
-        encodingInformation(filePath, hash)
+    encodeLimit = coverLimit(im)
+    if totalBits > encodeLimit - RGBCHANNELS:
+        encodingErrorDisplay(totalBits, encodeLimit)
+        encodingInformation(filePath, hash, key)
 
     totalPixels = math.ceil(totalBits / 3)
 
     printEncodingSettings(totalBits, totalPixels, hash)
+    printCompressionReport(
+        len(encodingHeader), totalBits // BYTETOBIT - CONTAINEROVERHEAD
+    )
 
     print("\n★ Please Enter a Name for the Output File (default: output.png) ★")
     outputName = input("Output Name: ")
@@ -230,6 +236,18 @@ def encodingInformation(filePath, hash, key):
         scriptDir = os.path.dirname(os.path.abspath(__file__))
         outputName = scriptDir + r"\output.png"
 
+    outputFormat = formatFor(outputName)
+    if outputFormat is None:
+        print(
+            f"\n{outputName} is not in a supported lossless format, saving as {EXTPNG} instead"
+        )
+        outputName = os.path.splitext(outputName)[0] + EXTPNG
+    elif nativeMode(im) not in outputFormat.modes:
+        print(
+            f"\n{outputFormat.name} cannot store {nativeMode(im)} images exactly, saving as {EXTPNG} instead"
+        )
+        outputName = os.path.splitext(outputName)[0] + EXTPNG
+
     print("\n★ Would you like to proceed with encoding this message? ★")
     confirmation = input('Enter "yes" or "no": ').lower()
     if confirmation == DENY or confirmation == DENY2:
@@ -239,28 +257,25 @@ def encodingInformation(filePath, hash, key):
     elif confirmation != CONFIRM and confirmation != CONFIRM2:
         clearTerminal()
         printError(INVALIDOPTION)
-        encodingInformation(filePath, hash)
-
-    img = im.load()
-
-    mapping = generateSecureSample(key, encodeLimit, totalBits)
-
-    for i in range(totalBits):
-        currentPixel = math.ceil(mapping[i] / 3)
-        xCoords = currentPixel % width
-        yCoords = math.floor(currentPixel / width)
-        currentChannel = mapping[i] % 3
+        encodingInformation(filePath, hash, key)
 
-        pixel = list(img[xCoords, yCoords])
-        pixel[currentChannel] = (pixel[currentChannel] & ~1) | int(encodedData[i])
-        img[xCoords, yCoords] = tuple(pixel)
+    # Uncompressed BMP and TIFF copies only rewrite the bytes that change
+    if formatFor(outputName) is formatFor(filePath) and supportsInPlace(filePath):
+        inPlaceReport = embedInPlace(filePath, encodedData, key, outputName)
+        print(
+            f'\n★ Success — Information has been Successfully Embedded Into "{outputName}". ★'
+        )
+        printInPlaceReport(inPlaceReport)
+    else:
+        im = embedEncodedBits(im, encodedData, key)
 
-    im.save(outputName)
-    preserveMetadata(filePath, outputName)
+        outputReport = writeImage(im, outputName)
+        copyMetadata(filePath, outputName)
 
-    print(
-        f'\n★ Success — Information has been Successfully Embedded Into "{outputName}". ★'
-    )
+        print(
+            f'\n★ Success — Information has been Successfully Embedded Into "{outputName}". ★'
+        )
+        printOutputReport(outputReport)
 
     print('\n★ Press Enter to return to the menu, or type "quit" to exit. ★')
     menuSelection = input("Option Selected: ").lower()
@@ -328,45 +343,21 @@ def decodeInformationFootprint(filePath):
     clearTerminal()
     print(f'★ Decoding data using fingerprint, "{key}" ★')
 
-    hash = hashGenerator(key)
-    firstHalf = slice(HASHHALF)
-    lastHalf = slice(HASHHALF, HASHSIZE)
-    firstFingerprint = hash[firstHalf]
-    lastFingerprint = hash[lastHalf]
-
-    im = Image.open(filePath)
-    width, height = im.size
-    totalBits = width * height * RGBCHANNELS
-
-    lsbString = extractLSBBits(filePath, HASHHALF * BYTETOBIT, key)
-    asciiOutput = bitsToAscii(lsbString)
-
-    if firstFingerprint in asciiOutput:
-        lsbString = extractLSBBits(filePath, totalBits - RGBCHANNELS, key)
-        asciiOutput = bitsToAscii(lsbString)
-
-        if lastFingerprint in asciiOutput:
-            startIndex = asciiOutput.find(firstFingerprint)
-            endIndex = asciiOutput.find(lastFingerprint)
-
+    try:
+        payload = decode(filePath, key)
+    except ValueError as error:
+        # Images in unsupported or lossy formats cannot hold a payload
+        print(f"\n❗ Error - {error} ❗")
+    else:
+        if payload is not None:
             print(
                 f"\n★ Verification Successful — the Fingerprint '{key}' is Correct. \n"
             )
-
-            rawInformation = slice(startIndex + HASHHALF, endIndex)
-            asciiOutput = decryptText(key, asciiOutput[rawInformation])
-
-            if (EXTHEADER + TEXTHEADER) in asciiOutput:
-                printDecodedInformation(TEXTINPUT, asciiOutput)
-            else:
-                printDecodedInformation(FILEINPUT, asciiOutput)
+            printDecodedInformation(payload)
 
         else:
             printError(NOINFORMATION)
 
-    else:
-        printError(NOINFORMATION)
-
     print('\n★ Press Enter to return to the menu, or type "quit" to exit. ★')
     menuSelection = input("Option Selected: ").lower()
     if menuSelection == QUITAPP:
@@ -377,4 +368,6 @@ def decodeInformationFootprint(filePath):
     mainMenu()
 
 
-mainMenu()
+if __name__ == "__main__":
+    print("★ Stego Tools ★\n")
+    mainMenu()
@@ -0,0 +1,42 @@
+# COMP6841 - Steganography Project Test Fixtures File
+
+import numpy as np
+import pytest
+from PIL import Image
+
+
+@pytest.fixture
+def rng():
+    return np.random.default_rng(6841)
+
+
+@pytest.fixture
+def makeCover(tmp_path, rng):
+    # Returns a function writing a random cover of the given size, mode and
+    # extension, returning its path and pixels
+
+    def make(width, height, mode="RGB", extension=".png"):
+        bands = len(Image.new(mode, (1, 1)).getbands())
+        shape = (height, width, bands) if bands > 1 else (height, width)
+        pixels = rng.integers(0, 256, shape, dtype=np.uint8)
+        path = str(tmp_path / f"cover{width}x{height}{mode}{extension}")
+        Image.fromarray(pixels, mode).save(path)
+        return path, pixels
+
+    return make
+
+
+@pytest.fixture
+def assertLowBitsOnly():
+    # Returns a check that a stego image differs from its cover only in the
+    # lsbCount low bits of each sample, and differs somewhere
+
+    def check(cover, stego, lsbCount=1):
+        cover = np.asarray(cover)
+        stego = np.asarray(stego)
+        assert cover.shape == stego.shape
+        keep = 0xFF ^ ((1 << lsbCount) - 1)
+        assert np.array_equal(cover & keep, stego & keep)
+        assert not np.array_equal(cover, stego)
+
+    return check
@@ -0,0 +1,41 @@
+import json
+
+from PIL import Image
+
+from scripts.batchRunner import DECODEMODE, ENCODEMODE, runBatch
+
+SECRETKEY = "correct horse battery staple"
+
+
+def testBatchRoundTripsWithoutLoggingKeys(makeCover, tmp_path, assertLowBitsOnly):
+    covers = [makeCover(80, 60 + index) for index in range(3)]
+    payloadPath = tmp_path / "payload.bin"
+    payloadPath.write_bytes(b"batch payload")
+    logPath = str(tmp_path / "log.jsonl")
+
+    encodeJobs = [
+        {
+            "cover": coverPath,
+            "payload": str(payloadPath),
+            "key": SECRETKEY,
+            "output": str(tmp_path / f"stego{index}.png"),
+        }
+        for index, (coverPath, _) in enumerate(covers)
+    ]
+    decodeJobs = [
+        {"stego": job["output"], "key": SECRETKEY, "output": str(tmp_path / "out")}
+        for job in encodeJobs
+    ]
+
+    assert runBatch(ENCODEMODE, encodeJobs, 2, logPath)["succeeded"] == 3
+    assert runBatch(DECODEMODE, decodeJobs, 2, logPath)["succeeded"] == 3
+
+    for (_, pixels), job in zip(covers, encodeJobs):
+        assertLowBitsOnly(pixels, Image.open(job["output"]))
+    for path in (tmp_path / "out").iterdir():
+        assert path.read_bytes() == b"batch payload"
+
+    with open(logPath) as f:
+        log = f.read()
+    assert SECRETKEY not in log
+    assert all("key" not in json.loads(line)["job"] for line in log.splitlines())
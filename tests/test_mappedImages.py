@@ -0,0 +1,89 @@
+import os
+
+import numpy as np
+import pytest
+from PIL import Image
+
+from scripts.mappedImages import decodeInPlace, encodeInPlace, supportsInPlace
+from scripts.stegoEngine import decode, encode
+
+
+def changedOnlyLowBits(before, after, lsbCount):
+    # Given two files' bytes, returns whether every byte that differs does so
+    # only in its lsbCount low bits
+
+    before = np.frombuffer(before, dtype=np.uint8)
+    after = np.frombuffer(after, dtype=np.uint8)
+    return len(before) == len(after) and int((before ^ after).max()) < 1 << lsbCount
+
+
+@pytest.mark.parametrize(
+    "mode, extension, lsbCount",
+    [
+        ("RGB", ".bmp", 1),
+        ("RGB", ".bmp", 3),
+        ("L", ".bmp", 2),
+        ("RGB", ".tiff", 1),
+        ("RGBA", ".tiff", 2),
+        ("L", ".tiff", 4),
+    ],
+)
+def testInPlaceRoundTrips(
+    makeCover, tmp_path, assertLowBitsOnly, mode, extension, lsbCount
+):
+    # An odd width exercises BMP row padding
+    coverPath, pixels = makeCover(101, 60, mode, extension)
+    outputPath = str(tmp_path / f"stego{extension}")
+    payload = os.urandom(600)
+
+    report = encodeInPlace(
+        coverPath, payload, "key", outputPath, "a.bin", lsbCount=lsbCount
+    )
+    assert 0 < report.bytesWritten <= report.positions
+
+    with open(coverPath, "rb") as f, open(outputPath, "rb") as g:
+        assert changedOnlyLowBits(f.read(), g.read(), lsbCount)
+    assertLowBitsOnly(pixels, Image.open(outputPath), lsbCount)
+
+    assert decodeInPlace(outputPath, "key").data == payload
+    assert decode(outputPath, "key").data == payload
+    assert decodeInPlace(outputPath, "wrong") is None
+
+
+def testInPlaceModifiesTheCoverWithoutAnOutput(makeCover):
+    coverPath, pixels = makeCover(64, 48, "RGB", ".bmp")
+    encodeInPlace(coverPath, "in place", "key")
+
+    assert decodeInPlace(coverPath, "key").data == b"in place"
+    assert not np.array_equal(np.asarray(Image.open(coverPath)), pixels)
+
+
+def testInPlaceReadsEngineImages(makeCover, tmp_path):
+    _, pixels = makeCover(80, 50)
+    outputPath = str(tmp_path / "engine.bmp")
+    encode(pixels, b"engine", "key", name="e.bin", outputPath=outputPath)
+
+    assert decodeInPlace(outputPath, "key").data == b"engine"
+
+
+def testSixteenBitTIFFsChangeOnlyLowOrderBytes(tmp_path, rng):
+    coverPath = str(tmp_path / "cover16.tiff")
+    outputPath = str(tmp_path / "stego16.tiff")
+    pixels = rng.integers(0, 1 << 16, (40, 70), dtype=np.uint16)
+    Image.fromarray(pixels).save(coverPath)
+
+    encodeInPlace(coverPath, b"sixteen", "key", outputPath)
+
+    stego = np.asarray(Image.open(outputPath))
+    assert int((stego ^ pixels).max()) == 1
+    assert decodeInPlace(outputPath, "key").data == b"sixteen"
+
+
+def testCompressedImagesAreRejected(makeCover, tmp_path):
+    _, pixels = makeCover(40, 40)
+    path = str(tmp_path / "lzw.tiff")
+    Image.fromarray(pixels).save(path, compression="tiff_lzw")
+
+    assert not supportsInPlace(path)
+    with pytest.raises(ValueError):
+        encodeInPlace(path, "text", "key")
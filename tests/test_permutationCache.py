@@ -0,0 +1,94 @@
+import os
+import stat
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import numpy as np
+import pytest
+
+from scripts.helpers import generateSecureSample
+from scripts.permutationCache import (
+    CACHEEXT,
+    CACHESECRETNAME,
+    cacheSecret,
+    cacheSettings,
+    disablePermutationCache,
+    enablePermutationCache,
+    loadPermutation,
+    storePermutation,
+)
+
+
+@pytest.fixture
+def cacheDirectory(tmp_path):
+    directory = str(tmp_path / "cache")
+    enablePermutationCache(directory)
+    yield directory
+    disablePermutationCache()
+
+
+def testCachedPermutationsMatchGeneratedOnes(cacheDirectory):
+    first = np.array(generateSecureSample("key", 100000, 5000))
+    cached = generateSecureSample("key", 100000, 5000)
+    disablePermutationCache()
+
+    assert np.array_equal(first, cached)
+    assert np.array_equal(first, generateSecureSample("key", 100000, 5000))
+
+
+def testSecretIsPrivateAndKeptAcrossRuns(cacheDirectory):
+    path = os.path.join(cacheDirectory, CACHESECRETNAME)
+    secret = cacheSettings["secret"]
+
+    assert stat.S_IMODE(os.stat(path).st_mode) == 0o600
+    enablePermutationCache(cacheDirectory)
+    assert cacheSettings["secret"] == secret
+
+
+def testFileNamesDoNotDependOnKeyAlone(tmp_path):
+    names = []
+    for index in range(2):
+        enablePermutationCache(str(tmp_path / f"cache{index}"))
+        generateSecureSample("key", 100000, 100)
+        names.append(os.listdir(tmp_path / f"cache{index}"))
+    disablePermutationCache()
+
+    assert names[0] != names[1]
+
+
+def testThreadsCachingOnePermutation(cacheDirectory):
+    with ThreadPoolExecutor(8) as pool:
+        results = list(
+            pool.map(lambda _: generateSecureSample("key", 200000, 50000), range(16))
+        )
+
+    expected = np.array(results[0])
+    assert all(np.array_equal(result, expected) for result in results)
+    names = os.listdir(cacheDirectory)
+    assert sorted(name.endswith(CACHEEXT) for name in names) == [False, True]
+
+
+def testConcurrentStoresOfOnePermutation(cacheDirectory):
+    positions = np.arange(1 << 20, dtype=np.uint32)
+    barrier = threading.Barrier(8)
+
+    def store(_):
+        barrier.wait()
+        for _ in range(4):
+            storePermutation("key", 1 << 21, positions)
+
+    with ThreadPoolExecutor(8) as pool:
+        list(pool.map(store, range(8)))
+
+    assert np.array_equal(loadPermutation("key", 1 << 21, len(positions)), positions)
+    assert len(os.listdir(cacheDirectory)) == 2
+
+
+def testProcessesShareOneSecret(tmp_path):
+    directory = str(tmp_path / "shared")
+    os.makedirs(directory)
+    with ProcessPoolExecutor(4) as pool:
+        secrets = list(pool.map(cacheSecret, [directory] * 16))
+
+    assert len(set(secrets)) == 1
+    assert os.listdir(directory) == [CACHESECRETNAME]
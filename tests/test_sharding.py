@@ -0,0 +1,64 @@
+import io
+
+import pytest
+from PIL import Image
+
+from scripts.helpers import FLAGRAWPAYLOAD, FLAGSHARD, asSessionKey, encryptBytes
+from scripts.sharding import SHARDHEADER, ShardAssembler, decodeShards, encodeShards
+
+SETID = b"setid123"
+
+
+def shardContainer(key, index, total, chunk=b"chunk"):
+    # Returns a (flags, payload) container as readContainer would for a shard
+
+    payload = SHARDHEADER.pack(SETID, index, total) + encryptBytes(key.aesKey, chunk)
+    return FLAGRAWPAYLOAD | FLAGSHARD, payload
+
+
+def testShardsRoundTripInAnyOrder(makeCover, assertLowBitsOnly):
+    covers = [makeCover(100, 80 + 10 * index)[1] for index in range(3)]
+    payload = bytes(range(256)) * 20
+
+    stegos = encodeShards(covers, payload, "key", name="a.bin")
+    for cover, stego in zip(covers, stegos):
+        assertLowBitsOnly(cover, Image.open(io.BytesIO(stego)))
+
+    decoded = decodeShards(stegos[::-1] + stegos[:1], "key")
+    assert decoded.data == payload
+    assert decoded.name == "a.bin"
+
+
+def testMissingShardsAreReported(makeCover):
+    covers = [makeCover(100, 80)[1] for _ in range(3)]
+    stegos = encodeShards(covers, b"x" * 1500, "key")
+
+    with pytest.raises(ValueError, match="Missing shards"):
+        decodeShards(stegos[1:], "key")
+
+
+@pytest.mark.parametrize("index, total", [(5, 1), (0, 0), (1, 1)])
+def testInvalidShardHeadersAreRejected(index, total):
+    key = asSessionKey("key")
+    assembler = ShardAssembler(key)
+
+    with pytest.raises(ValueError, match="invalid"):
+        assembler.addContainer(shardContainer(key, index, total))
+    assert assembler.setId is None
+
+
+def testTruncatedShardsAreRejected():
+    assembler = ShardAssembler("key")
+    with pytest.raises(ValueError, match="too short"):
+        assembler.addContainer((FLAGRAWPAYLOAD | FLAGSHARD, b"short"))
+
+
+def testDuplicateShardIndices():
+    key = asSessionKey("key")
+    assembler = ShardAssembler(key)
+    assembler.addContainer(shardContainer(key, 0, 2, b"first"))
+    assembler.addContainer(shardContainer(key, 0, 2, b"first"))
+
+    with pytest.raises(ValueError, match="twice"):
+        assembler.addContainer(shardContainer(key, 0, 2, b"other"))
+    assert assembler.chunks[0] == b"first"
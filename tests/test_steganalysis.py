@@ -0,0 +1,49 @@
+import numpy as np
+import pytest
+
+from scripts.steganalysis import analyseImage, smallerRoot
+
+
+def smoothCover(rng):
+    # Returns a photo-like cover: smooth gradients with mild sensor noise, as
+    # the RS and sample pair estimators assume
+
+    y, x = np.mgrid[0:300, 0:400]
+    base = (np.sin(x / 23) * 60 + np.cos(y / 31) * 50 + 128)[..., None]
+    base = base + np.array([0, 20, -20])
+    return np.clip(base + rng.normal(0, 3, base.shape), 0, 255).astype(np.uint8)
+
+
+def embedRandomBits(cover, rate, rng):
+    # Returns the cover with a 'rate' fraction of samples given random LSBs
+
+    stego = cover.copy()
+    chosen = rng.random(stego.shape) < rate
+    stego[chosen] = (stego[chosen] & 0xFE) | rng.integers(
+        0, 2, int(chosen.sum()), dtype=np.uint8
+    )
+    return stego
+
+
+@pytest.mark.parametrize("rate", [0, 0.25, 0.5, 1])
+def testRateEstimatesTrackTheEmbeddingRate(rng, rate):
+    report = analyseImage(embedRandomBits(smoothCover(rng), rate, rng))
+
+    assert report.megapixels == pytest.approx(0.12)
+    for channel in report.channels:
+        assert abs(channel.rsRate - rate) < 0.15
+        assert abs(channel.spaRate - rate) < 0.15
+    assert report.rate == max(channel.rate for channel in report.channels)
+
+
+def testChiSquareFlagsFullEmbedding(rng):
+    report = analyseImage(embedRandomBits(smoothCover(rng), 1, rng))
+    assert all(channel.chiSquare > 0.9 for channel in report.channels)
+
+
+def testSmallerRoot():
+    assert smallerRoot(1, -3, 2) == pytest.approx(1)
+    assert smallerRoot(0, 2, -1) == pytest.approx(0.5)
+    assert smallerRoot(0, 0, 1) is None
+    # A slightly negative discriminant falls back to the vertex
+    assert smallerRoot(1, -2, 1.0001) == pytest.approx(1)
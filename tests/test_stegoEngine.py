@@ -0,0 +1,76 @@
+import io
+
+import numpy as np
+import pytest
+from PIL import Image
+
+from scripts.formats import getFormat
+from scripts.stegoEngine import FILEPAYLOAD, TEXTPAYLOAD, decode, encode
+
+
+def randomImage(rng, mode, size=(60, 50)):
+    # Returns a random image of the given mode and (width, height)
+
+    width, height = size
+    if mode == "I;16":
+        return Image.fromarray(rng.integers(0, 1 << 16, (height, width), np.uint16))
+    bands = len(Image.new(mode, (1, 1)).getbands())
+    shape = (height, width, bands) if bands > 1 else (height, width)
+    return Image.fromarray(rng.integers(0, 256, shape, dtype=np.uint8), mode)
+
+
+@pytest.mark.parametrize("lsbCount", [1, 2, 3, 4])
+@pytest.mark.parametrize("mode", ["RGB", "RGBA", "L", "LA", "I;16"])
+def testRoundTripsChangeOnlyLowBits(rng, assertLowBitsOnly, mode, lsbCount):
+    cover = randomImage(rng, mode)
+    payload = rng.integers(0, 256, 200, dtype=np.uint8).tobytes()
+
+    stego = Image.open(
+        io.BytesIO(encode(cover, payload, "key", name="p.bin", lsbCount=lsbCount))
+    )
+    assert stego.mode == cover.mode
+    assertLowBitsOnly(cover, stego, lsbCount)
+
+    decoded = decode(stego, "key")
+    assert decoded == (FILEPAYLOAD, "p.bin", payload)
+    assert decode(stego, "wrong") is None
+
+
+@pytest.mark.parametrize("mode", ["RGBA", "LA"])
+def testAlphaIsOnlyWrittenWhenAsked(rng, assertLowBitsOnly, mode):
+    cover = randomImage(rng, mode)
+    alpha = np.asarray(cover)[..., -1]
+
+    stego = Image.open(io.BytesIO(encode(cover, "text " * 40, "key")))
+    assert np.array_equal(np.asarray(stego)[..., -1], alpha)
+
+    stego = Image.open(io.BytesIO(encode(cover, "text " * 40, "key", useAlpha=True)))
+    assertLowBitsOnly(cover, stego)
+    assert decode(stego, "key") == (TEXTPAYLOAD, None, ("text " * 40).encode())
+
+
+@pytest.mark.parametrize("name", ["png", "bmp", "tiff", "tiff-lzw", "webp"])
+def testEveryFormatRoundTrips(rng, assertLowBitsOnly, name):
+    cover = randomImage(rng, "RGB")
+    stego = encode(cover, b"formats", "key", outputFormat=name)
+
+    assert Image.open(io.BytesIO(stego)).format == getFormat(name).pillowFormat
+    assertLowBitsOnly(cover, Image.open(io.BytesIO(stego)))
+    assert decode(stego, "key").data == b"formats"
+
+
+def testCompressiblePayloadsFitSmallCovers(rng):
+    cover = randomImage(rng, "RGB", (20, 20))
+    payload = b"a" * 5000
+
+    with pytest.raises(ValueError):
+        encode(cover, payload, "key", compress=False)
+    assert decode(encode(cover, payload, "key"), "key").data == payload
+
+
+def testLossyImagesAreRefused(rng):
+    buffer = io.BytesIO()
+    randomImage(rng, "RGB").save(buffer, "JPEG")
+
+    with pytest.raises(ValueError):
+        decode(buffer.getvalue(), "key")
@@ -0,0 +1,95 @@
+import asyncio
+import io
+from urllib.parse import quote
+
+import numpy as np
+from PIL import Image
+
+from scripts.stegoEngine import encode
+from scripts.stegoService import MAXHEADER, StegoService
+
+EVILNAME = "x.bin\r\nSet-Cookie: pwned=1"
+
+
+def pngBytes(pixels):
+    buffer = io.BytesIO()
+    Image.fromarray(pixels).save(buffer, "PNG")
+    return buffer.getvalue()
+
+
+async def post(port, target, body, headers):
+    # Sends one POST and returns the status, the raw header block and the body
+
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    lines = [f"POST {target} HTTP/1.1", f"Content-Length: {len(body)}"]
+    lines += [f"{name}: {value}" for name, value in headers.items()]
+    lines.append("Connection: close")
+    writer.write(("\r\n".join(lines) + "\r\n\r\n").encode() + body)
+    await writer.drain()
+
+    response = await reader.read()
+    writer.close()
+    head, _, content = response.partition(b"\r\n\r\n")
+    return int(head.split()[1]), head.decode("latin-1"), content
+
+
+def runService(scenario):
+    # Runs scenario(port) against a one-worker service on a free port
+
+    async def main():
+        service = StegoService(workers=1)
+        await service.start()
+        server = await asyncio.start_server(
+            service.handleConnection, "127.0.0.1", 0, limit=MAXHEADER
+        )
+        try:
+            async with server:
+                return await scenario(server.sockets[0].getsockname()[1])
+        finally:
+            await service.stop()
+
+    return asyncio.run(main())
+
+
+def testDecodedNamesCannotInjectHeaders(rng):
+    pixels = rng.integers(0, 256, (64, 64, 3), dtype=np.uint8)
+    stego = encode(pixels, b"payload", "key", name=EVILNAME)
+
+    status, head, content = runService(
+        lambda port: post(port, "/decode", stego, {"X-Stego-Key": "key"})
+    )
+
+    assert status == 200 and content == b"payload"
+    assert "\r\nSet-Cookie" not in head
+    assert f"X-Payload-Name: {quote(EVILNAME, safe='')}" in head.split("\r\n")
+
+
+def testEncodeRejectsNamesWithControlCharacters(rng):
+    cover = pngBytes(rng.integers(0, 256, (64, 64, 3), dtype=np.uint8))
+    headers = {"X-Stego-Key": "key", "X-Cover-Length": str(len(cover))}
+    target = f"/encode?name={quote(EVILNAME, safe='')}"
+
+    status, _, _ = runService(lambda port: post(port, target, cover + b"data", headers))
+    assert status == 400
+
+
+def testEncodeThenDecodeRoundTrips(rng, assertLowBitsOnly):
+    pixels = rng.integers(0, 256, (64, 64, 3), dtype=np.uint8)
+    cover = pngBytes(pixels)
+    headers = {"X-Stego-Key": "key", "X-Cover-Length": str(len(cover))}
+
+    async def scenario(port):
+        status, _, stego = await post(
+            port, "/encode?name=a%20b.bin", cover + b"data", headers
+        )
+        assert status == 200
+        found = await post(port, "/decode", stego, {"X-Stego-Key": "key"})
+        missing = await post(port, "/decode", stego, {"X-Stego-Key": "wrong"})
+        return stego, found, missing
+
+    stego, (status, head, content), missing = runService(scenario)
+    assert status == 200 and content == b"data"
+    assert "X-Payload-Name: a%20b.bin" in head.split("\r\n")
+    assert missing[0] == 404
+
+    assertLowBitsOnly(pixels, Image.open(io.BytesIO(stego)))
@@ -0,0 +1,61 @@
+import io
+import os
+
+import pytest
+from PIL import Image
+
+from scripts.stegoEngine import FILEPAYLOAD, decode, encode
+from scripts.streaming import decodeStream, encodeStream
+
+
+@pytest.mark.parametrize(
+    "mode, extension", [("RGB", ".png"), ("RGBA", ".png"), ("RGB", ".tiff")]
+)
+def testStreamRoundTripsAcrossChunks(
+    makeCover, tmp_path, assertLowBitsOnly, mode, extension
+):
+    coverPath, pixels = makeCover(200, 150, mode)
+    payloadPath = tmp_path / "payload.bin"
+    payload = os.urandom(9000)
+    payloadPath.write_bytes(payload)
+    outputPath = str(tmp_path / f"stego{extension}")
+
+    written = encodeStream(
+        coverPath, str(payloadPath), "key", outputPath, chunkSize=1000
+    )
+    assert written == len(payload)
+    assertLowBitsOnly(pixels, Image.open(outputPath))
+
+    output = io.BytesIO()
+    result = decodeStream(outputPath, "key", output, chunkSize=777)
+    assert output.getvalue() == payload
+    assert result == (FILEPAYLOAD, "payload.bin", len(payload))
+    assert decode(outputPath, "key").data == payload
+
+
+def testStreamReadsFileObjects(makeCover, tmp_path):
+    coverPath, _ = makeCover(120, 100)
+    outputPath = str(tmp_path / "stego.png")
+    encodeStream(coverPath, io.BytesIO(b"from a stream"), "key", outputPath, "s.bin")
+
+    output = io.BytesIO()
+    assert decodeStream(outputPath, "key", output).name == "s.bin"
+    assert output.getvalue() == b"from a stream"
+
+
+def testStreamDecodesEngineImages(makeCover):
+    _, pixels = makeCover(120, 100)
+    stego = encode(pixels, b"abc" * 1000, "key", name="e.bin", lsbCount=2)
+
+    output = io.BytesIO()
+    assert decodeStream(stego, "key", output).name == "e.bin"
+    assert output.getvalue() == b"abc" * 1000
+    assert decodeStream(stego, "wrong", io.BytesIO()) is None
+
+
+def testStreamRejectsOversizedPayloads(makeCover, tmp_path):
+    coverPath, _ = makeCover(20, 20)
+    with pytest.raises(ValueError):
+        encodeStream(
+            coverPath, io.BytesIO(bytes(1000)), "key", str(tmp_path / "out.png")
+        )
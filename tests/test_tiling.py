@@ -0,0 +1,66 @@
+import os
+import zlib
+
+import numpy as np
+from PIL import Image
+
+from scripts.pngStreams import adler32Combine, iterPNGStrips
+from scripts.tiling import decodeTiled, encodeTiled
+
+MEGABYTE = 1 << 20
+
+
+def testTiledEncodeChangesOnlyLowBits(makeCover, tmp_path, assertLowBitsOnly):
+    coverPath, pixels = makeCover(600, 500)
+    outputPath = str(tmp_path / "stego.png")
+    payload = os.urandom(20000)
+
+    encodeTiled(
+        coverPath, payload, "key", outputPath, "a.bin", memoryBudget=MEGABYTE, workers=4
+    )
+
+    assertLowBitsOnly(pixels, Image.open(outputPath))
+    decoded = decodeTiled(outputPath, "key", memoryBudget=MEGABYTE)
+    assert decoded.data == payload
+    assert decoded.name == "a.bin"
+
+
+def testTiledEncodeAtSeveralLSBDepths(makeCover, tmp_path, assertLowBitsOnly):
+    coverPath, pixels = makeCover(300, 200, "RGBA")
+    for lsbCount in (2, 4):
+        outputPath = str(tmp_path / f"stego{lsbCount}.png")
+        encodeTiled(
+            coverPath,
+            "hello " * 500,
+            "key",
+            outputPath,
+            memoryBudget=MEGABYTE,
+            lsbCount=lsbCount,
+        )
+
+        assertLowBitsOnly(pixels, Image.open(outputPath), lsbCount)
+        assert decodeTiled(outputPath, "key").data == b"hello " * 500
+
+
+def testStripsMatchTheWholeImage(makeCover):
+    coverPath, pixels = makeCover(123, 77)
+    strips = [strip for _, strip in iterPNGStrips(coverPath, 5)]
+    assert np.array_equal(np.concatenate(strips), pixels)
+
+
+def testModifiedStripsDoNotAffectLaterStrips(makeCover):
+    coverPath, pixels = makeCover(64, 40)
+    rows = []
+    for _, strip in iterPNGStrips(coverPath, 3):
+        rows.append(strip.copy())
+        strip[:] = 0
+    assert np.array_equal(np.concatenate(rows), pixels)
+
+
+def testAdler32Combine(rng):
+    first = rng.integers(0, 256, 70000, dtype=np.uint8).tobytes()
+    for second in (b"", b"x", rng.integers(0, 256, 200000, dtype=np.uint8).tobytes()):
+        combined = adler32Combine(
+            zlib.adler32(first), zlib.adler32(second), len(second)
+        )
+        assert combined == zlib.adler32(first + second)
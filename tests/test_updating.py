@@ -0,0 +1,67 @@
+import os
+import shutil
+
+import numpy as np
+import pytest
+from PIL import Image
+
+from scripts.mappedImages import encodeInPlace
+from scripts.stegoEngine import decode, encode
+from scripts.updating import updatePayload
+
+
+@pytest.mark.parametrize("extension", [".png", ".bmp"])
+@pytest.mark.parametrize("size", [800, 3000, 6000])
+def testUpdatesChangeOnlyLowBits(
+    makeCover, tmp_path, assertLowBitsOnly, extension, size
+):
+    coverPath, pixels = makeCover(160, 120, "RGB", extension)
+    stegoPath = str(tmp_path / f"stego{extension}")
+    encode(coverPath, os.urandom(3000), "key", name="old.bin", outputPath=stegoPath)
+    before = np.asarray(Image.open(stegoPath))
+
+    payload = os.urandom(size)
+    report = updatePayload(stegoPath, payload, "key", "new.bin")
+
+    assert decode(stegoPath, "key").data == payload
+    assert report.channelWrites + report.writesAvoided == report.positions
+    assert report.channelWrites == np.count_nonzero(
+        np.asarray(Image.open(stegoPath)) != before
+    )
+    assertLowBitsOnly(pixels, Image.open(stegoPath))
+
+
+def testUpdatesWithReusedIVRewriteOnlyTheChangedTail(makeCover, tmp_path):
+    coverPath, _ = makeCover(160, 120, "RGB", ".bmp")
+    stegoPath = str(tmp_path / "stego.bmp")
+    message = os.urandom(4000)
+    encodeInPlace(coverPath, message, "key", stegoPath, "a.bin", compress=False)
+
+    changed = message[:-10] + bytes(10)
+    report = updatePayload(
+        stegoPath, changed, "key", "a.bin", compress=False, reuseIV=True
+    )
+
+    assert decode(stegoPath, "key").data == changed
+    assert report.channelWrites <= 10 * 8
+
+
+def testUpdatesToANewPathLeaveTheStegoImageAlone(makeCover, tmp_path):
+    coverPath, _ = makeCover(100, 80, "RGB", ".bmp")
+    stegoPath = str(tmp_path / "stego.bmp")
+    encode(coverPath, b"old", "key", outputPath=stegoPath)
+    original = str(tmp_path / "original.bmp")
+    shutil.copyfile(stegoPath, original)
+
+    outputPath = str(tmp_path / "updated.bmp")
+    updatePayload(stegoPath, b"new", "key", outputPath=outputPath)
+
+    assert decode(outputPath, "key").data == b"new"
+    with open(stegoPath, "rb") as f, open(original, "rb") as g:
+        assert f.read() == g.read()
+
+
+def testUpdatesNeedAnExistingContainer(makeCover):
+    coverPath, _ = makeCover(100, 80)
+    with pytest.raises(ValueError):
+        updatePayload(coverPath, b"new", "key")